@@ -0,0 +1,49 @@
+"""track_stats summary table
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # На пустой базе таблицы создает приложение (metadata.create_all)
+    if not inspector.has_table("tracks") or inspector.has_table("track_stats"):
+        return
+
+    op.create_table(
+        "track_stats",
+        sa.Column("track_id", sa.Integer(), sa.ForeignKey("tracks.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("points_count", sa.Integer(), nullable=False),
+        sa.Column("distance", sa.Float(), nullable=False),
+        sa.Column("duration", sa.Float(), nullable=False),
+        sa.Column("start_time", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("end_time", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("min_latitude", sa.Float(), nullable=True),
+        sa.Column("max_latitude", sa.Float(), nullable=True),
+        sa.Column("min_longitude", sa.Float(), nullable=True),
+        sa.Column("max_longitude", sa.Float(), nullable=True),
+        sa.Column("min_altitude", sa.Float(), nullable=True),
+        sa.Column("max_altitude", sa.Float(), nullable=True),
+        sa.Column("max_speed", sa.Float(), nullable=True),
+        sa.Column("last_latitude", sa.Float(), nullable=True),
+        sa.Column("last_longitude", sa.Float(), nullable=True),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    # Заполнение для существующих треков: python -m app.track_stats
+
+
+def downgrade() -> None:
+    op.drop_table("track_stats")
@@ -0,0 +1,60 @@
+"""track_points.geohash cell column
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app import geohash
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # На пустой базе таблицы создает приложение (metadata.create_all)
+    if not inspector.has_table("track_points"):
+        return
+    if "geohash" in {column["name"] for column in inspector.get_columns("track_points")}:
+        return
+
+    op.add_column("track_points", sa.Column("geohash", sa.String(12), nullable=True))
+
+    # Заполнение для существующих точек пачками по id
+    points = sa.table(
+        "track_points",
+        sa.column("id", sa.Integer),
+        sa.column("latitude", sa.Float),
+        sa.column("longitude", sa.Float),
+        sa.column("geohash", sa.String),
+    )
+    update = points.update().where(points.c.id == sa.bindparam("point_id")).values(geohash=sa.bindparam("cell"))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(points.c.id, points.c.latitude, points.c.longitude)
+            .where(points.c.id > last_id).order_by(points.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        cells = geohash.encode_many([row.latitude for row in rows], [row.longitude for row in rows])
+        bind.execute(update, [{"point_id": row.id, "cell": cell} for row, cell in zip(rows, cells)])
+        last_id = rows[-1].id
+
+    op.create_index("ix_track_points_geohash_track_id", "track_points", ["geohash", "track_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_track_points_geohash_track_id", table_name="track_points")
+    op.drop_column("track_points", "geohash")
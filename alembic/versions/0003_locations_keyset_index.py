@@ -0,0 +1,39 @@
+"""locations (user_id, timestamp, id) index
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # На пустой базе таблицы создает приложение (metadata.create_all)
+    if not inspector.has_table("locations"):
+        return
+    if op.get_bind().dialect.name == "sqlite":
+        # server_default CURRENT_TIMESTAMP хранил время как 'YYYY-MM-DD HH:MM:SS', а
+        # SQLAlchemy пишет и сравнивает '... HH:MM:SS.ffffff'. SQLite сравнивает строки,
+        # поэтому курсор не отсекал бы запись, на которой он выдан
+        op.execute(
+            "UPDATE locations SET timestamp = timestamp || '.000000' "
+            "WHERE length(timestamp) = 19"
+        )
+    if "ix_locations_user_id_timestamp_id" in {index["name"] for index in inspector.get_indexes("locations")}:
+        return
+
+    op.create_index("ix_locations_user_id_timestamp_id", "locations", ["user_id", "timestamp", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_locations_user_id_timestamp_id", table_name="locations")
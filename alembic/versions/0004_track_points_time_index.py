@@ -0,0 +1,31 @@
+"""track_points (track_id, timestamp) index
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # На пустой базе таблицы создает приложение (metadata.create_all)
+    if not inspector.has_table("track_points"):
+        return
+    if "ix_track_points_track_id_timestamp" in {index["name"] for index in inspector.get_indexes("track_points")}:
+        return
+
+    op.create_index("ix_track_points_track_id_timestamp", "track_points", ["track_id", "timestamp"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_track_points_track_id_timestamp", table_name="track_points")
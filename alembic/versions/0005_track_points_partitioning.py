@@ -0,0 +1,36 @@
+"""monthly partitioning of track_points (PostgreSQL, optional)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app import partitions
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # Только при TRACK_POINTS_PARTITIONING=true и на PostgreSQL; на пустой базе
+    # таблицы создает приложение и там же переводит track_points (partitions.setup)
+    if not settings.track_points_partitioning or not partitions.supported(bind):
+        return
+    if not sa.inspect(bind).has_table("track_points"):
+        return
+    partitions.convert(bind)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if partitions.supported(bind):
+        partitions.revert(bind)
@@ -0,0 +1,42 @@
+"""upload_sessions for resumable chunked uploads
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # На пустой базе таблицы создает приложение (metadata.create_all)
+    if not inspector.has_table("tracks") or inspector.has_table("upload_sessions"):
+        return
+
+    op.create_table(
+        "upload_sessions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("upload_id", sa.String(64), nullable=False),
+        sa.Column("track_id", sa.Integer(), sa.ForeignKey("tracks.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("last_seq", sa.Integer(), nullable=False),
+        sa.Column("points_count", sa.Integer(), nullable=False),
+        sa.Column("completed", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.UniqueConstraint("user_id", "upload_id", name="uq_upload_sessions_user_id_upload_id"),
+    )
+    op.create_index("ix_upload_sessions_id", "upload_sessions", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("upload_sessions")
@@ -0,0 +1,70 @@
+"""daily/weekly activity rollups and track_stats.last_timestamp
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def _counters():
+    return [
+        sa.Column("distance", sa.Float(), nullable=False),
+        sa.Column("moving_time", sa.Float(), nullable=False),
+        sa.Column("points_count", sa.Integer(), nullable=False),
+    ]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # На пустой базе таблицы создает приложение (metadata.create_all)
+    if not inspector.has_table("tracks"):
+        return
+
+    if inspector.has_table("track_stats") and "last_timestamp" not in {
+        column["name"] for column in inspector.get_columns("track_stats")
+    }:
+        op.add_column("track_stats", sa.Column("last_timestamp", sa.DateTime(timezone=True), nullable=True))
+
+    if not inspector.has_table("track_daily_stats"):
+        op.create_table(
+            "track_daily_stats",
+            sa.Column("track_id", sa.Integer(), sa.ForeignKey("tracks.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("day", sa.Date(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            *_counters(),
+        )
+        op.create_index("ix_track_daily_stats_user_id_day", "track_daily_stats", ["user_id", "day"])
+    if not inspector.has_table("user_daily_stats"):
+        op.create_table(
+            "user_daily_stats",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+            sa.Column("day", sa.Date(), primary_key=True),
+            *_counters(),
+            sa.Column("tracks_count", sa.Integer(), nullable=False),
+        )
+    if not inspector.has_table("user_weekly_stats"):
+        op.create_table(
+            "user_weekly_stats",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+            sa.Column("week", sa.Date(), primary_key=True),
+            *_counters(),
+            sa.Column("tracks_count", sa.Integer(), nullable=False),
+        )
+    # Заполнение по существующим точкам: python -m app.rollups
+
+
+def downgrade() -> None:
+    op.drop_table("user_weekly_stats")
+    op.drop_table("user_daily_stats")
+    op.drop_table("track_daily_stats")
+    op.drop_column("track_stats", "last_timestamp")
@@ -0,0 +1,59 @@
+"""ingest-time GPS noise filter settings and dropped point counters
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 23:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # На пустой базе таблицы создает приложение (metadata.create_all)
+    if not inspector.has_table("tracks"):
+        return
+
+    if inspector.has_table("track_stats"):
+        columns = {column["name"] for column in inspector.get_columns("track_stats")}
+        for name in ("dropped_stationary", "dropped_outliers"):
+            if name not in columns:
+                op.add_column("track_stats", sa.Column(name, sa.Integer(), nullable=False, server_default="0"))
+
+    if not inspector.has_table("point_filters"):
+        op.create_table(
+            "point_filters",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("track_id", sa.Integer(), sa.ForeignKey("tracks.id", ondelete="CASCADE"), nullable=True),
+            sa.Column("enabled", sa.Boolean(), nullable=True),
+            sa.Column("min_distance", sa.Float(), nullable=True),
+            sa.Column("max_speed", sa.Float(), nullable=True),
+            sa.Column("smoothing", sa.Boolean(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint("user_id", "track_id", name="uq_point_filters_user_id_track_id"),
+        )
+        op.create_index("ix_point_filters_id", "point_filters", ["id"])
+    indexes = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("point_filters")}
+    if "uq_point_filters_user_id_default" not in indexes:
+        # Одна строка пользователя (track_id NULL): NULL различны для UniqueConstraint
+        op.create_index(
+            "uq_point_filters_user_id_default", "point_filters", ["user_id"], unique=True,
+            sqlite_where=sa.text("track_id IS NULL"), postgresql_where=sa.text("track_id IS NULL")
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("uq_point_filters_user_id_default", table_name="point_filters")
+    op.drop_index("ix_point_filters_id", table_name="point_filters")
+    op.drop_table("point_filters")
+    op.drop_column("track_stats", "dropped_outliers")
+    op.drop_column("track_stats", "dropped_stationary")
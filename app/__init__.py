@@ -1,7 +1,9 @@
 # Location Tracker FastAPI Application
-
-from .main import app
-from . import models, schemas, crud, auth, database, config, maps
+#
+# Модули загружаются при первом обращении (from app import app, app.crud ...):
+# импорт app.main создает таблицы, а служебные команды (python -m app.rollups,
+# app.track_stats, app.partitions) не должны запускать его заранее.
+import importlib
 
 __all__ = [
     "app",
@@ -11,5 +13,15 @@ __all__ = [
     "auth",
     "database", 
     "config",
-    "maps"
-] 
\ No newline at end of file
+    "maps",
+    "metrics",
+    "crud_async"
+]
+
+
+def __getattr__(name):
+    if name == "app":
+        return importlib.import_module(".main", __name__).app
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
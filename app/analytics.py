@@ -0,0 +1,149 @@
+"""Аналитика трека: время в движении, набор высоты, профиль скорости, сплиты.
+
+Все показатели считаются одним проходом NumPy по колонкам точек
+(latitude, longitude, timestamp, altitude, speed) в порядке crud.POINT_ORDER.
+
+- Скорость сегмента - скорость, переданная устройством в конечной точке
+  сегмента, а если ее нет - расстояние / время.
+- Сегмент считается движением, если его скорость не ниже
+  analytics_moving_speed и пауза между точками не длиннее analytics_max_gap
+  (разрыв записи - остановка).
+- Набор и сброс высоты учитываются с гистерезисом analytics_elevation_hysteresis:
+  колебания высоты GPS меньше порога не накапливаются.
+- Сплиты - через каждые analytics_split_distance метров, время границы
+  интерполируется по накопленному расстоянию; последний сплит может быть неполным.
+
+Результат кэшируется по (track_id, версия статистики) - добавление точек
+меняет версию, и аналитика пересчитывается.
+"""
+import math
+from typing import Sequence
+
+import numpy as np
+
+from app import schemas
+from app.cache import LRUCache
+from app.config import settings
+from app.metrics import haversine_array, to_epoch_seconds
+
+PERCENTILES = (50, 90, 95)
+
+# (track_id, version) -> schemas.TrackAnalytics
+cache = LRUCache(settings.analytics_cache_size)
+
+
+def _float(value) -> float:
+    return 0.0 if value is None or math.isnan(value) else float(value)
+
+
+def _optional(value):
+    return None if value is None or math.isnan(value) else float(value)
+
+
+def elevation_change(altitudes: np.ndarray, hysteresis: float) -> tuple:
+    """Набор и сброс высоты (метры); изменения меньше hysteresis не учитываются"""
+    values = altitudes[~np.isnan(altitudes)]
+    if len(values) < 2:
+        return 0.0, 0.0
+    if hysteresis <= 0:
+        deltas = np.diff(values)
+        return float(deltas[deltas > 0].sum()), float(-deltas[deltas < 0].sum())
+    gain = loss = 0.0
+    reference = values[0]
+    for altitude in values[1:].tolist():
+        if altitude - reference >= hysteresis:
+            gain += altitude - reference
+            reference = altitude
+        elif reference - altitude >= hysteresis:
+            loss += reference - altitude
+            reference = altitude
+    return gain, loss
+
+
+def splits(cumulative: np.ndarray, seconds: np.ndarray, split_distance: float) -> list:
+    """Сплиты по расстоянию: длина, время, темп (с/км) и скорость каждого"""
+    total = float(cumulative[-1]) if len(cumulative) else 0.0
+    if total <= 0 or split_distance <= 0:
+        return []
+    bounds = np.arange(0.0, total, split_distance)
+    bounds = np.append(bounds, total)
+    # np.interp требует неубывающую абсциссу - накопленное расстояние такое и есть
+    times = np.interp(bounds, cumulative, seconds)
+    distances = np.diff(bounds)
+    durations = np.diff(times)
+    result = []
+    for index, (distance, duration) in enumerate(zip(distances.tolist(), durations.tolist())):
+        result.append(schemas.TrackSplit(
+            index=index + 1,
+            distance=distance,
+            duration=duration,
+            pace=duration / distance * 1000 if distance > 0 else None,
+            speed=distance / duration if duration > 0 else None
+        ))
+    return result
+
+
+def compute(
+    track_id: int,
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    timestamps: Sequence,
+    altitudes: Sequence,
+    speeds: Sequence
+) -> schemas.TrackAnalytics:
+    count = len(latitudes)
+    if count == 0:
+        return schemas.TrackAnalytics(track_id=track_id, points_count=0)
+
+    seconds = np.fromiter((to_epoch_seconds(ts) for ts in timestamps), dtype=np.float64, count=count)
+    altitude = np.array(altitudes, dtype=np.float64)  # None -> NaN
+    reported_speed = np.array(speeds, dtype=np.float64)
+
+    distances = haversine_array(latitudes, longitudes)
+    cumulative = np.concatenate(([0.0], np.cumsum(distances)))
+    durations = np.diff(seconds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        computed_speed = np.where(durations > 0, distances / durations, np.nan)
+    segment_speed = np.where(np.isnan(reported_speed[1:]), computed_speed, reported_speed[1:])
+
+    moving = (
+        (durations > 0)
+        & (durations <= settings.analytics_max_gap)
+        & (segment_speed >= settings.analytics_moving_speed)
+    )
+    duration = _float(seconds[-1] - seconds[0])
+    moving_time = float(durations[moving].sum())
+    moving_distance = float(distances[moving].sum())
+    distance = float(cumulative[-1])
+    moving_speeds = segment_speed[moving]
+    gain, loss = elevation_change(altitude, settings.analytics_elevation_hysteresis)
+
+    return schemas.TrackAnalytics(
+        track_id=track_id,
+        points_count=count,
+        distance=distance,
+        duration=duration,
+        moving_time=moving_time,
+        stopped_time=max(duration - moving_time, 0.0),
+        moving_distance=moving_distance,
+        avg_speed=distance / duration if duration > 0 else None,
+        avg_moving_speed=moving_distance / moving_time if moving_time > 0 else None,
+        max_speed=float(moving_speeds.max()) if len(moving_speeds) else None,
+        speed_percentiles={
+            f"p{p}": float(value)
+            for p, value in zip(PERCENTILES, np.percentile(moving_speeds, PERCENTILES))
+        } if len(moving_speeds) else {},
+        elevation_gain=gain,
+        elevation_loss=loss,
+        min_altitude=_optional(np.nanmin(altitude)) if not np.isnan(altitude).all() else None,
+        max_altitude=_optional(np.nanmax(altitude)) if not np.isnan(altitude).all() else None,
+        splits=splits(cumulative, seconds, settings.analytics_split_distance),
+    )
+
+
+def compute_rows(track_id: int, rows: Sequence[tuple]) -> schemas.TrackAnalytics:
+    """Аналитика по строкам (latitude, longitude, timestamp, altitude, speed)"""
+    if not rows:
+        return compute(track_id, [], [], [], [], [])
+    latitudes, longitudes, timestamps, altitudes, speeds = zip(*rows)
+    return compute(track_id, latitudes, longitudes, timestamps, altitudes, speeds)
@@ -1,10 +1,13 @@
 # API routes package
 
-from . import auth, locations, tracks, maps
+from . import auth, locations, tracks, maps, async_locations, async_tracks, live
 
 __all__ = [
     "auth",
     "locations", 
     "tracks",
-    "maps"
+    "maps",
+    "async_locations",
+    "async_tracks",
+    "live"
 ] 
\ No newline at end of file
@@ -0,0 +1,107 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app import crud_async, live, pagination, schemas, models
+from app.auth import get_current_active_user
+from app.principals import Principal
+from app.database import get_async_db
+
+# Асинхронный вариант app.api.locations (settings.async_database)
+router = APIRouter()
+
+
+@router.get("/", response_model=List[schemas.Location])
+async def get_locations(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor предыдущей страницы"),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Получение списка местоположений пользователя (от новых к старым)"""
+    try:
+        locations = await crud_async.get_locations(db, user_id=current_user.id, skip=skip, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    next_cursor = pagination.next_cursor(locations, limit)
+    if next_cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return locations
+
+
+@router.get("/current", response_model=schemas.Location)
+async def get_current_location(
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Получение текущего местоположения пользователя"""
+    location = await crud_async.get_current_location(db, user_id=current_user.id)
+    if not location:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No location data found"
+        )
+    return location
+
+
+@router.post("/", response_model=schemas.Location)
+async def create_location(
+    location: schemas.LocationCreate,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Создание нового местоположения"""
+    created = await crud_async.create_location(db=db, location=location, user_id=current_user.id)
+    live.publish_location(current_user.id, created)
+    return created
+
+
+@router.put("/current", response_model=schemas.Location)
+async def update_current_location(
+    location: schemas.LocationCreate,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Обновление текущего местоположения"""
+    updated = await crud_async.update_location(db=db, user_id=current_user.id, location=location)
+    live.publish_location(current_user.id, updated)
+    return updated
+
+
+@router.get("/{location_id}", response_model=schemas.Location)
+async def get_location(
+    location_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Получение конкретного местоположения"""
+    location = await crud_async.get_location(db, location_id=location_id, user_id=current_user.id)
+    if not location:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Location not found"
+        )
+    return location
+
+
+@router.delete("/{location_id}", status_code=204)
+async def delete_current_location(
+    location_id: int,
+    user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Удаление местоположения"""
+    result = await db.execute(
+        select(models.Location).where(models.Location.id == location_id, models.Location.user_id == user.id)
+    )
+    location = result.scalars().first()
+    if not location:
+        raise HTTPException(status_code=404, detail="Location not found")
+    await crud_async.delete_location(db, location)
+    return
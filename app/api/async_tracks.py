@@ -0,0 +1,179 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from app import crud_async, live, schemas, models, uploads, write_behind
+from app.config import settings
+from app.auth import get_current_active_user
+from app.principals import Principal
+from app.database import get_async_db
+from app.schemas import TrackChunkUpload
+
+# Асинхронные варианты самых нагруженных эндпоинтов app.api.tracks
+# (списки треков и прием точек с устройств). Подключается перед
+# синхронным роутером, остальные эндпоинты обслуживает он.
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.get("/", response_model=List[schemas.Track])
+async def get_tracks(
+    skip: int = 0,
+    limit: int = 100,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Получение списка треков пользователя"""
+    return await crud_async.get_tracks(db, user_id=current_user.id, skip=skip, limit=limit)
+
+
+@router.get("/recent", response_model=List[schemas.TrackRecent])
+async def get_recent_tracks(
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Получение списка последних треков пользователя"""
+    tracks = await crud_async.get_tracks(db, user_id=current_user.id, skip=0, limit=3)
+    result = []
+    for track in tracks:
+        stats = await crud_async.get_track_summary(db, track)
+        result.append(
+            schemas.TrackRecent(
+                id=track.id,
+                name=track.name,
+                description=track.description,
+                created_at=track.created_at,
+                distance=stats.distance,
+                duration=stats.duration
+            )
+        )
+    return result
+
+
+@router.post("/{track_id}/points", response_model=schemas.TrackPoint)
+async def add_track_point(
+    track_id: int,
+    point: schemas.TrackPointCreate,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Добавление точки к треку"""
+    track = await crud_async.get_track(db, track_id=track_id, user_id=current_user.id)
+    if not track:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Track not found"
+        )
+    
+    if settings.write_behind:
+        # Пока точка ждет пачку, запрос не держит соединение
+        await db.close()
+        track_point = await write_behind.submit(track_id, point)
+    else:
+        track_point = await crud_async.create_track_point(db=db, track_point=point, track_id=track_id)
+    live.publish_points(current_user.id, track_id, [track_point])
+    return track_point
+
+
+@router.post("/{track_id}/points/bulk", response_model=dict)
+async def add_track_points_bulk(
+    track_id: int,
+    points: List[schemas.TrackPointCreate],
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Массовое добавление точек к треку"""
+    track = await crud_async.get_track(db, track_id=track_id, user_id=current_user.id)
+    if not track:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Track not found"
+        )
+    
+    if not points:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No points provided"
+        )
+    
+    if len(points) > 1000:  # Ограничение на количество точек за раз
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot add more than 1000 points at once"
+        )
+    
+    try:
+        rows = await crud_async.insert_points(db, track_id, points)
+        await db.commit()
+        live.publish_points(current_user.id, track_id, rows)
+        points_added = len(rows)
+        
+        return {
+            "message": f"Successfully added {points_added} points to track {track_id}",
+            "track_id": track_id,
+            "points_added": points_added,
+            "points_dropped": len(points) - points_added
+        }
+        
+    except Exception as e:
+        await db.rollback()
+        logger.exception(f"Ошибка добавления точек к треку {track_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to add points to track"
+        )
+
+
+@router.post("/load_from_tracker", response_model=dict)
+async def load_from_tracker(
+    chunk: TrackChunkUpload,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Загрузка трека чанками с устройства (ESP/трекер).
+    Первый чанк создает трек, остальные добавляют точки.
+    С upload_id и seq загрузку можно возобновить после обрыва (см. app.uploads).
+    """
+    if chunk.upload_id is not None:
+        if chunk.seq is None:
+            raise HTTPException(status_code=400, detail="seq required with upload_id")
+        try:
+            result, upload, inserted = await crud_async.apply_upload_chunk(db, current_user.id, chunk)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except uploads.SequenceConflict as e:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=str(e),
+                headers={uploads.EXPECTED_SEQ_HEADER: str(e.expected_seq)}
+            )
+        live.publish_points(current_user.id, upload.track_id, inserted)
+        return uploads.chunk_response(chunk, result, upload, len(inserted), len(chunk.points))
+    if chunk.is_first_chunk:
+        if not chunk.name or not chunk.points:
+            raise HTTPException(status_code=400, detail="Name and points required for first chunk")
+        track = await crud_async.create_track(db=db, track=schemas.TrackCreate(name=chunk.name, description=chunk.description), user_id=current_user.id)
+        track_id = track.id
+    else:
+        if not chunk.track_id:
+            raise HTTPException(status_code=400, detail="track_id required for non-first chunk")
+        track_id = chunk.track_id
+        track = await crud_async.get_track(db, track_id=track_id, user_id=current_user.id)
+        if not track:
+            raise HTTPException(status_code=404, detail="Track not found")
+    # Добавляем точки
+    inserted = []
+    if chunk.points:
+        inserted = await crud_async.insert_points(db, track_id, chunk.points)
+        await db.commit()
+        live.publish_points(current_user.id, track_id, inserted)
+    return {
+        "track_id": track_id,
+        "status": "ok",
+        "is_last_chunk": chunk.is_last_chunk,
+        "points_added": len(inserted),
+        "points_dropped": len(chunk.points) - len(inserted)
+    }
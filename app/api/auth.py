@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 
 from app import crud, schemas
 from app.auth import create_access_token, get_current_active_user
+from app.principals import Principal
 from app.database import get_db
 from app.config import settings
 
@@ -83,6 +84,9 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 
 
 @router.get("/me", response_model=schemas.User)
-def read_users_me(current_user = Depends(get_current_active_user)):
+def read_users_me(current_user: Principal = Depends(get_current_active_user), db: Session = Depends(get_db)):
     """Получение информации о текущем пользователе"""
-    return current_user 
\ No newline at end of file
+    user = crud.get_user(db, user_id=current_user.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user 
\ No newline at end of file
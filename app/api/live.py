@@ -0,0 +1,101 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+
+from app import live
+from app.auth import authenticate_token
+from app.config import settings
+
+# Браузерные WebSocket и EventSource не умеют передавать заголовок
+# Authorization, поэтому токен принимается и параметром token
+router = APIRouter()
+
+
+def _token(request_headers, token: Optional[str]) -> Optional[str]:
+    authorization = request_headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return token
+
+
+def _topic(user_id: int, track_id: Optional[int]):
+    return live.track_topic(user_id, track_id) if track_id is not None else live.user_topic(user_id)
+
+
+@router.websocket("/ws")
+async def live_websocket(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    track_id: Optional[int] = Query(None, description="Только точки этого трека")
+):
+    """Новые точки и местоположения пользователя через WebSocket (JSON сообщения)"""
+    try:
+        principal = await authenticate_token(_token(websocket.headers, token) or "")
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Подписка до accept: события после установления соединения не теряются
+    subscription = live.broker.subscribe(_topic(principal.id, track_id))
+    await websocket.accept()
+    # Отключение клиента замечается сразу, а не при следующей отправке
+    tasks = {
+        asyncio.ensure_future(_send_events(websocket, subscription)),
+        asyncio.ensure_future(_wait_disconnect(websocket)),
+    }
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        live.broker.unsubscribe(subscription)
+
+
+async def _send_events(websocket: WebSocket, subscription: live.Subscription) -> None:
+    try:
+        while True:
+            event = await subscription.get(timeout=settings.live_heartbeat)
+            await websocket.send_json(event if event is not None else {"type": "ping"})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
+async def _wait_disconnect(websocket: WebSocket) -> None:
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+
+@router.get("/events")
+async def live_events(
+    request: Request,
+    token: Optional[str] = Query(None),
+    track_id: Optional[int] = Query(None, description="Только точки этого трека")
+):
+    """Новые точки и местоположения пользователя через Server-Sent Events"""
+    principal = await authenticate_token(_token(request.headers, token) or "")
+    subscription = live.broker.subscribe(_topic(principal.id, track_id))
+
+    async def events():
+        try:
+            # Клиенту - интервал переподключения
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=settings.live_heartbeat)
+                if event is None:
+                    yield ": ping\n\n"
+                else:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+        finally:
+            live.broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
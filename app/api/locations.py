@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from app import crud, schemas, models
+from app import crud, live, pagination, schemas, models
 from app.auth import get_current_active_user
+from app.principals import Principal
 from app.database import get_db
 
 router = APIRouter()
@@ -11,19 +12,30 @@ router = APIRouter()
 
 @router.get("/", response_model=List[schemas.Location])
 def get_locations(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
-    current_user: models.User = Depends(get_current_active_user),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Курсор из заголовка X-Next-Cursor предыдущей страницы"),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Получение списка местоположений пользователя"""
-    locations = crud.get_locations(db, user_id=current_user.id, skip=skip, limit=limit)
+    """Получение списка местоположений пользователя (от новых к старым)"""
+    try:
+        locations = crud.get_locations(db, user_id=current_user.id, skip=skip, limit=limit, cursor=cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    next_cursor = pagination.next_cursor(locations, limit)
+    if next_cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
     return locations
 
 
 @router.get("/current", response_model=schemas.Location)
 def get_current_location(
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение текущего местоположения пользователя"""
@@ -39,33 +51,35 @@ def get_current_location(
 @router.post("/", response_model=schemas.Location)
 def create_location(
     location: schemas.LocationCreate,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Создание нового местоположения"""
-    return crud.create_location(db=db, location=location, user_id=current_user.id)
+    created = crud.create_location(db=db, location=location, user_id=current_user.id)
+    live.publish_location(current_user.id, created)
+    return created
 
 
 @router.put("/current", response_model=schemas.Location)
 def update_current_location(
     location: schemas.LocationCreate,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Обновление текущего местоположения"""
-    return crud.update_location(db=db, user_id=current_user.id, location=location)
+    updated = crud.update_location(db=db, user_id=current_user.id, location=location)
+    live.publish_location(current_user.id, updated)
+    return updated
 
 
 @router.get("/{location_id}", response_model=schemas.Location)
 def get_location(
     location_id: int,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение конкретного местоположения"""
-    # Здесь можно добавить проверку, что местоположение принадлежит пользователю
-    location = crud.get_locations(db, user_id=current_user.id)
-    location = next((loc for loc in location if loc.id == location_id), None)
+    location = crud.get_location(db, location_id=location_id, user_id=current_user.id)
     if not location:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -76,13 +90,12 @@ def get_location(
 @router.delete("/{location_id}", status_code=204)
 def delete_current_location(
     location_id: int,
-    user: models.User = Depends(get_current_active_user),
+    user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Удаление местоположения"""
     location = db.query(models.Location).filter(models.Location.id == location_id, models.Location.user_id == user.id).first()
     if not location:
         raise HTTPException(status_code=404, detail="Location not found")
-    db.delete(location)
-    db.commit()
+    crud.delete_location(db, location)
     return
\ No newline at end of file
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
+from typing import Optional
 
-from app import crud, schemas, models, maps
+from app import crud, schemas, models, maps, map_cache, tiles
 from app.auth import get_current_active_user
+from app.principals import Principal
+from app.config import settings
 from app.database import get_db
 
 router = APIRouter()
@@ -11,7 +16,7 @@ router = APIRouter()
 
 @router.get("/current-location", response_class=HTMLResponse)
 def get_current_location_map(
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение карты с текущим местоположением"""
@@ -29,7 +34,11 @@ def get_current_location_map(
 @router.get("/track/{track_id}", response_class=HTMLResponse)
 def get_track_map(
     track_id: int,
-    current_user: models.User = Depends(get_current_active_user),
+    request: Request,
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Упростить трек для уровня зума карты"),
+    tolerance_m: Optional[float] = Query(None, gt=0, description="Допуск упрощения в метрах"),
+    algorithm: str = Query("rdp", pattern="^(rdp|visvalingam)$"),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение карты с треком"""
@@ -40,35 +49,87 @@ def get_track_map(
             detail="Track not found"
         )
     
-    track_points = crud.get_track_points(db, track_id=track_id, user_id=current_user.id)
-    map_html = maps.create_track_map(track, track_points)
-    return HTMLResponse(content=map_html)
+    # Готовая карта кэшируется до добавления в трек новых точек
+    stats = track.stats
+    if stats is None:
+        track_points = crud.get_simplified_track_points(
+            db, track, zoom=zoom, tolerance_m=tolerance_m, algorithm=algorithm
+        )
+        return HTMLResponse(content=maps.create_track_map(track, track_points, zoom=zoom))
+    
+    key = map_cache.track_key(track, stats.version, zoom, tolerance_m, algorithm)
+    headers = {
+        "ETag": map_cache.etag(key),
+        "Last-Modified": format_datetime(_as_utc(stats.updated_at or track.created_at), usegmt=True),
+        "Cache-Control": "private, no-cache"
+    }
+    if _not_modified(request, headers["ETag"], stats.updated_at or track.created_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    map_html = map_cache.get(key)
+    if map_html is None:
+        # Трек упрощается, только если задан zoom или tolerance_m
+        track_points = crud.get_simplified_track_points(
+            db, track, zoom=zoom, tolerance_m=tolerance_m, algorithm=algorithm
+        )
+        map_html = maps.create_track_map(track, track_points, zoom=zoom)
+        map_cache.put(key, map_html)
+    return HTMLResponse(content=map_html, headers=headers)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite возвращает наивное время в UTC
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Проверка условных заголовков запроса (If-None-Match важнее If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return _as_utc(last_modified).replace(microsecond=0) <= since
+    return False
 
 
 @router.get("/tracks", response_class=HTMLResponse)
 def get_tracks_map(
-    current_user: models.User = Depends(get_current_active_user),
+    limit: int = Query(100, ge=1, le=1000),
+    max_points: int = Query(settings.multi_map_point_budget, ge=100, le=200000, description="Точек на всю карту"),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение карты со всеми треками пользователя"""
-    tracks = crud.get_tracks(db, user_id=current_user.id)
+    tracks = crud.get_tracks(db, user_id=current_user.id, limit=limit)
     if not tracks:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No tracks found"
         )
     
-    # Загружаем точки для каждого трека
-    for track in tracks:
-        track.track_points = crud.get_track_points(db, track_id=track.id, user_id=current_user.id)
+    # Точки всех треков одним запросом, прореженные под бюджет карты
+    points_per_track = max(settings.multi_map_min_points_per_track, max_points // len(tracks))
+    points_by_track = crud.get_sampled_points_by_track(
+        db, user_id=current_user.id, track_ids=[track.id for track in tracks], points_per_track=points_per_track
+    )
     
-    map_html = maps.create_multi_track_map(tracks)
+    map_html = maps.create_multi_track_map(tracks, points_by_track=points_by_track)
     return HTMLResponse(content=map_html)
 
 
 @router.get("/locations", response_class=HTMLResponse)
 def get_locations_map(
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение карты со всеми местоположениями пользователя"""
@@ -80,4 +141,40 @@ def get_locations_map(
         )
     
     map_html = maps.create_stats_map(locations)
-    return HTMLResponse(content=map_html) 
\ No newline at end of file
+    return HTMLResponse(content=map_html) 
+
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+def get_tracks_tile(
+    z: int,
+    x: int,
+    y: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Векторный тайл (MVT) со всеми треками пользователя"""
+    if not 0 <= z <= tiles.MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tile out of range"
+        )
+    
+    track_rows = crud.get_tracks_in_bounds(db, current_user.id, *tiles.sample_bounds(z, x, y))
+    key = tiles.tile_key(current_user.id, z, x, y, [(track_id, version) for track_id, _, version in track_rows])
+    headers = {
+        "ETag": tiles.etag(key),
+        "Cache-Control": "private, no-cache"
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    content = tiles.cache.get(key)
+    if content is None:
+        parts_by_track = crud.get_sampled_points_in_bounds(
+            db, current_user.id, [row[0] for row in track_rows], *tiles.sample_bounds(z, x, y),
+            max_points=settings.tile_point_budget
+        )
+        content = tiles.build_tile([(track_id, name) for track_id, name, _ in track_rows], parts_by_track, z, x, y)
+        tiles.cache.set(key, content)
+    return Response(content=content, media_type=tiles.MEDIA_TYPE, headers=headers)
\ No newline at end of file
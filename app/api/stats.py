@@ -0,0 +1,29 @@
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from app import rollups, schemas
+from app.auth import get_current_active_user
+from app.principals import Principal
+from app.database import get_db
+
+router = APIRouter()
+
+
+@router.get("/summary", response_model=schemas.ActivitySummary)
+def get_summary(
+    date_from: Optional[date] = Query(None, alias="from", description="Первый день периода (UTC)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Последний день периода (UTC), включительно"),
+    group: Optional[str] = Query(None, pattern="^(day|week)$", description="Разбивка по дням или ISO неделям"),
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Расстояние, время в движении, число точек и треков за период (из сводных таблиц)"""
+    if date_from is not None and date_to is not None and date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from must not be after to"
+        )
+    return rollups.summary(db, current_user.id, date_from, date_to, group)
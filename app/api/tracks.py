@@ -1,20 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from app import crud, schemas, models
+from app import crud, schemas, models, ingest, encoding, live, point_filter, uploads, write_behind
 from app.auth import get_current_active_user
-from app.database import get_db
+from app.principals import Principal
+from app.config import settings
+from app.database import SessionLocal, get_db
 from app.schemas import TrackChunkUpload, GPSData
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 @router.get("/", response_model=List[schemas.Track])
 def get_tracks(
     skip: int = 0,
     limit: int = 100,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение списка треков пользователя"""
@@ -24,32 +30,100 @@ def get_tracks(
 
 @router.get("/recent", response_model=List[schemas.TrackRecent])
 def get_recent_tracks(
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение списка последних треков пользователя"""
     tracks = crud.get_tracks(db, user_id=current_user.id, skip=0, limit=3)
     result = []
     for track in tracks:
-        distance = crud.get_distance(db, track_id=track.id, user_id=current_user.id)
-        duration = crud.get_duration(db, track_id=track.id, user_id=current_user.id)
+        stats = crud.get_track_summary(db, track)
         result.append(
             schemas.TrackRecent(
                 id=track.id,
                 name=track.name,
                 description=track.description,
                 created_at=track.created_at,
-                distance=distance,
-                duration=duration
+                distance=stats.distance,
+                duration=stats.duration
             )
         )
     return result
 
 
+@router.get("/search", response_model=List[schemas.TrackSearchResult])
+def search_tracks(
+    bbox: str = Query(..., description="west,south,east,north в градусах"),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Поиск треков, проходящих через область"""
+    try:
+        west, south, east, north = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bbox must be west,south,east,north"
+        )
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid bbox"
+        )
+    
+    results = crud.search_tracks(db, current_user.id, west, south, east, north, limit=limit)
+    return [
+        schemas.TrackSearchResult(
+            id=track.id,
+            user_id=track.user_id,
+            name=track.name,
+            description=track.description,
+            created_at=track.created_at,
+            points_count=track.stats.points_count if track.stats else None,
+            points_in_bbox=points_in_bbox
+        )
+        for track, points_in_bbox in results
+    ]
+
+
+@router.get("/uploads/{upload_id}", response_model=schemas.UploadSessionStatus)
+def get_upload_status(
+    upload_id: str,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Состояние возобновляемой загрузки: с какого чанка (next_seq) продолжать"""
+    session = uploads.get_session(db, current_user.id, upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return uploads.session_status(session)
+
+
+@router.get("/filter", response_model=schemas.PointFilterStatus)
+def get_point_filter(
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Фильтр шума GPS пользователя (для всех его треков, если у трека не задан свой)"""
+    return point_filter.status(db, current_user.id)
+
+
+@router.put("/filter", response_model=schemas.PointFilterStatus)
+def update_point_filter(
+    values: schemas.PointFilterSettings,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Настройка фильтра шума GPS пользователя; поле null - значение сервера"""
+    point_filter.set_filter(db, current_user.id, values)
+    return point_filter.status(db, current_user.id)
+
+
 @router.post("/", response_model=schemas.Track)
 def create_track(
     track: schemas.TrackCreate,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Создание нового трека"""
@@ -59,7 +133,15 @@ def create_track(
 @router.get("/{track_id}", response_model=schemas.TrackWithPoints)
 def get_track(
     track_id: int,
-    current_user: models.User = Depends(get_current_active_user),
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Упростить трек для уровня зума карты"),
+    tolerance_m: Optional[float] = Query(None, gt=0, description="Допуск упрощения в метрах"),
+    algorithm: str = Query("rdp", pattern="^(rdp|visvalingam)$"),
+    start: Optional[datetime] = Query(None, description="Точки не раньше этого времени"),
+    end: Optional[datetime] = Query(None, description="Точки не позже этого времени"),
+    format: Optional[str] = Query(None, pattern=encoding.FORMAT_PATTERN, description="Формат точек"),
+    precision: int = Query(5, ge=1, le=7, description="Точность encoded polyline"),
+    accept: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение трека с точками"""
@@ -70,8 +152,15 @@ def get_track(
             detail="Track not found"
         )
     
-    # Получаем точки трека
-    track_points = crud.get_track_points(db, track_id=track_id, user_id=current_user.id)
+    # Получаем точки трека (упрощенные, если задан зум или допуск)
+    track_points = crud.get_simplified_track_points(
+        db, track, zoom=zoom, tolerance_m=tolerance_m, algorithm=algorithm, start=start, end=end
+    )
+    
+    points_format = encoding.negotiate_format(format, accept)
+    if points_format != encoding.FORMAT_JSON:
+        meta = schemas.Track.model_validate(track).model_dump()
+        return encoding.points_response(track_points, points_format, track.id, precision=precision, meta=meta)
     
     # Создаем объект с точками
     track_with_points = schemas.TrackWithPoints(
@@ -86,10 +175,60 @@ def get_track(
     return track_with_points
 
 
+@router.get("/{track_id}/analytics", response_model=schemas.TrackAnalytics)
+def get_track_analytics(
+    track_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Время в движении и остановках, набор высоты, профиль скорости и сплиты трека"""
+    track = crud.get_track(db, track_id=track_id, user_id=current_user.id)
+    if not track:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Track not found"
+        )
+    return crud.get_track_analytics(db, track)
+
+
+@router.get("/{track_id}/filter", response_model=schemas.PointFilterStatus)
+def get_track_point_filter(
+    track_id: int,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Фильтр шума GPS трека и число отброшенных им точек"""
+    track = crud.get_track(db, track_id=track_id, user_id=current_user.id)
+    if not track:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Track not found"
+        )
+    return point_filter.status(db, current_user.id, track)
+
+
+@router.put("/{track_id}/filter", response_model=schemas.PointFilterStatus)
+def update_track_point_filter(
+    track_id: int,
+    values: schemas.PointFilterSettings,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Настройка фильтра шума GPS трека; поле null - значение пользователя"""
+    track = crud.get_track(db, track_id=track_id, user_id=current_user.id)
+    if not track:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Track not found"
+        )
+    point_filter.set_filter(db, current_user.id, values, track_id=track.id)
+    return point_filter.status(db, current_user.id, track)
+
+
 @router.delete("/{track_id}")
 def delete_track(
     track_id: int,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Удаление трека"""
@@ -105,7 +244,7 @@ def delete_track(
 @router.post("/upload", response_model=schemas.Track)
 def upload_track(
     track_upload: schemas.TrackUpload,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Загрузка трека с точками"""
@@ -124,23 +263,20 @@ def upload_track(
     
     # Валидация координат
     for i, point in enumerate(track_upload.points):
-        if not (-90 <= point.latitude <= 90):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid latitude at point {i}: {point.latitude}"
-            )
-        if not (-180 <= point.longitude <= 180):
+        try:
+            ingest.validate_point(i, point.latitude, point.longitude)
+        except ValueError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid longitude at point {i}: {point.longitude}"
+                detail=str(e)
             )
     
     try:
         # Создаем трек с точками
         track = crud.create_track_with_points(db=db, track_upload=track_upload, user_id=current_user.id)
         
-        # Получаем количество созданных точек
-        points_count = len(track_upload.points)
+        # Получаем количество сохраненных точек (часть могла отбросить фильтр шума)
+        points_count = track.stats.points_count if track.stats else 0
         
         return {
             "id": track.id,
@@ -153,37 +289,107 @@ def upload_track(
         
     except Exception as e:
         # Логируем ошибку
-        print(f"Error creating track: {e}")
+        logger.exception(f"Ошибка загрузки трека: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create track with points"
         )
 
 
+@router.post("/upload/stream", response_model=schemas.Track)
+async def upload_track_stream(
+    request: Request,
+    name: str = Query(..., min_length=1, max_length=100),
+    description: Optional[str] = None,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Потоковая загрузка трека: тело NDJSON (по точке на строку) или CSV с заголовком.
+    
+    Точки разбираются по мере получения и пишутся пачками в одной транзакции,
+    поэтому ограничения на количество точек нет.
+    """
+    content_type = request.headers.get("content-type", "")
+    parser = ingest.PointStreamParser("csv" if "csv" in content_type else "ndjson")
+    batch_size = settings.ingest_batch_size
+    track = await run_in_threadpool(
+        crud.add_track, db, schemas.TrackCreate(name=name, description=description), current_user.id
+    )
+    
+    batch = []
+    points_count = 0
+    try:
+        async for chunk in request.stream():
+            batch.extend(parser.feed(chunk))
+            if len(batch) >= batch_size:
+                points_count += len(await run_in_threadpool(ingest.insert_points, db, track.id, batch))
+                batch = []
+        batch.extend(parser.close())
+        if batch:
+            points_count += len(await run_in_threadpool(ingest.insert_points, db, track.id, batch))
+        if parser.count == 0:
+            raise ValueError("Track must contain at least one point")
+        await run_in_threadpool(db.commit)
+    except HTTPException:
+        # Ошибки распаковки тела (app.compression)
+        await run_in_threadpool(db.rollback)
+        raise
+    except ValueError as e:
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        await run_in_threadpool(db.rollback)
+        logger.exception(f"Ошибка потоковой загрузки трека: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create track with points"
+        )
+    
+    await run_in_threadpool(db.refresh, track)
+    return {
+        "id": track.id,
+        "name": track.name,
+        "description": track.description,
+        "user_id": track.user_id,
+        "created_at": track.created_at,
+        "points_count": points_count
+    }
+
+
 @router.post("/{track_id}/points", response_model=schemas.TrackPoint)
-def add_track_point(
+async def add_track_point(
     track_id: int,
     point: schemas.TrackPointCreate,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Добавление точки к треку"""
     # Проверяем, что трек существует и принадлежит пользователю
-    track = crud.get_track(db, track_id=track_id, user_id=current_user.id)
+    track = await run_in_threadpool(crud.get_track, db, track_id, current_user.id)
     if not track:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Track not found"
         )
     
-    return crud.create_track_point(db=db, track_point=point, track_id=track_id)
+    if settings.write_behind:
+        # Пока точка ждет пачку, запрос не занимает ни поток, ни соединение пула
+        await run_in_threadpool(db.close)
+        track_point = await write_behind.submit(track_id, point)
+    else:
+        track_point = await run_in_threadpool(crud.create_track_point, db, point, track_id)
+    live.publish_points(current_user.id, track_id, [track_point])
+    return track_point
 
 
 @router.post("/{track_id}/points/bulk", response_model=dict)
 def add_track_points_bulk(
     track_id: int,
     points: List[schemas.TrackPointCreate],
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Массовое добавление точек к треку"""
@@ -209,26 +415,21 @@ def add_track_points_bulk(
     
     try:
         # Создаем точки в транзакции
-        created_points = []
-        for point_data in points:
-            db_track_point = models.TrackPoint(
-                **point_data.dict(),
-                track_id=track_id
-            )
-            db.add(db_track_point)
-            created_points.append(db_track_point)
-        
+        rows = ingest.insert_points(db, track_id, points)
         db.commit()
+        live.publish_points(current_user.id, track_id, rows)
+        points_added = len(rows)
         
         return {
-            "message": f"Successfully added {len(created_points)} points to track {track_id}",
+            "message": f"Successfully added {points_added} points to track {track_id}",
             "track_id": track_id,
-            "points_added": len(created_points)
+            "points_added": points_added,
+            "points_dropped": len(points) - points_added
         }
         
     except Exception as e:
         db.rollback()
-        print(f"Error adding points to track: {e}")
+        logger.exception(f"Ошибка добавления точек к треку {track_id}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to add points to track"
@@ -238,24 +439,80 @@ def add_track_points_bulk(
 @router.get("/{track_id}/points", response_model=List[schemas.TrackPoint])
 def get_track_points(
     track_id: int,
-    current_user: models.User = Depends(get_current_active_user),
+    zoom: Optional[int] = Query(None, ge=0, le=22, description="Упростить трек для уровня зума карты"),
+    tolerance_m: Optional[float] = Query(None, gt=0, description="Допуск упрощения в метрах"),
+    algorithm: str = Query("rdp", pattern="^(rdp|visvalingam)$"),
+    start: Optional[datetime] = Query(None, description="Точки не раньше этого времени"),
+    end: Optional[datetime] = Query(None, description="Точки не позже этого времени"),
+    format: Optional[str] = Query(None, pattern=encoding.FORMAT_PATTERN, description="Формат точек"),
+    precision: int = Query(5, ge=1, le=7, description="Точность encoded polyline"),
+    stream: bool = Query(False, description="Потоковая выдача (JSON массив по частям или NDJSON)"),
+    accept: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Получение точек трека"""
-    track_points = crud.get_track_points(db, track_id=track_id, user_id=current_user.id)
+    points_format = encoding.negotiate_format(format, accept)
+    simplified = zoom is not None or tolerance_m is not None
+    if stream and points_format not in encoding.STREAMING_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Format {points_format} does not support stream=true"
+        )
+    streaming = stream or points_format == encoding.FORMAT_NDJSON
+    if not simplified and not streaming and points_format == encoding.FORMAT_JSON:
+        return crud.get_track_points(db, track_id=track_id, user_id=current_user.id, start=start, end=end)
+    track = crud.get_track(db, track_id=track_id, user_id=current_user.id)
+    
+    if streaming:
+        if not track:
+            return encoding.streaming_points_response([], points_format)
+        if not simplified:
+            return encoding.streaming_points_response(_stream_track_points(track_id, start, end), points_format)
+    
+    track_points = []
+    if track:
+        track_points = crud.get_simplified_track_points(
+            db, track, zoom=zoom, tolerance_m=tolerance_m, algorithm=algorithm, start=start, end=end
+        )
+    if streaming:
+        return encoding.streaming_points_response(track_points, points_format)
+    if points_format != encoding.FORMAT_JSON:
+        return encoding.points_response(track_points, points_format, track_id, precision=precision)
     return track_points
 
 
+def _stream_track_points(track_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Точки трека из отдельной сессии, живущей до конца отправки ответа"""
+    db = SessionLocal()
+    try:
+        yield from crud.iter_track_point_rows(db, track_id, start=start, end=end)
+    finally:
+        db.close()
+
+
 @router.post("/load_from_tracker", response_model=dict)
 def load_from_tracker(
     chunk: TrackChunkUpload,
-    current_user: models.User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Загрузка трека чанками с устройства (ESP/трекер).
     Первый чанк создает трек, остальные добавляют точки.
+    С upload_id и seq загрузку можно возобновить после обрыва (см. app.uploads).
     """
+    if chunk.upload_id is not None:
+        if chunk.seq is None:
+            raise HTTPException(status_code=400, detail="seq required with upload_id")
+        try:
+            result, upload, inserted = uploads.apply_chunk(db, current_user.id, chunk)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except uploads.SequenceConflict as e:
+            raise _sequence_conflict(e)
+        live.publish_points(current_user.id, upload.track_id, inserted)
+        return uploads.chunk_response(chunk, result, upload, len(inserted), len(chunk.points))
     if chunk.is_first_chunk:
         # Создаем трек
         if not chunk.name or not chunk.points:
@@ -270,17 +527,108 @@ def load_from_tracker(
         if not track:
             raise HTTPException(status_code=404, detail="Track not found")
     # Добавляем точки
+    inserted = []
     if chunk.points:
-        for point in chunk.points:
-            db_point = models.TrackPoint(
-                track_id=track_id,
-                latitude=point.latitude,
-                longitude=point.longitude,
-                timestamp=point.timestamp,
-                altitude=point.altitude,
-                speed=point.speed
-            )
-            db.add(db_point)
+        inserted = ingest.insert_points(db, track_id, chunk.points)
         db.commit()
-    return {"track_id": track_id, "status": "ok", "is_last_chunk": chunk.is_last_chunk}
+        live.publish_points(current_user.id, track_id, inserted)
+    return {
+        "track_id": track_id,
+        "status": "ok",
+        "is_last_chunk": chunk.is_last_chunk,
+        "points_added": len(inserted),
+        "points_dropped": len(chunk.points) - len(inserted)
+    }
+
+
+
+def _sequence_conflict(e: uploads.SequenceConflict) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=str(e),
+        headers={uploads.EXPECTED_SEQ_HEADER: str(e.expected_seq)}
+    )
+
+
+def _store_binary_chunk(
+    db: Session,
+    user_id: int,
+    track_id: Optional[int],
+    name: Optional[str],
+    description: Optional[str],
+    points: List[dict]
+) -> tuple:
+    """Точки бинарного чанка без upload_id: в трек track_id или в новый трек name.
+
+    Возвращает трек и записанные строки точек.
+    """
+    if track_id is None:
+        if not name or not points:
+            raise HTTPException(status_code=400, detail="Name and points required for first chunk")
+        track_id = crud.add_track(db, schemas.TrackCreate(name=name, description=description), user_id).id
+    elif not crud.get_track(db, track_id=track_id, user_id=user_id):
+        raise HTTPException(status_code=404, detail="Track not found")
+    inserted = ingest.insert_points(db, track_id, points)
+    db.commit()
+    return track_id, inserted
+
 
+@router.post("/load_from_tracker/binary", response_model=dict)
+async def load_from_tracker_binary(
+    request: Request,
+    track_id: Optional[int] = Query(None, description="Трек для последующих чанков"),
+    name: Optional[str] = Query(None, min_length=1, max_length=100, description="Имя нового трека (первый чанк)"),
+    description: Optional[str] = None,
+    upload_id: Optional[str] = Query(None, min_length=1, max_length=64),
+    seq: Optional[int] = Query(None, ge=0),
+    is_last_chunk: bool = False,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Загрузка чанка трека с устройства в бинарном формате (см. app.ingest.decode_binary).
+    Параметры те же, что у load_from_tracker, но передаются в строке запроса.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in (ingest.BINARY_MEDIA_TYPE, "application/octet-stream"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be {ingest.BINARY_MEDIA_TYPE}"
+        )
+    try:
+        points = ingest.decode_binary(await request.body(), settings.binary_ingest_max_points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if upload_id is None:
+        track_id, inserted = await run_in_threadpool(
+            _store_binary_chunk, db, current_user.id, track_id, name, description, points
+        )
+        live.publish_points(current_user.id, track_id, inserted)
+        return {
+            "track_id": track_id,
+            "status": "ok",
+            "is_last_chunk": is_last_chunk,
+            "points_added": len(inserted),
+            "points_dropped": len(points) - len(inserted)
+        }
+
+    if seq is None:
+        raise HTTPException(status_code=400, detail="seq required with upload_id")
+    chunk = TrackChunkUpload(
+        name=name,
+        description=description,
+        upload_id=upload_id,
+        seq=seq,
+        points=[],
+        is_first_chunk=seq == 0,
+        is_last_chunk=is_last_chunk
+    )
+    try:
+        result, upload, inserted = await run_in_threadpool(uploads.apply_chunk, db, current_user.id, chunk, points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except uploads.SequenceConflict as e:
+        raise _sequence_conflict(e)
+    live.publish_points(current_user.id, upload.track_id, inserted)
+    return uploads.chunk_response(chunk, result, upload, len(inserted), len(points))
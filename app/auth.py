@@ -1,13 +1,16 @@
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
 
-from app import crud, models
+from app import crud, crud_async, models, principals
 from app.config import settings
-from app.database import get_db
+from app.database import AsyncSessionLocal, SessionLocal, get_async_db, get_db
+from app.principals import Principal
 
 security = HTTPBearer()
 
@@ -23,37 +26,98 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def verify_token(token: str) -> Optional[str]:
+def decode_token(token: str) -> Optional[dict]:
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return username
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
     except JWTError:
         return None
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> models.User:
-    credentials_exception = HTTPException(
+def verify_token(token: str) -> Optional[str]:
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+    return username
+
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    username = verify_token(credentials.credentials)
-    if username is None:
-        raise credentials_exception
-    
-    user = crud.get_user_by_username(db, username=username)
+
+
+def _verified_payload(token: str) -> dict:
+    payload = decode_token(token)
+    if payload is None or payload.get("sub") is None:
+        raise _credentials_exception()
+    return payload
+
+
+def _remember_user(token: str, payload: dict, user: Optional[models.User]) -> Principal:
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    principal = Principal(id=user.id, username=user.username)
+    principals.remember(token, principal, payload.get("exp"))
+    return principal
+
+
+if settings.async_database:
+    async def get_current_user(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: AsyncSession = Depends(get_async_db)
+    ) -> Principal:
+        token = credentials.credentials
+        principal = principals.get(token)
+        if principal is not None:
+            return principal
+        
+        payload = _verified_payload(token)
+        user = await crud_async.get_user_by_username(db, username=payload["sub"])
+        return _remember_user(token, payload, user)
+else:
+    # Синхронная зависимость: FastAPI выполняет ее в пуле потоков,
+    # поэтому запрос к БД не блокирует event loop
+    def get_current_user(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: Session = Depends(get_db)
+    ) -> Principal:
+        token = credentials.credentials
+        principal = principals.get(token)
+        if principal is not None:
+            return principal
+        
+        payload = _verified_payload(token)
+        user = crud.get_user_by_username(db, username=payload["sub"])
+        return _remember_user(token, payload, user)
+
+
+async def authenticate_token(token: str) -> Principal:
+    """Пользователь по токену вне зависимостей FastAPI (WebSocket, SSE); HTTPException 401"""
+    principal = principals.get(token)
+    if principal is not None:
+        return principal
     
-    return user
+    payload = _verified_payload(token)
+    if settings.async_database:
+        async with AsyncSessionLocal() as db:
+            user = await crud_async.get_user_by_username(db, username=payload["sub"])
+    else:
+        user = await run_in_threadpool(_load_user, payload["sub"])
+    return _remember_user(token, payload, user)
+
+
+def _load_user(username: str) -> Optional[models.User]:
+    db = SessionLocal()
+    try:
+        return crud.get_user_by_username(db, username=username)
+    finally:
+        db.close()
 
 
-async def get_current_active_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     return current_user 
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""Сжатие тел запросов и ответов (ASGI middleware).
+
+Запросы: тело с Content-Encoding gzip, deflate (zlib) или zstd распаковывается
+по мере чтения, эндпоинты получают обычное тело. Распакованный размер
+ограничен settings.max_decompressed_body: распаковка идет порциями и
+прерывается (413), как только предел превышен, поэтому "zip-бомба" не
+разворачивается в память. Неизвестная кодировка - 415, поврежденное или
+обрезанное тело - 400.
+
+Ответы: при подходящем Accept-Encoding тело сжимается zstd или gzip, если
+оно не меньше settings.compression_minimum_size. Потоковые ответы (NDJSON
+точек) сжимаются по частям со сбросом блока после каждой части, SSE и уже
+сжатые ответы не трогаются.
+
+zstd доступен, если установлен пакет zstandard.
+"""
+import zlib
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from app.config import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd необязателен
+    zstandard = None
+
+GZIP = "gzip"
+DEFLATE = "deflate"
+ZSTD = "zstd"
+IDENTITY = "identity"
+
+# Порция сжатых данных zstd за один вызов: ограничивает объем, распаковываемый
+# сверх предела (у zlib для этого есть max_length)
+_ZSTD_INPUT_STEP = 256
+
+_UNCOMPRESSIBLE_TYPES = ("image/", "video/", "audio/", "text/event-stream", "application/zip", "application/gzip", "application/zstd")
+
+
+def request_encodings() -> List[str]:
+    encodings = [GZIP, DEFLATE]
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    return encodings
+
+
+def response_encodings() -> List[str]:
+    """Кодировки ответа в порядке предпочтения сервера"""
+    return [ZSTD, GZIP] if zstandard is not None else [GZIP]
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Кодировка ответа по заголовку Accept-Encoding (наибольший q, затем порядок сервера)"""
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best, best_q = None, 0.0
+    for encoding in response_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Decoder:
+    """Потоковая распаковка с ограничением распакованного размера"""
+
+    def __init__(self, encoding: str, limit: int):
+        self.encoding = encoding
+        self.limit = limit
+        self.size = 0
+        self._obj = self._new()
+
+    def _new(self):
+        if self.encoding == ZSTD:
+            return zstandard.ZstdDecompressor().decompressobj()
+        # deflate в HTTP - формат zlib; 32 + MAX_WBITS принимает и gzip, и zlib
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)
+
+    def _count(self, data: bytes) -> bytes:
+        self.size += len(data)
+        if self.size > self.limit:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Decompressed request body too large"
+            )
+        return data
+
+    def _feed(self, data: bytes) -> Tuple[bytes, bytes]:
+        """Распаковывает data до конца текущего фрейма: (результат, данные после фрейма)"""
+        chunks = []
+        if self.encoding == ZSTD:
+            for offset in range(0, len(data), _ZSTD_INPUT_STEP):
+                chunks.append(self._count(self._obj.decompress(data[offset:offset + _ZSTD_INPUT_STEP])))
+                if self._obj.eof:
+                    return b"".join(chunks), self._obj.unused_data + data[offset + _ZSTD_INPUT_STEP:]
+            return b"".join(chunks), b""
+        while data:
+            chunks.append(self._count(self._obj.decompress(data, self.limit - self.size + 1)))
+            data = self._obj.unconsumed_tail
+        return b"".join(chunks), self._obj.unused_data if self._obj.eof else b""
+
+    def decompress(self, data: bytes, final: bool) -> bytes:
+        chunks = []
+        try:
+            while data:
+                chunk, data = self._feed(data)
+                chunks.append(chunk)
+                if data:
+                    # Следующий gzip member / zstd фрейм
+                    self._obj = self._new()
+            if final and not self._obj.eof:
+                raise ValueError("truncated")
+        except HTTPException:
+            raise
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid compressed request body")
+        return b"".join(chunks)
+
+
+class _Encoder:
+    def __init__(self, encoding: str):
+        if encoding == ZSTD:
+            self._obj = zstandard.ZstdCompressor(level=settings.compression_zstd_level).compressobj()
+            self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._obj = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush_block = zlib.Z_SYNC_FLUSH
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        # Сброс блока после каждой части: клиент потокового ответа получает ее сразу
+        return self._obj.compress(data) + (self._obj.flush() if final else self._obj.flush(self._flush_block))
+
+
+class _Responder:
+    """Сжимает ответ выбранной кодировкой, если он достаточно большой"""
+
+    def __init__(self, app, encoding: str):
+        self.app = app
+        self.encoding = encoding
+        self.send = None
+        self.start_message = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send) -> None:
+        self.send = send
+        await self.app(scope, receive, self._send)
+
+    def _compressible(self, start, headers: MutableHeaders) -> bool:
+        if start["status"] in (204, 304) or "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return not content_type.startswith(_UNCOMPRESSIBLE_TYPES)
+
+    async def _send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=list(start["headers"]))
+            if not self._compressible(start, headers) or (not more_body and len(body) < settings.compression_minimum_size):
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.encoder = _Encoder(self.encoding)
+            body = self.encoder.compress(body, final=not more_body)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            start["headers"] = headers.raw
+            await self.send(start)
+        else:
+            body = self.encoder.compress(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "").strip().lower()
+        if content_encoding and content_encoding != IDENTITY:
+            if content_encoding not in request_encodings():
+                response = JSONResponse(
+                    {"detail": f"Unsupported Content-Encoding: {content_encoding}"},
+                    status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+                )
+                await response(scope, receive, send)
+                return
+            # Эндпоинты видят распакованное тело без Content-Encoding и Content-Length
+            scope = dict(scope)
+            scope["headers"] = [
+                (name, value) for name, value in scope["headers"]
+                if name not in (b"content-encoding", b"content-length")
+            ]
+            receive = _decoding_receive(receive, _Decoder(content_encoding, settings.max_decompressed_body))
+
+        encoding = negotiate(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+        else:
+            await _Responder(self.app, encoding)(scope, receive, send)
+
+
+def _decoding_receive(receive, decoder: _Decoder):
+    async def decoding_receive():
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            more_body = message.get("more_body", False)
+            body = decoder.decompress(message.get("body", b""), final=not more_body)
+            if body or not more_body:
+                return {"type": "http.request", "body": body, "more_body": more_body}
+
+    return decoding_receive
@@ -6,11 +6,18 @@ import os
 class Settings(BaseSettings):
     # Database
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./location_tracker.db")
+    # Асинхронный стек (AsyncSession): asyncpg для PostgreSQL, aiosqlite для SQLite.
+    # Миграции и фоновые задачи всегда используют синхронный движок.
+    async_database: bool = False
+    async_database_url: Optional[str] = None  # по умолчанию выводится из database_url
     
     # Security
     secret_key: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    # Кэш проверенных токенов (токен -> id и username пользователя)
+    auth_cache_size: int = 10000
+    auth_cache_ttl: int = 60  # секунды
     
     # CORS
     allowed_origins: list = ["http://localhost:3000", "http://127.0.0.1:3000"]
@@ -21,6 +28,73 @@ class Settings(BaseSettings):
     # Development
     debug: bool = False
     
+    # Track simplification
+    simplify_cache_size: int = 256  # число упрощенных уровней треков в памяти
+    
+    # Rendered map HTML cache
+    map_cache_entries: int = 512
+    map_cache_bytes: int = 64 * 1024 * 1024
+    map_cache_dir: Optional[str] = None  # каталог для дискового кэша (по умолчанию выключен)
+    
+    # Аналитика треков (/tracks/{id}/analytics), см. app.analytics
+    analytics_cache_size: int = 256
+    analytics_moving_speed: float = 0.5  # м/с, медленнее - остановка
+    analytics_max_gap: float = 300.0  # секунды, более длинная пауза между точками - остановка
+    analytics_elevation_hysteresis: float = 5.0  # метры
+    analytics_split_distance: float = 1000.0  # метры
+    
+    # Multi-track map: сколько точек всех треков попадает на одну карту
+    multi_map_point_budget: int = 20000
+    multi_map_min_points_per_track: int = 50
+    
+    # Vector tiles (MVT)
+    tile_extent: int = 4096
+    tile_buffer: int = 64  # в единицах extent
+    tile_simplify_tolerance: float = 8.0  # в единицах extent (половина пикселя тайла 256px)
+    tile_point_budget: int = 50000  # точек всех треков на один тайл
+    tile_sample_margin: float = 0.25  # доля тайла вокруг него, из которой тоже берутся точки
+    tile_cache_entries: int = 2048
+    tile_cache_bytes: int = 64 * 1024 * 1024
+    
+    # Помесячное секционирование track_points (только PostgreSQL), см. app.partitions
+    track_points_partitioning: bool = False
+    partition_months_ahead: int = 3
+    
+    # Последнее известное местоположение: "memory" (один воркер) или "sqlite" (общий файл)
+    position_store: str = "memory"
+    position_store_path: str = "./positions.db"
+    
+    # Живое отслеживание (WebSocket/SSE)
+    live_queue_size: int = 100  # событий в очереди подписчика
+    live_max_batch_points: int = 1000  # точек в одном объединенном событии
+    live_heartbeat: int = 15  # секунды
+    
+    # Ingest
+    ingest_batch_size: int = 5000  # точек в одной пачке при потоковой загрузке
+    binary_ingest_max_points: int = 50000  # точек в одном бинарном чанке трекера
+    
+    # Фильтр шума GPS при записи точек, см. app.point_filter (пользователь и трек
+    # могут переопределить enabled, min_distance, max_speed, smoothing)
+    point_filter: bool = False
+    point_filter_min_distance: float = 5.0  # метры, ближе к предыдущей точке - дубликат/стоянка
+    point_filter_max_speed: float = 70.0  # м/с, быстрее - выброс
+    point_filter_smoothing: bool = False  # фильтр Калмана по координатам
+    point_filter_accuracy: float = 10.0  # метры, погрешность координат для фильтра Калмана
+    point_filter_process_noise: float = 3.0  # м/с, ожидаемое изменение скорости для фильтра Калмана
+    point_filter_max_interval: float = 0.0  # секунды; точка сохраняется хотя бы так часто (0 - без ограничения)
+    
+    # Сжатие запросов и ответов, см. app.compression
+    compression_minimum_size: int = 1024  # меньшие ответы не сжимаются
+    compression_gzip_level: int = 6
+    compression_zstd_level: int = 3
+    max_decompressed_body: int = 64 * 1024 * 1024  # предел распакованного тела запроса
+    
+    # Групповая запись одиночных точек (POST /tracks/{id}/points), см. app.write_behind
+    write_behind: bool = False
+    write_behind_max_points: int = 500  # точек в одной транзакции
+    write_behind_flush_ms: int = 50  # максимальное ожидание первой точки пачки
+    write_behind_max_pending: int = 20000  # сверх этого - 503
+    
     # Logging
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
     
@@ -1,10 +1,10 @@
-from datetime import datetime
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy.orm import Session, contains_eager
+from sqlalchemy import and_, case, desc, func, or_, select
 from passlib.context import CryptContext
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
-from app import models, schemas
+from app import models, schemas, metrics, track_stats, ingest, simplify, principals, map_cache, geohash, pagination, positions, analytics, rollups
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -36,6 +36,8 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    # Токены с тем же username больше не должны указывать на прежнюю запись
+    principals.invalidate_user(db_user.username)
     return db_user
 
 
@@ -44,64 +46,108 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 
 # Location CRUD operations
-def get_locations(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Location]:
-    return db.query(models.Location).filter(models.Location.user_id == user_id).offset(skip).limit(limit).all()
-
-
-def get_current_location(db: Session, user_id: int) -> Optional[models.Location]:
-    return db.query(models.Location).filter(models.Location.user_id == user_id).order_by(desc(models.Location.timestamp)).first()
-
-
-def create_location(db: Session, location: schemas.LocationCreate, user_id: int) -> models.Location:
+def get_locations(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> List[models.Location]:
+    """Местоположения от новых к старым; cursor - см. app.pagination (ValueError, если поврежден)"""
+    query = db.query(models.Location).filter(models.Location.user_id == user_id)
+    condition = pagination.before(models.Location.timestamp, models.Location.id, cursor)
+    if condition is not None:
+        query = query.filter(condition)
+    elif skip:
+        query = query.offset(skip)
+    return query.order_by(desc(models.Location.timestamp), desc(models.Location.id)).limit(limit).all()
+
+
+def get_location(db: Session, location_id: int, user_id: int) -> Optional[models.Location]:
+    return db.query(models.Location).filter(
+        models.Location.id == location_id, models.Location.user_id == user_id
+    ).first()
+
+
+def _latest_location(db: Session, user_id: int) -> Optional[models.Location]:
+    return db.query(models.Location).filter(models.Location.user_id == user_id).order_by(
+        desc(models.Location.timestamp), desc(models.Location.id)
+    ).first()
+
+
+def get_current_location(db: Session, user_id: int) -> Optional[schemas.Location]:
+    """Последнее местоположение из app.positions; при промахе - из БД"""
+    cached = positions.get(user_id)
+    if cached is not None:
+        return cached
+    location = _latest_location(db, user_id)
+    return positions.remember(location) if location else None
+
+
+def create_location(db: Session, location: schemas.LocationCreate, user_id: int) -> schemas.Location:
     db_location = models.Location(**location.dict(), user_id=user_id)
     db.add(db_location)
+    # id и время известны после flush, повторное чтение после commit не нужно
+    db.flush()
+    data = positions.snapshot(db_location)
     db.commit()
-    db.refresh(db_location)
-    return db_location
+    return positions.remember(data)
 
 
-def update_location(db: Session, user_id: int, location: schemas.LocationCreate) -> models.Location:
-    # Get current location or create new one
-    current_location = get_current_location(db, user_id)
+def update_location(db: Session, user_id: int, location: schemas.LocationCreate) -> schemas.Location:
+    # Текущая запись - всегда из БД: хранилище app.positions может отставать
+    # (другой воркер уже записал более новое местоположение)
+    current_location = _latest_location(db, user_id)
     if current_location:
         # Update existing location
         current_location.latitude = location.latitude
         current_location.longitude = location.longitude
         current_location.name = location.name or current_location.name
+        db.flush()
+        data = positions.snapshot(current_location)
         db.commit()
-        db.refresh(current_location)
-        return current_location
-    else:
-        # Create new location
-        return create_location(db, location, user_id)
+        return positions.remember(data)
+    # Create new location
+    return create_location(db, location, user_id)
+
+
+def delete_location(db: Session, location: models.Location) -> None:
+    db.delete(location)
+    db.commit()
+    positions.forget(location.user_id, location.id)
 
 
 # Track CRUD operations
 def get_tracks(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Track]:
-    """Получение треков пользователя с количеством точек"""
-    tracks = db.query(
-        models.Track,
-        func.count(models.TrackPoint.id).label('points_count')
-    ).outerjoin(models.TrackPoint).filter(
+    """Получение треков пользователя с количеством точек (из track_stats)"""
+    tracks = db.query(models.Track).outerjoin(models.Track.stats).options(
+        contains_eager(models.Track.stats)
+    ).filter(
         models.Track.user_id == user_id
-    ).group_by(models.Track.id).offset(skip).limit(limit).all()
+    ).offset(skip).limit(limit).all()
     
     # Добавляем количество точек к каждому треку
-    result = []
-    for track, points_count in tracks:
-        track.points_count = points_count
-        result.append(track)
+    for track in tracks:
+        track.points_count = track.stats.points_count if track.stats else 0
     
-    return result
+    return tracks
 
 
 def get_track(db: Session, track_id: int, user_id: int) -> Optional[models.Track]:
     return db.query(models.Track).filter(models.Track.id == track_id, models.Track.user_id == user_id).first()
 
 
-def create_track(db: Session, track: schemas.TrackCreate, user_id: int) -> models.Track:
+def add_track(db: Session, track: schemas.TrackCreate, user_id: int) -> models.Track:
+    """Добавляет трек в текущую транзакцию (без commit), id доступен сразу"""
     db_track = models.Track(**track.dict(), user_id=user_id)
+    db_track.stats = track_stats.new_stats()
     db.add(db_track)
+    db.flush()
+    return db_track
+
+
+def create_track(db: Session, track: schemas.TrackCreate, user_id: int) -> models.Track:
+    db_track = add_track(db, track, user_id)
     db.commit()
     db.refresh(db_track)
     return db_track
@@ -110,43 +156,364 @@ def create_track(db: Session, track: schemas.TrackCreate, user_id: int) -> model
 def delete_track(db: Session, track_id: int, user_id: int) -> bool:
     track = get_track(db, track_id, user_id)
     if track:
+        rollups.forget_track(db, track.id)
         db.delete(track)
         db.commit()
+        # id трека может быть переиспользован (SQLite), кэши по нему больше не нужны
+        simplify.cache.discard_where(lambda key, points: key[0] == track_id)
+        analytics.cache.discard_where(lambda key, result: key[0] == track_id)
+        map_cache.invalidate_track(track_id)
         return True
     return False
 
 
 # TrackPoint CRUD operations
-def get_track_points(db: Session, track_id: int, user_id: int) -> List[models.TrackPoint]:
+# Точки трека всегда упорядочены по времени (индекс track_id, timestamp), id - для равного времени
+POINT_ORDER = (models.TrackPoint.timestamp, models.TrackPoint.id)
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite хранит наивное UTC время и не учитывает смещение при сравнении
+    return value.astimezone(timezone.utc) if value.tzinfo is not None else value
+
+
+def _time_window(query, start: Optional[datetime], end: Optional[datetime]):
+    if start is not None:
+        query = query.filter(models.TrackPoint.timestamp >= _utc(start))
+    if end is not None:
+        query = query.filter(models.TrackPoint.timestamp <= _utc(end))
+    return query
+
+
+def get_track_points(
+    db: Session,
+    track_id: int,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[models.TrackPoint]:
     # Verify track belongs to user
     track = get_track(db, track_id, user_id)
     if not track:
         return []
-    return db.query(models.TrackPoint).filter(models.TrackPoint.track_id == track_id).all()
+    query = db.query(models.TrackPoint).filter(models.TrackPoint.track_id == track_id)
+    return _time_window(query, start, end).order_by(*POINT_ORDER).all()
+
+
+def _track_point_rows_query(db: Session, track_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    query = db.query(
+        models.TrackPoint.id,
+        models.TrackPoint.track_id,
+        models.TrackPoint.latitude,
+        models.TrackPoint.longitude,
+        models.TrackPoint.timestamp,
+        models.TrackPoint.altitude,
+        models.TrackPoint.speed
+    ).filter(models.TrackPoint.track_id == track_id)
+    return _time_window(query, start, end).order_by(*POINT_ORDER)
+
+
+def get_track_point_rows(
+    db: Session,
+    track_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List:
+    """Точки трека строками (без ORM объектов) по времени, опционально за интервал [start, end]"""
+    return _track_point_rows_query(db, track_id, start, end).all()
+
+
+def iter_track_point_rows(
+    db: Session,
+    track_id: int,
+    batch_size: int = 1000,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Iterator:
+    """Точки трека строками через серверный курсор, по batch_size строк за выборку"""
+    # yield_per включает stream_results (серверный курсор на PostgreSQL)
+    yield from _track_point_rows_query(db, track_id, start, end).yield_per(batch_size)
+
+
+def get_simplified_track_points(
+    db: Session,
+    track: models.Track,
+    zoom: Optional[int] = None,
+    tolerance_m: Optional[float] = None,
+    algorithm: str = "rdp",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List:
+    """Упрощенные точки трека для заданного зума или допуска (с кэшированием)"""
+    stats = track.stats
+    latitude = 0.0
+    if stats is not None and stats.min_latitude is not None:
+        latitude = (stats.min_latitude + stats.max_latitude) / 2
+    tolerance = simplify.resolve_tolerance(zoom, tolerance_m, latitude)
+    if tolerance is None:
+        return get_track_point_rows(db, track.id, start, end)
+
+    # Версия статистики растет при каждом добавлении точек
+    key = (track.id, stats.version if stats is not None else None, algorithm, round(tolerance, 2), start, end)
+    points = simplify.cache.get(key) if stats is not None else None
+    if points is None:
+        points = simplify.simplify_points(get_track_point_rows(db, track.id, start, end), tolerance, algorithm)
+        if stats is not None:
+            simplify.cache.set(key, points)
+    return points
+
+
+def get_tracks_in_bounds(
+    db: Session,
+    user_id: int,
+    west: float,
+    south: float,
+    east: float,
+    north: float
+) -> List[Tuple[int, str, int]]:
+    """Треки пользователя, чей bbox (из track_stats) пересекает область: (id, name, version)"""
+    stats = models.TrackStats
+    query = select(models.Track.id, models.Track.name, stats.version).join(
+        stats, stats.track_id == models.Track.id
+    ).where(
+        models.Track.user_id == user_id,
+        stats.min_latitude <= north,
+        stats.max_latitude >= south,
+        stats.min_longitude <= east,
+        stats.max_longitude >= west
+    ).order_by(models.Track.id)
+    return [tuple(row) for row in db.execute(query)]
+
+
+def search_tracks(
+    db: Session,
+    user_id: int,
+    west: float,
+    south: float,
+    east: float,
+    north: float,
+    limit: int = 100
+) -> List[Tuple[models.Track, int]]:
+    """Треки пользователя с точками внутри bbox и число таких точек.
+
+    Кандидаты отбираются по индексу geohash (диапазоны ячеек, покрывающих bbox),
+    затем точно фильтруются по координатам.
+    """
+    point = models.TrackPoint
+    cells = [point.geohash.between(*geohash.cell_range(prefix)) for prefix in geohash.cover(west, south, east, north)]
+    if west <= east:
+        longitude_filter = point.longitude.between(west, east)
+    else:
+        longitude_filter = or_(point.longitude >= west, point.longitude <= east)
+    points_count = func.count(point.id).label("points_in_bbox")
+    query = select(models.Track, points_count).join(point, point.track_id == models.Track.id).where(
+        models.Track.user_id == user_id,
+        or_(*cells),
+        and_(point.latitude.between(south, north), longitude_filter)
+    ).group_by(models.Track.id).order_by(models.Track.id).limit(limit)
+    return [(track, count) for track, count in db.execute(query)]
+
+
+def get_sampled_points_by_track(
+    db: Session,
+    user_id: int,
+    track_ids: Sequence[int],
+    points_per_track: int
+) -> Dict[int, List[Tuple[float, float]]]:
+    """Координаты точек нескольких треков одним запросом, с прореживанием в БД.
+
+    Из каждого трека берется каждая N-я точка (N по points_count из track_stats),
+    чтобы в ответ попало не больше ~points_per_track точек; первая и последняя
+    точки сохраняются всегда.
+    """
+    if not track_ids:
+        return {}
+    row_number = func.row_number().over(
+        partition_by=models.TrackPoint.track_id, order_by=POINT_ORDER
+    ).label("rn")
+    numbered = select(
+        models.TrackPoint.track_id,
+        models.TrackPoint.latitude,
+        models.TrackPoint.longitude,
+        row_number
+    ).join(models.Track).where(
+        models.Track.user_id == user_id,
+        models.TrackPoint.track_id.in_(track_ids)
+    ).subquery()
+
+    points_count = models.TrackStats.points_count
+    # Целочисленное деление: "/" в SQLAlchemy 2.0 - деление с дробной частью
+    stride = func.coalesce(case(
+        (points_count > points_per_track, (points_count + points_per_track - 1) // points_per_track),
+        else_=1
+    ), 1)
+    query = select(numbered.c.track_id, numbered.c.latitude, numbered.c.longitude).outerjoin(
+        models.TrackStats, models.TrackStats.track_id == numbered.c.track_id
+    ).where(
+        or_((numbered.c.rn - 1) % stride == 0, numbered.c.rn == points_count)
+    ).order_by(numbered.c.track_id, numbered.c.rn)
+
+    result = {track_id: [] for track_id in track_ids}
+    for track_id, latitude, longitude in db.execute(query):
+        result[track_id].append((latitude, longitude))
+    return result
+
+
+# Разрыв между соседними точками трека в области больше стольких средних
+# интервалов записи - трек выходил из области, части не соединяются
+_RUN_GAP_INTERVALS = 5
+
+
+def _epoch_seconds(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.extract("epoch", column)
+    return func.julianday(column) * 86400.0
+
+
+def get_sampled_points_in_bounds(
+    db: Session,
+    user_id: int,
+    track_ids: Sequence[int],
+    west: float,
+    south: float,
+    east: float,
+    north: float,
+    max_points: int
+) -> Dict[int, List[List[Tuple[float, float]]]]:
+    """Точки треков внутри bbox (по индексу geohash), прореженные до ~max_points всего.
+
+    Шаг прореживания общий для всех треков, поэтому бюджет делится
+    пропорционально числу точек треков в области. Возвращает для каждого трека
+    части - непрерывные участки внутри bbox; первая и последняя точки каждой
+    части сохраняются всегда.
+    """
+    if not track_ids:
+        return {}
+    point = models.TrackPoint
+    cells = [point.geohash.between(*geohash.cell_range(prefix)) for prefix in geohash.cover(west, south, east, north)]
+    if west <= east:
+        longitude_filter = point.longitude.between(west, east)
+    else:
+        longitude_filter = or_(point.longitude >= west, point.longitude <= east)
+    stats = models.TrackStats
+    seconds = _epoch_seconds(db, point.timestamp)
+    track_window = {"partition_by": point.track_id, "order_by": POINT_ORDER}
+    mean_interval = stats.duration / case((stats.points_count > 1, stats.points_count - 1), else_=1)
+    in_bounds = select(
+        point.track_id,
+        point.latitude,
+        point.longitude,
+        func.row_number().over(**track_window).label("rn"),
+        func.count().over(partition_by=point.track_id).label("track_count"),
+        func.count().over().label("total"),
+        (seconds - func.lag(seconds).over(**track_window)).label("gap"),
+        (mean_interval * _RUN_GAP_INTERVALS).label("max_gap")
+    ).join(models.Track, models.Track.id == point.track_id).outerjoin(
+        stats, stats.track_id == point.track_id
+    ).where(
+        models.Track.user_id == user_id,
+        point.track_id.in_(track_ids),
+        or_(*cells),
+        and_(point.latitude.between(south, north), longitude_filter)
+    ).subquery()
+
+    run_start = case((and_(in_bounds.c.gap > in_bounds.c.max_gap, in_bounds.c.max_gap > 0), 1), else_=0)
+    flagged = select(in_bounds, run_start.label("run_start")).subquery()
+    numbered = select(
+        flagged,
+        func.lead(flagged.c.run_start).over(partition_by=flagged.c.track_id, order_by=flagged.c.rn).label("run_end")
+    ).subquery()
+
+    # Целочисленное деление, см. get_sampled_points_by_track
+    stride = case((numbered.c.total > max_points, (numbered.c.total + max_points - 1) // max_points), else_=1)
+    query = select(
+        numbered.c.track_id, numbered.c.latitude, numbered.c.longitude, numbered.c.run_start
+    ).where(
+        or_(
+            (numbered.c.rn - 1) % stride == 0,
+            numbered.c.rn == numbered.c.track_count,
+            numbered.c.run_start == 1,
+            numbered.c.run_end == 1
+        )
+    ).order_by(numbered.c.track_id, numbered.c.rn)
+
+    result = {track_id: [] for track_id in track_ids}
+    for track_id, latitude, longitude, starts_run in db.execute(query):
+        parts = result[track_id]
+        if not parts or starts_run:
+            parts.append([])
+        parts[-1].append((latitude, longitude))
+    return result
+
+
+def get_track_point_columns(db: Session, track_id: int, user_id: int) -> List[tuple]:
+    """Координаты и время точек трека без создания ORM объектов"""
+    track = get_track(db, track_id, user_id)
+    if not track:
+        return []
+    return db.query(
+        models.TrackPoint.latitude,
+        models.TrackPoint.longitude,
+        models.TrackPoint.timestamp
+    ).filter(models.TrackPoint.track_id == track_id).order_by(*POINT_ORDER).all()
+
+
+def get_track_metrics(db: Session, track_id: int, user_id: int) -> metrics.TrackMetrics:
+    """Расстояние, длительность, скорости и азимуты трека за один проход"""
+    return metrics.metrics_from_rows(get_track_point_columns(db, track_id, user_id))
+
+
+def get_track_analytics(db: Session, track: models.Track) -> schemas.TrackAnalytics:
+    """Аналитика трека (см. app.analytics), кэшируется до добавления точек"""
+    stats = track.stats
+    key = (track.id, stats.version) if stats is not None else None
+    result = analytics.cache.get(key) if key is not None else None
+    if result is None:
+        rows = db.query(
+            models.TrackPoint.latitude,
+            models.TrackPoint.longitude,
+            models.TrackPoint.timestamp,
+            models.TrackPoint.altitude,
+            models.TrackPoint.speed
+        ).filter(models.TrackPoint.track_id == track.id).order_by(*POINT_ORDER).all()
+        result = analytics.compute_rows(track.id, rows)
+        if key is not None:
+            analytics.cache.set(key, result)
+    return result
 
 
 def get_distance(db: Session, track_id: int, user_id: int) -> float | None:
-    track_points = get_track_points(db, track_id, user_id)
-    if not track_points:
-        return 0
-    distance = 0
-    for i in range(len(track_points) - 1):
-        point1 = track_points[i]
-        point2 = track_points[i + 1]
-        distance += point1.distance_to(point2)
-    return distance
+    return get_track_metrics(db, track_id, user_id).distance
 
 
 def get_duration(db: Session, track_id: int, user_id: int) -> float | None:
-    track_points = get_track_points(db, track_id, user_id)
-    if not track_points:
-        return 0
-    duration = track_points[-1].timestamp - track_points[0].timestamp
-    return duration.total_seconds()
+    """Длительность по min/max времени точек (по индексу, без загрузки точек)"""
+    if not get_track(db, track_id, user_id):
+        return 0.0
+    start, end = db.query(
+        func.min(models.TrackPoint.timestamp), func.max(models.TrackPoint.timestamp)
+    ).filter(models.TrackPoint.track_id == track_id).one()
+    if start is None:
+        return 0.0
+    return metrics.to_epoch_seconds(end) - metrics.to_epoch_seconds(start)
+
+
+def get_track_summary(db: Session, track: models.Track) -> models.TrackStats:
+    """Статистика трека; для треков без строки в track_stats считается на лету"""
+    if track.stats is not None:
+        return track.stats
+    stats = track_stats.new_stats(track.id)
+    track_stats.apply_points(stats, track_stats.load_point_values(db, track.id))
+    return stats
+
 
 def create_track_point(db: Session, track_point: schemas.TrackPointCreate, track_id: int) -> models.TrackPoint:
     db_track_point = models.TrackPoint(**track_point.dict(), track_id=track_id)
     db.add(db_track_point)
+    # Время точки проставляет БД (server_default), поэтому читаем его до учета в статистике
+    db.flush()
+    db.refresh(db_track_point, ["timestamp"])
+    track_stats.record_points(db, track_id, [track_stats.point_values(db_track_point)])
     db.commit()
     db.refresh(db_track_point)
     return db_track_point
@@ -155,24 +522,12 @@ def create_track_point(db: Session, track_point: schemas.TrackPointCreate, track
 def create_track_with_points(db: Session, track_upload: schemas.TrackUpload, user_id: int) -> models.Track:
     """Создание трека с точками в транзакции"""
     try:
-        # Создаем трек
+        # Создаем трек (без commit - трек и точки сохраняются вместе)
         track_data = schemas.TrackCreate(name=track_upload.name, description=track_upload.description)
-        db_track = create_track(db, track_data, user_id)
+        db_track = add_track(db, track_data, user_id)
         
-        # Создаем точки трека
-        for point_data in track_upload.points:
-            point = schemas.TrackPointCreate(
-                latitude=point_data.latitude,
-                longitude=point_data.longitude,
-                altitude=point_data.altitude,
-                speed=point_data.speed
-            )
-            db_track_point = models.TrackPoint(
-                **point.dict(),
-                track_id=db_track.id,
-                timestamp=point_data.timestamp or datetime.utcnow()
-            )
-            db.add(db_track_point)
+        # Создаем точки трека одним запросом
+        ingest.insert_points(db, db_track.id, track_upload.points)
         
         # Коммитим все изменения
         db.commit()
@@ -183,4 +538,4 @@ def create_track_with_points(db: Session, track_upload: schemas.TrackUpload, use
     except Exception as e:
         # Откатываем транзакцию в случае ошибки
         db.rollback()
-        raise e 
\ No newline at end of file
+        raise e
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""Асинхронные варианты CRUD операций (settings.async_database).
+
+Простые запросы выполняются через AsyncSession напрямую. Составные операции
+(массовая запись точек, статистика треков) переиспользуют синхронный код
+через AsyncSession.run_sync, чтобы не дублировать логику.
+"""
+from typing import Any, Iterable, List, Optional
+
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+
+from app import crud, ingest, models, pagination, positions, schemas, uploads
+
+
+# User CRUD operations
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[models.User]:
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+
+# Location CRUD operations
+async def get_locations(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> List[models.Location]:
+    query = select(models.Location).where(models.Location.user_id == user_id)
+    condition = pagination.before(models.Location.timestamp, models.Location.id, cursor)
+    if condition is not None:
+        query = query.where(condition)
+    elif skip:
+        query = query.offset(skip)
+    result = await db.execute(
+        query.order_by(desc(models.Location.timestamp), desc(models.Location.id)).limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def get_location(db: AsyncSession, location_id: int, user_id: int) -> Optional[models.Location]:
+    result = await db.execute(
+        select(models.Location).where(models.Location.id == location_id, models.Location.user_id == user_id)
+    )
+    return result.scalars().first()
+
+
+async def _latest_location(db: AsyncSession, user_id: int) -> Optional[models.Location]:
+    result = await db.execute(
+        select(models.Location).where(models.Location.user_id == user_id).order_by(
+            desc(models.Location.timestamp), desc(models.Location.id)
+        ).limit(1)
+    )
+    return result.scalars().first()
+
+
+async def get_current_location(db: AsyncSession, user_id: int) -> Optional[schemas.Location]:
+    cached = positions.get(user_id)
+    if cached is not None:
+        return cached
+    location = await _latest_location(db, user_id)
+    return positions.remember(location) if location else None
+
+
+async def create_location(db: AsyncSession, location: schemas.LocationCreate, user_id: int) -> schemas.Location:
+    db_location = models.Location(**location.dict(), user_id=user_id)
+    db.add(db_location)
+    await db.flush()
+    data = positions.snapshot(db_location)
+    await db.commit()
+    return positions.remember(data)
+
+
+async def update_location(db: AsyncSession, user_id: int, location: schemas.LocationCreate) -> schemas.Location:
+    # Текущая запись - из БД, см. crud.update_location
+    current_location = await _latest_location(db, user_id)
+    if current_location:
+        current_location.latitude = location.latitude
+        current_location.longitude = location.longitude
+        current_location.name = location.name or current_location.name
+        await db.flush()
+        data = positions.snapshot(current_location)
+        await db.commit()
+        return positions.remember(data)
+    return await create_location(db, location, user_id)
+
+
+async def delete_location(db: AsyncSession, location: models.Location) -> None:
+    user_id, location_id = location.user_id, location.id
+    await db.delete(location)
+    await db.commit()
+    positions.forget(user_id, location_id)
+
+
+# Track CRUD operations
+async def get_tracks(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Track]:
+    """Треки пользователя с количеством точек (из track_stats)"""
+    result = await db.execute(
+        select(models.Track).outerjoin(models.Track.stats).options(
+            contains_eager(models.Track.stats)
+        ).where(models.Track.user_id == user_id).offset(skip).limit(limit)
+    )
+    tracks = list(result.unique().scalars().all())
+    for track in tracks:
+        track.points_count = track.stats.points_count if track.stats else 0
+    return tracks
+
+
+async def get_track(db: AsyncSession, track_id: int, user_id: int) -> Optional[models.Track]:
+    result = await db.execute(
+        select(models.Track).where(models.Track.id == track_id, models.Track.user_id == user_id)
+    )
+    return result.scalars().first()
+
+
+async def create_track(db: AsyncSession, track: schemas.TrackCreate, user_id: int) -> models.Track:
+    return await db.run_sync(crud.create_track, track, user_id)
+
+
+async def get_track_summary(db: AsyncSession, track: models.Track) -> models.TrackStats:
+    return await db.run_sync(crud.get_track_summary, track)
+
+
+# TrackPoint CRUD operations
+async def get_track_points(db: AsyncSession, track_id: int, user_id: int) -> List[models.TrackPoint]:
+    if not await get_track(db, track_id, user_id):
+        return []
+    result = await db.execute(
+        select(models.TrackPoint).where(models.TrackPoint.track_id == track_id).order_by(*crud.POINT_ORDER)
+    )
+    return list(result.scalars().all())
+
+
+async def create_track_point(db: AsyncSession, track_point: schemas.TrackPointCreate, track_id: int) -> models.TrackPoint:
+    return await db.run_sync(crud.create_track_point, track_point, track_id)
+
+
+async def insert_points(db: AsyncSession, track_id: int, points: Iterable[Any]) -> List[dict]:
+    """Массовая запись точек (без commit), см. app.ingest"""
+    return await db.run_sync(ingest.insert_points, track_id, points)
+
+
+async def apply_upload_chunk(db: AsyncSession, user_id: int, chunk: schemas.TrackChunkUpload):
+    """Чанк возобновляемой загрузки (с commit), см. app.uploads.apply_chunk"""
+    return await db.run_sync(uploads.apply_chunk, user_id, chunk)
@@ -0,0 +1,244 @@
+"""Компактные форматы выдачи точек трека.
+
+- polyline: Google encoded polyline (координаты) с настраиваемой точностью;
+- columnar: JSON с параллельными массивами и дельта-кодированным временем (мс);
+- binary: упакованный little-endian формат (см. pack_binary);
+- ndjson: потоковая выдача, по одному JSON объекту точки на строку.
+
+Формат выбирается параметром `format` или заголовком Accept.
+"""
+import json
+import struct
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
+
+from app.metrics import to_epoch_seconds
+
+FORMAT_JSON = "json"
+FORMAT_POLYLINE = "polyline"
+FORMAT_COLUMNAR = "columnar"
+FORMAT_BINARY = "binary"
+FORMAT_NDJSON = "ndjson"
+
+MEDIA_TYPES = {
+    FORMAT_JSON: "application/json",
+    FORMAT_POLYLINE: "application/vnd.locationtracker.polyline+json",
+    FORMAT_COLUMNAR: "application/vnd.locationtracker.columnar+json",
+    FORMAT_BINARY: "application/vnd.locationtracker.points",
+    FORMAT_NDJSON: "application/x-ndjson",
+}
+
+FORMAT_PATTERN = "^(" + "|".join(MEDIA_TYPES) + ")$"
+
+# Форматы, которые можно отдавать потоком (stream=true)
+STREAMING_FORMATS = (FORMAT_JSON, FORMAT_NDJSON)
+
+# Бинарный формат: заголовок и далее колонки одинаковой длины count:
+#   latitude, longitude  int32  (градусы * 1e7)
+#   time_delta           int32  (мс от предыдущей точки, у первой - 0);
+#                        int64 при флаге FLAG_TIME_INT64 (интервал больше ~24.8 суток)
+#   altitude, speed      float32 (NaN - нет значения), только при установленном флаге
+BINARY_MAGIC = b"LTRK"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sBBHIq")  # magic, version, flags, reserved, count, base_time_ms
+FLAG_ALTITUDE = 0x01
+FLAG_SPEED = 0x02
+FLAG_TIME_INT64 = 0x04
+_INT32 = np.iinfo(np.int32)
+COORDINATE_SCALE = 1e7
+
+
+def negotiate_format(format: Optional[str], accept: Optional[str]) -> str:
+    """Явный параметр format важнее заголовка Accept; по умолчанию - обычный JSON"""
+    if format:
+        return format
+    if not accept:
+        return FORMAT_JSON
+    preferences = []
+    for order, part in enumerate(accept.split(",")):
+        media_type, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        preferences.append((-quality, order, media_type.strip().lower()))
+    by_media_type = {media_type: name for name, media_type in MEDIA_TYPES.items()}
+    for quality, _, media_type in sorted(preferences):
+        if quality < 0 and media_type in by_media_type:
+            return by_media_type[media_type]
+    return FORMAT_JSON
+
+
+def point_columns(points: Sequence[Any]) -> Dict[str, np.ndarray]:
+    """Колонки точек (объектов с атрибутами latitude, longitude, timestamp, altitude, speed)"""
+    return {
+        "latitude": np.fromiter((p.latitude for p in points), dtype=np.float64, count=len(points)),
+        "longitude": np.fromiter((p.longitude for p in points), dtype=np.float64, count=len(points)),
+        "time_ms": np.fromiter(
+            (round(to_epoch_seconds(p.timestamp) * 1000) if p.timestamp is not None else 0 for p in points),
+            dtype=np.int64, count=len(points)
+        ),
+        "altitude": np.fromiter(
+            (np.nan if p.altitude is None else p.altitude for p in points), dtype=np.float64, count=len(points)
+        ),
+        "speed": np.fromiter(
+            (np.nan if p.speed is None else p.speed for p in points), dtype=np.float64, count=len(points)
+        ),
+    }
+
+
+def _time_deltas(time_ms: np.ndarray) -> np.ndarray:
+    return np.diff(time_ms, prepend=time_ms[:1])
+
+
+def encode_polyline(latitudes: Sequence[float], longitudes: Sequence[float], precision: int = 5) -> str:
+    """Google encoded polyline"""
+    factor = 10 ** precision
+    coordinates = np.empty((len(latitudes), 2), dtype=np.int64)
+    coordinates[:, 0] = np.round(np.asarray(latitudes, dtype=np.float64) * factor)
+    coordinates[:, 1] = np.round(np.asarray(longitudes, dtype=np.float64) * factor)
+    deltas = np.diff(coordinates, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Знак переносится в младший бит
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).tolist()
+
+    chunks = []
+    for value in values:
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def _nullable(values: np.ndarray) -> list:
+    return [None if v != v else v for v in values.tolist()]
+
+
+def encode_columnar(points: Sequence[Any]) -> dict:
+    """Параллельные массивы; время - мс от эпохи первой точки и далее дельты"""
+    columns = point_columns(points)
+    time_ms = columns["time_ms"]
+    return {
+        "count": len(points),
+        "latitude": columns["latitude"].tolist(),
+        "longitude": columns["longitude"].tolist(),
+        "altitude": _nullable(columns["altitude"]),
+        "speed": _nullable(columns["speed"]),
+        "time_start_ms": int(time_ms[0]) if len(points) else None,
+        "time_delta_ms": _time_deltas(time_ms).tolist(),
+    }
+
+
+def pack_binary(points: Sequence[Any]) -> bytes:
+    """Упаковывает точки в бинарный формат BINARY_MAGIC версии BINARY_VERSION"""
+    columns = point_columns(points)
+    count = len(points)
+    flags = 0
+    if count and not np.isnan(columns["altitude"]).all():
+        flags |= FLAG_ALTITUDE
+    if count and not np.isnan(columns["speed"]).all():
+        flags |= FLAG_SPEED
+    time_ms = columns["time_ms"]
+    base_time_ms = int(time_ms[0]) if count else 0
+    time_deltas = _time_deltas(time_ms)
+    if count and (time_deltas.min() < _INT32.min or time_deltas.max() > _INT32.max):
+        flags |= FLAG_TIME_INT64
+
+    parts = [
+        BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags, 0, count, base_time_ms),
+        np.round(columns["latitude"] * COORDINATE_SCALE).astype("<i4").tobytes(),
+        np.round(columns["longitude"] * COORDINATE_SCALE).astype("<i4").tobytes(),
+        time_deltas.astype("<i8" if flags & FLAG_TIME_INT64 else "<i4").tobytes(),
+    ]
+    if flags & FLAG_ALTITUDE:
+        parts.append(columns["altitude"].astype("<f4").tobytes())
+    if flags & FLAG_SPEED:
+        parts.append(columns["speed"].astype("<f4").tobytes())
+    return b"".join(parts)
+
+
+def points_response(
+    points: Sequence[Any],
+    fmt: str,
+    track_id: int,
+    precision: int = 5,
+    meta: Optional[dict] = None
+) -> Response:
+    """Ответ с точками в компактном формате; meta - дополнительные поля JSON.
+
+    Бинарный формат и NDJSON содержат только точки.
+    """
+    if fmt == FORMAT_NDJSON:
+        return streaming_points_response(points, fmt)
+    if fmt == FORMAT_BINARY:
+        return Response(
+            content=pack_binary(points),
+            media_type=MEDIA_TYPES[fmt],
+            headers={"X-Track-Id": str(track_id)}
+        )
+
+    body = jsonable_encoder(meta or {"track_id": track_id})
+    if fmt == FORMAT_POLYLINE:
+        body["count"] = len(points)
+        body["precision"] = precision
+        body["polyline"] = encode_polyline(
+            [p.latitude for p in points], [p.longitude for p in points], precision
+        )
+    else:
+        body["track_points"] = encode_columnar(points)
+    return Response(content=json.dumps(body, separators=(",", ":")), media_type=MEDIA_TYPES[fmt])
+
+
+def point_dict(point: Any) -> dict:
+    """Точка в том же виде, что и schemas.TrackPoint в JSON ответе"""
+    return {
+        "latitude": point.latitude,
+        "longitude": point.longitude,
+        "altitude": point.altitude,
+        "speed": point.speed,
+        "id": point.id,
+        "track_id": point.track_id,
+        "timestamp": point.timestamp.isoformat() if point.timestamp is not None else None,
+    }
+
+
+def _batched(points: Iterable[Any], batch_size: int) -> Iterator[list]:
+    batch = []
+    for point in points:
+        batch.append(point)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_ndjson(points: Iterable[Any], batch_size: int = 1000) -> Iterator[bytes]:
+    """NDJSON по мере чтения точек; строки отправляются пачками по batch_size"""
+    for batch in _batched(points, batch_size):
+        yield "".join(json.dumps(point_dict(p), separators=(",", ":")) + "\n" for p in batch).encode()
+
+
+def iter_json_array(points: Iterable[Any], batch_size: int = 1000) -> Iterator[bytes]:
+    """JSON массив точек, отдаваемый по частям (chunked)"""
+    yield b"["
+    first = True
+    for batch in _batched(points, batch_size):
+        chunk = ",".join(json.dumps(point_dict(p), separators=(",", ":")) for p in batch)
+        yield (chunk if first else "," + chunk).encode()
+        first = False
+    yield b"]"
+
+
+def streaming_points_response(points: Iterable[Any], fmt: str) -> StreamingResponse:
+    """Потоковый ответ: NDJSON или chunked JSON массив"""
+    if fmt == FORMAT_NDJSON:
+        return StreamingResponse(iter_ndjson(points), media_type=MEDIA_TYPES[FORMAT_NDJSON])
+    return StreamingResponse(iter_json_array(points), media_type=MEDIA_TYPES[FORMAT_JSON])
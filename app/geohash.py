@@ -0,0 +1,116 @@
+"""Geohash ячейки точек трека.
+
+Ячейка вычисляется при записи точки (track_points.geohash) и индексируется
+вместе с track_id. Поиск по области сводится к нескольким диапазонам строк
+(префиксы ячеек, покрывающих bbox) и работает на любой SQL базе.
+"""
+import math
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+PRECISION = 9  # ~5 м
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_BASE32_BYTES = np.frombuffer(BASE32.encode(), dtype=np.uint8)
+
+
+def _bits(precision: int) -> Tuple[int, int]:
+    """Число бит долготы и широты (долгота - в четных позициях, начиная с первой)"""
+    total = 5 * precision
+    return (total + 1) // 2, total // 2
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    lon_bits, lat_bits = _bits(precision)
+    return 360.0 / (1 << lon_bits), 180.0 / (1 << lat_bits)
+
+
+def _index(value: float, low: float, size: float, bits: int) -> int:
+    return min(max(int(math.floor((value - low) / size)), 0), (1 << bits) - 1)
+
+
+def _from_indices(lon_index: int, lat_index: int, precision: int) -> str:
+    lon_bits, lat_bits = _bits(precision)
+    value = 0
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            lon_bits -= 1
+            bit = (lon_index >> lon_bits) & 1
+        else:
+            lat_bits -= 1
+            bit = (lat_index >> lat_bits) & 1
+        value = (value << 1) | bit
+    return "".join(BASE32[(value >> (5 * (precision - 1 - i))) & 0x1f] for i in range(precision))
+
+
+def encode(latitude: float, longitude: float, precision: int = PRECISION) -> str:
+    lon_size, lat_size = _cell_size(precision)
+    lon_bits, lat_bits = _bits(precision)
+    return _from_indices(
+        _index(longitude, -180.0, lon_size, lon_bits),
+        _index(latitude, -90.0, lat_size, lat_bits),
+        precision
+    )
+
+
+def encode_many(latitudes: Sequence[float], longitudes: Sequence[float], precision: int = PRECISION) -> List[str]:
+    """Векторный вариант encode() для массовой записи точек"""
+    count = len(latitudes)
+    if count == 0:
+        return []
+    lon_size, lat_size = _cell_size(precision)
+    lon_bits, lat_bits = _bits(precision)
+    lon_index = np.clip(
+        np.floor((np.asarray(longitudes, dtype=np.float64) + 180.0) / lon_size), 0, (1 << lon_bits) - 1
+    ).astype(np.uint64)
+    lat_index = np.clip(
+        np.floor((np.asarray(latitudes, dtype=np.float64) + 90.0) / lat_size), 0, (1 << lat_bits) - 1
+    ).astype(np.uint64)
+
+    value = np.zeros(count, dtype=np.uint64)
+    one = np.uint64(1)
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            lon_bits -= 1
+            bit = (lon_index >> np.uint64(lon_bits)) & one
+        else:
+            lat_bits -= 1
+            bit = (lat_index >> np.uint64(lat_bits)) & one
+        value = (value << one) | bit
+
+    chars = np.empty((count, precision), dtype=np.uint8)
+    for i in range(precision):
+        shift = np.uint64(5 * (precision - 1 - i))
+        chars[:, i] = _BASE32_BYTES[((value >> shift) & np.uint64(0x1f)).astype(np.intp)]
+    return [cell.decode() for cell in chars.view(f"S{precision}").ravel()]
+
+
+def cover(
+    west: float,
+    south: float,
+    east: float,
+    north: float,
+    max_cells: int = 32
+) -> List[str]:
+    """Ячейки максимальной точности (не более max_cells), покрывающие bbox.
+
+    bbox, пересекающий антимеридиан (west > east), разбивается на две части.
+    """
+    if west > east:
+        return cover(west, south, 180.0, north, max_cells) + cover(-180.0, south, east, north, max_cells)
+    best = [""]
+    for precision in range(1, PRECISION + 1):
+        lon_size, lat_size = _cell_size(precision)
+        lon_bits, lat_bits = _bits(precision)
+        lon_range = range(_index(west, -180.0, lon_size, lon_bits), _index(east, -180.0, lon_size, lon_bits) + 1)
+        lat_range = range(_index(south, -90.0, lat_size, lat_bits), _index(north, -90.0, lat_size, lat_bits) + 1)
+        if len(lon_range) * len(lat_range) > max_cells:
+            break
+        best = sorted(_from_indices(i, j, precision) for i in lon_range for j in lat_range)
+    return best
+
+
+def cell_range(prefix: str) -> Tuple[str, str]:
+    """Границы (включительно) значений geohash с данным префиксом"""
+    padding = PRECISION - len(prefix)
+    return prefix + BASE32[0] * padding, prefix + BASE32[-1] * padding
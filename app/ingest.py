@@ -0,0 +1,288 @@
+"""Массовая запись точек трека.
+
+Точки пишутся одним запросом, без создания ORM объектов:
+- PostgreSQL (psycopg2): COPY track_points FROM STDIN;
+- остальные БД: Core insert() с executemany.
+
+Ячейка geohash точки вычисляется здесь же (векторно, см. app.geohash).
+Перед записью точки проходят фильтр шума GPS трека (app.point_filter).
+Статистика трека (track_stats) обновляется в той же транзакции.
+Commit выполняет вызывающий код.
+
+Входные форматы, кроме JSON: NDJSON/CSV (PointStreamParser) и бинарный
+формат трекеров (decode_binary).
+"""
+import csv
+import io
+import json
+import struct
+from datetime import datetime, timezone
+from typing import Any, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app import geohash, models, point_filter, track_stats
+
+POINT_COLUMNS = ("track_id", "latitude", "longitude", "timestamp", "altitude", "speed", "geohash")
+
+
+def _value(point: Any, name: str) -> Any:
+    if isinstance(point, dict):
+        return point.get(name)
+    return getattr(point, name, None)
+
+
+def build_rows(track_id: int, points: Iterable[Any], default_timestamp: Optional[datetime] = None) -> List[dict]:
+    """Готовит строки для вставки из Pydantic объектов или словарей.
+
+    Точки без времени получают default_timestamp (по умолчанию - текущее UTC время).
+    """
+    default_timestamp = default_timestamp or datetime.utcnow()
+    rows = []
+    for point in points:
+        rows.append({
+            "track_id": track_id,
+            "latitude": _value(point, "latitude"),
+            "longitude": _value(point, "longitude"),
+            "timestamp": _value(point, "timestamp") or default_timestamp,
+            "altitude": _value(point, "altitude"),
+            "speed": _value(point, "speed"),
+        })
+    cells = geohash.encode_many([row["latitude"] for row in rows], [row["longitude"] for row in rows])
+    for row, cell in zip(rows, cells):
+        row["geohash"] = cell
+    return rows
+
+
+def _copy_rows(db: Session, rows: List[dict]) -> None:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # В формате CSV пустое значение без кавычек - это NULL
+        writer.writerow(["" if row[column] is None else row[column] for column in POINT_COLUMNS])
+    buffer.seek(0)
+
+    connection = db.connection().connection.driver_connection
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {models.TrackPoint.__tablename__} ({', '.join(POINT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+def supports_copy(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def insert_rows(db: Session, track_id: int, rows: List[dict]) -> List[dict]:
+    """Записывает подготовленные строки и учитывает их в статистике трека (без commit).
+
+    Строки проходят фильтр шума трека (app.point_filter); возвращаются
+    записанные строки - их и нужно публиковать подписчикам (app.live).
+    """
+    rows = point_filter.filter_rows(db, track_id, rows)
+    if not rows:
+        return []
+    if supports_copy(db):
+        _copy_rows(db, rows)
+    else:
+        db.execute(insert(models.TrackPoint.__table__), rows)
+    track_stats.record_points(db, track_id, rows)
+    return rows
+
+
+def insert_points(db: Session, track_id: int, points: Iterable[Any]) -> List[dict]:
+    """Записывает точки трека одним запросом (без commit), возвращает записанные строки"""
+    return insert_rows(db, track_id, build_rows(track_id, points))
+
+
+def validate_point(index: int, latitude: float, longitude: float) -> None:
+    """Проверка координат точки; ValueError с тем же текстом, что и в upload_track"""
+    if not (-90 <= latitude <= 90):
+        raise ValueError(f"Invalid latitude at point {index}: {latitude}")
+    if not (-180 <= longitude <= 180):
+        raise ValueError(f"Invalid longitude at point {index}: {longitude}")
+
+
+def _parse_float(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if not isinstance(value, (int, float)):
+        try:
+            value = float(value)
+        except ValueError:
+            return datetime.fromisoformat(value)
+    try:
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    except (OverflowError, OSError):
+        # Эпоха вне диапазона datetime / time_t платформы
+        raise ValueError(f"Timestamp out of range: {value}")
+
+
+class PointStreamParser:
+    """Инкрементальный разбор точек из NDJSON или CSV (с заголовком).
+
+    feed() принимает очередной кусок тела запроса и возвращает точки из
+    завершенных строк; в памяти хранится только незавершенная строка.
+    """
+
+    def __init__(self, fmt: str = "ndjson", max_line_bytes: int = 64 * 1024):
+        if fmt not in ("ndjson", "csv"):
+            raise ValueError(f"Unsupported stream format: {fmt}")
+        self.fmt = fmt
+        self.max_line_bytes = max_line_bytes
+        self.count = 0
+        self._line_number = 0
+        self._header: Optional[List[str]] = None
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split(b"\n")
+        if len(self._buffer) > self.max_line_bytes:
+            raise ValueError(f"Line {self._line_number + len(lines) + 1} is too long")
+        return self._parse_lines(lines)
+
+    def close(self) -> List[dict]:
+        tail, self._buffer = self._buffer, b""
+        return self._parse_lines([tail])
+
+    def _parse_lines(self, lines: List[bytes]) -> List[dict]:
+        points = []
+        for raw in lines:
+            self._line_number += 1
+            line = raw.decode("utf-8").strip()
+            if not line:
+                continue
+            point = self._parse_line(line)
+            if point is not None:
+                validate_point(self.count, point["latitude"], point["longitude"])
+                self.count += 1
+                points.append(point)
+        return points
+
+    def _parse_line(self, line: str) -> Optional[dict]:
+        if self.fmt == "csv":
+            values = next(csv.reader([line]))
+            if self._header is None:
+                self._header = [name.strip().lower() for name in values]
+                if "latitude" not in self._header or "longitude" not in self._header:
+                    raise ValueError("CSV header must contain latitude and longitude")
+                return None
+            data = dict(zip(self._header, values))
+        else:
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError(f"Invalid JSON at line {self._line_number}")
+            if not isinstance(data, dict):
+                raise ValueError(f"Invalid point at line {self._line_number}")
+        try:
+            return {
+                "latitude": float(data["latitude"]),
+                "longitude": float(data["longitude"]),
+                "timestamp": _parse_timestamp(data.get("timestamp")),
+                "altitude": _parse_float(data.get("altitude")),
+                "speed": _parse_float(data.get("speed")),
+            }
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            raise ValueError(f"Invalid point at line {self._line_number}")
+
+
+# Бинарный формат загрузки с трекеров (POST /tracks/load_from_tracker/binary):
+# заголовок BINARY_HEADER и далее count записей фиксированной длины (little-endian):
+#   latitude, longitude  int32   (микроградусы: градусы * 1e6)
+#   time_delta           uint16  (в единицах time_unit_ms от предыдущей точки, у первой - от base_time_ms)
+#   altitude, speed      float32 (NaN - нет значения), только при установленном флаге
+# Запись целиком удобно дописывать на устройстве по мере получения координат.
+BINARY_MAGIC = b"LTRI"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sBBHIq")  # magic, version, flags, time_unit_ms, count, base_time_ms
+BINARY_MEDIA_TYPE = "application/vnd.locationtracker.ingest"
+FLAG_ALTITUDE = 0x01
+FLAG_SPEED = 0x02
+COORDINATE_SCALE = 1e6
+# Время точек (мс от эпохи) - в пределах datetime: годы 1..9999
+_MIN_TIME_MS = int((datetime(1, 1, 1, tzinfo=timezone.utc) - datetime(1970, 1, 1, tzinfo=timezone.utc)).total_seconds() * 1000)
+_MAX_TIME_MS = int((datetime(9999, 12, 31, 23, 59, 59, 999000, tzinfo=timezone.utc) - datetime(1970, 1, 1, tzinfo=timezone.utc)).total_seconds() * 1000)
+
+# Поля записи по версиям формата; новые версии добавляются сюда
+_RECORD_FIELDS = {
+    1: [("latitude", "<i4"), ("longitude", "<i4"), ("time_delta", "<u2")],
+}
+_OPTIONAL_FIELDS = {
+    1: [(FLAG_ALTITUDE, ("altitude", "<f4")), (FLAG_SPEED, ("speed", "<f4"))],
+}
+
+
+def binary_record_dtype(version: int, flags: int) -> np.dtype:
+    """Тип записи точки для версии формата и флагов (без выравнивания)"""
+    fields = list(_RECORD_FIELDS[version])
+    fields.extend(field for flag, field in _OPTIONAL_FIELDS[version] if flags & flag)
+    return np.dtype(fields)
+
+
+def _nullable(values: np.ndarray) -> list:
+    return [None if value != value else value for value in values.tolist()]
+
+
+def decode_binary(data: bytes, max_points: Optional[int] = None) -> List[dict]:
+    """Точки из бинарного формата загрузки (словари для insert_points); ValueError при ошибке формата"""
+    if len(data) < BINARY_HEADER.size:
+        raise ValueError("Binary chunk is too short")
+    magic, version, flags, time_unit_ms, count, base_time_ms = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC:
+        raise ValueError("Invalid binary chunk magic")
+    if version not in _RECORD_FIELDS:
+        raise ValueError(f"Unsupported binary chunk version: {version}")
+    known_flags = 0
+    for flag, _ in _OPTIONAL_FIELDS[version]:
+        known_flags |= flag
+    if flags & ~known_flags:
+        raise ValueError(f"Unsupported binary chunk flags: {flags:#x}")
+    if time_unit_ms == 0:
+        raise ValueError("time_unit_ms must be positive")
+    if max_points is not None and count > max_points:
+        raise ValueError(f"Binary chunk cannot contain more than {max_points} points")
+    dtype = binary_record_dtype(version, flags)
+    if len(data) != BINARY_HEADER.size + count * dtype.itemsize:
+        raise ValueError(f"Binary chunk size does not match {count} points")
+
+    records = np.frombuffer(data, dtype=dtype, count=count, offset=BINARY_HEADER.size)
+    latitudes = records["latitude"] / COORDINATE_SCALE
+    longitudes = records["longitude"] / COORDINATE_SCALE
+    invalid = np.flatnonzero((np.abs(latitudes) > 90) | (np.abs(longitudes) > 180))
+    if len(invalid):
+        index = int(invalid[0])
+        validate_point(index, float(latitudes[index]), float(longitudes[index]))
+    if not _MIN_TIME_MS <= base_time_ms <= _MAX_TIME_MS:
+        raise ValueError(f"base_time_ms out of range: {base_time_ms}")
+    # int64 не переполняется: сумма приращений не больше count * 65535 * 65535, count ограничен размером тела
+    time_ms = base_time_ms + np.cumsum(records["time_delta"], dtype=np.int64) * time_unit_ms
+    if count and time_ms[-1] > _MAX_TIME_MS:
+        raise ValueError("Point timestamps out of range")
+    timestamps = time_ms.astype("datetime64[ms]").astype("datetime64[us]").tolist()
+    missing = [None] * count
+    altitudes = _nullable(records["altitude"]) if flags & FLAG_ALTITUDE else missing
+    speeds = _nullable(records["speed"]) if flags & FLAG_SPEED else missing
+
+    return [
+        {
+            "latitude": latitude,
+            "longitude": longitude,
+            "timestamp": timestamp.replace(tzinfo=timezone.utc),
+            "altitude": altitude,
+            "speed": speed,
+        }
+        for latitude, longitude, timestamp, altitude, speed
+        in zip(latitudes.tolist(), longitudes.tolist(), timestamps, altitudes, speeds)
+    ]
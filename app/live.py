@@ -0,0 +1,168 @@
+"""In-process pub/sub для живого отслеживания (WebSocket и SSE).
+
+Записи точек и местоположений публикуются после commit. Подписчик получает
+события своего пользователя целиком (topic ("user", user_id)) или одного
+трека (("track", user_id, track_id)) - чужой трек подписчику недоступен,
+так как в ключе темы всегда есть владелец.
+
+У каждого подписчика своя ограниченная очередь:
+- события местоположения схлопываются (в очереди остается только последнее);
+- точки одного трека, ожидающие отправки, объединяются в одно событие
+  (не больше settings.live_max_batch_points точек, старые отбрасываются);
+- при переполнении очереди отбрасываются самые старые события.
+
+Публиковать можно из любого потока: события передаются в event loop
+подписчика через call_soon_threadsafe. Брокер работает в пределах одного
+процесса; при нескольких воркерах подписчик видит записи своего воркера.
+"""
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import settings
+
+EVENT_POINTS = "points"
+EVENT_LOCATION = "location"
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def point_payload(point: Any) -> dict:
+    """Точка (ORM объект, строка или словарь) в виде JSON-совместимого словаря"""
+    def value(name):
+        return point.get(name) if isinstance(point, dict) else getattr(point, name, None)
+
+    return {
+        "latitude": value("latitude"),
+        "longitude": value("longitude"),
+        "timestamp": _isoformat(value("timestamp")),
+        "altitude": value("altitude"),
+        "speed": value("speed"),
+    }
+
+
+class Subscription:
+    """Очередь событий одного подписчика (живет в event loop подписчика)"""
+
+    def __init__(self, topic: Tuple, maxsize: int, loop: asyncio.AbstractEventLoop):
+        self.topic = topic
+        self.maxsize = maxsize
+        self.loop = loop
+        self.dropped = 0
+        self.coalesced = 0
+        self._events: deque = deque()
+        self._ready = asyncio.Event()
+
+    def _push(self, event: dict) -> None:
+        if event["type"] == EVENT_LOCATION:
+            for pending in self._events:
+                if pending["type"] == EVENT_LOCATION:
+                    pending["location"] = event["location"]
+                    self.coalesced += 1
+                    return
+        elif self._events:
+            last = self._events[-1]
+            if last["type"] == EVENT_POINTS and last["track_id"] == event["track_id"]:
+                points = last["points"] + event["points"]
+                overflow = len(points) - settings.live_max_batch_points
+                if overflow > 0:
+                    points = points[overflow:]
+                    self.dropped += overflow
+                last["points"] = points
+                self.coalesced += 1
+                return
+        self._events.append(event)
+        while len(self._events) > self.maxsize:
+            self._events.popleft()
+            self.dropped += 1
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Следующее событие или None по истечении timeout"""
+        while not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self._events.popleft()
+
+
+class Broker:
+    def __init__(self):
+        self._subscriptions: Dict[Tuple, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, topic: Tuple, maxsize: Optional[int] = None) -> Subscription:
+        subscription = Subscription(topic, maxsize or settings.live_queue_size, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.topic]
+
+    def publish(self, topics: Iterable[Tuple], event: dict) -> None:
+        with self._lock:
+            targets = [s for topic in topics for s in self._subscriptions.get(topic, ())]
+        self.published += 1
+        for subscription in targets:
+            # Каждому подписчику - своя копия: очереди изменяют события при схлопывании
+            copy = dict(event)
+            if "points" in copy:
+                copy["points"] = list(copy["points"])
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._push, copy)
+            except RuntimeError:
+                # event loop подписчика уже закрыт
+                self.unsubscribe(subscription)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscriptions = [s for group in self._subscriptions.values() for s in group]
+        return {
+            "subscribers": len(subscriptions),
+            "published": self.published,
+            "dropped": sum(s.dropped for s in subscriptions),
+            "coalesced": sum(s.coalesced for s in subscriptions),
+        }
+
+
+broker = Broker()
+
+
+def user_topic(user_id: int) -> Tuple:
+    return ("user", user_id)
+
+
+def track_topic(user_id: int, track_id: int) -> Tuple:
+    return ("track", user_id, track_id)
+
+
+def publish_points(user_id: int, track_id: int, points: Iterable[Any]) -> None:
+    payload: List[dict] = [point_payload(point) for point in points]
+    if not payload:
+        return
+    broker.publish(
+        (user_topic(user_id), track_topic(user_id, track_id)),
+        {"type": EVENT_POINTS, "track_id": track_id, "points": payload}
+    )
+
+
+def publish_location(user_id: int, location: Any) -> None:
+    data = location.model_dump(mode="json") if hasattr(location, "model_dump") else dict(location)
+    broker.publish((user_topic(user_id),), {"type": EVENT_LOCATION, "location": data})
+
+
+def stats() -> dict:
+    return broker.stats()
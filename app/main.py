@@ -4,8 +4,9 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
-from app import models
-from app.api import auth, locations, tracks, maps
+from app import live, models, partitions, point_filter, principals, write_behind
+from app.compression import CompressionMiddleware
+from app.api import auth, locations, tracks, maps, stats, async_locations, async_tracks, live as live_api
 from app.config import settings
 from app.database import engine, get_db
 
@@ -15,6 +16,8 @@ logger = logging.getLogger(__name__)
 
 # Создаем таблицы в базе данных
 models.Base.metadata.create_all(bind=engine)
+if settings.track_points_partitioning:
+    partitions.setup(engine)
 
 # Создаем FastAPI приложение
 app = FastAPI(
@@ -30,13 +33,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+# Распаковка тел запросов и сжатие ответов (gzip, zstd)
+app.add_middleware(CompressionMiddleware)
 
 # Подключаем роуты
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Аутентификация"])
-app.include_router(locations.router, prefix="/api/v1/locations", tags=["Местоположения"])
+if settings.async_database:
+    app.include_router(async_locations.router, prefix="/api/v1/locations", tags=["Местоположения"])
+    # Асинхронные эндпоинты треков имеют приоритет над одноименными синхронными
+    app.include_router(async_tracks.router, prefix="/api/v1/tracks", tags=["Треки"])
+else:
+    app.include_router(locations.router, prefix="/api/v1/locations", tags=["Местоположения"])
 app.include_router(tracks.router, prefix="/api/v1/tracks", tags=["Треки"])
 app.include_router(maps.router, prefix="/api/v1/maps", tags=["Карты"])
+app.include_router(stats.router, prefix="/api/v1/stats", tags=["Статистика"])
+app.include_router(live_api.router, prefix="/api/v1/live", tags=["Живое отслеживание"])
 
 # Health check эндпоинт
 @app.get("/health")
@@ -45,9 +58,18 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "Location Tracker API",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "auth_cache": principals.stats(),
+        "live": live.stats(),
+        "write_behind": write_behind.stats() if settings.write_behind else None,
+        "point_filter": point_filter.stats()
     }
 
+@app.on_event("shutdown")
+def flush_write_behind():
+    """Ожидающие точки записываются до остановки"""
+    write_behind.writer.close()
+
 # Корневой эндпоинт
 @app.get("/")
 async def root():
@@ -0,0 +1,83 @@
+"""Кэш готового HTML карт треков.
+
+Ключ содержит id трека, владельца и время создания трека (SQLite может
+выдать id удаленного трека новому), версию статистики трека (растет при добавлении
+точек) и параметры отрисовки, поэтому устаревшие карты никогда не
+отдаются. Память ограничена по числу записей и суммарному размеру HTML
+в байтах (UTF-8); дополнительно можно включить дисковый кэш (settings.map_cache_dir).
+"""
+import contextlib
+import glob
+import hashlib
+import os
+from typing import Any, Optional, Tuple
+
+from app.cache import LRUCache
+from app.config import settings
+
+
+
+def _html_size(html: str) -> int:
+    return len(html.encode("utf-8"))
+
+
+cache = LRUCache(settings.map_cache_entries, max_bytes=settings.map_cache_bytes, sizeof=_html_size)
+
+
+def track_key(track: Any, version: int, *params) -> Tuple:
+    created = track.created_at.isoformat() if track.created_at is not None else None
+    return ("track", track.id, version, track.user_id, created) + params
+
+
+def etag(key: Tuple) -> str:
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f'"{key[0]}-{key[1]}-v{key[2]}-{digest}"'
+
+
+def _disk_path(key: Tuple) -> Optional[str]:
+    if not settings.map_cache_dir:
+        return None
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()
+    return os.path.join(settings.map_cache_dir, f"{key[0]}-{key[1]}-v{key[2]}-{digest}.html")
+
+
+def get(key: Tuple) -> Optional[str]:
+    html = cache.get(key)
+    if html is not None:
+        return html
+    path = _disk_path(key)
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            html = f.read()
+        cache.set(key, html)
+    return html
+
+
+def put(key: Tuple, html: str) -> None:
+    cache.set(key, html)
+    path = _disk_path(key)
+    if not path:
+        return
+    os.makedirs(settings.map_cache_dir, exist_ok=True)
+    # Файлы прежних версий этого трека больше не понадобятся
+    for stale in glob.glob(os.path.join(settings.map_cache_dir, f"{key[0]}-{key[1]}-v*.html")):
+        if not os.path.basename(stale).startswith(f"{key[0]}-{key[1]}-v{key[2]}-"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(stale)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    os.replace(tmp_path, path)
+
+
+def invalidate_track(track_id: int) -> None:
+    """Удаляет все карты трека (при удалении трека)"""
+    cache.discard_where(lambda key, html: key[0] == "track" and key[1] == track_id)
+    if settings.map_cache_dir:
+        for path in glob.glob(os.path.join(settings.map_cache_dir, f"track-{track_id}-v*.html")):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+def stats() -> dict:
+    return cache.stats()
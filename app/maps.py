@@ -1,5 +1,5 @@
 import folium
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 
 from app import models
 
@@ -23,7 +23,7 @@ def create_location_map(location: models.Location, zoom: int = 15) -> str:
     return map_obj._repr_html_()
 
 
-def create_track_map(track: models.Track, track_points: List[models.TrackPoint], zoom: int = 13) -> str:
+def create_track_map(track: models.Track, track_points: List[models.TrackPoint], zoom: Optional[int] = None) -> str:
     """Создает карту с треком"""
     if not track_points:
         return "<p>Нет данных трека для отображения</p>"
@@ -35,7 +35,7 @@ def create_track_map(track: models.Track, track_points: List[models.TrackPoint],
     
     map_obj = folium.Map(
         location=[center_lat, center_lon],
-        zoom_start=zoom,
+        zoom_start=13 if zoom is None else zoom,
         tiles='OpenStreetMap'
     )
     
@@ -80,16 +80,28 @@ def create_track_map(track: models.Track, track_points: List[models.TrackPoint],
     return map_obj._repr_html_()
 
 
-def create_multi_track_map(tracks: List[models.Track], zoom: int = 12) -> str:
-    """Создает карту с несколькими треками"""
+def create_multi_track_map(
+    tracks: List[models.Track],
+    zoom: int = 12,
+    points_by_track: Optional[Dict[int, List[Tuple[float, float]]]] = None
+) -> str:
+    """Создает карту с несколькими треками.
+
+    points_by_track - координаты треков по id; если не задано, берутся track.track_points.
+    """
     if not tracks:
         return "<p>Нет треков для отображения</p>"
     
+    if points_by_track is None:
+        points_by_track = {
+            track.id: [(point.latitude, point.longitude) for point in track.track_points]
+            for track in tracks
+        }
+    
     # Находим границы всех треков
     all_coordinates = []
     for track in tracks:
-        for point in track.track_points:
-            all_coordinates.append((point.latitude, point.longitude))
+        all_coordinates.extend(points_by_track.get(track.id, []))
     
     if not all_coordinates:
         return "<p>Нет данных треков для отображения</p>"
@@ -108,10 +120,10 @@ def create_multi_track_map(tracks: List[models.Track], zoom: int = 12) -> str:
     colors = ['blue', 'red', 'green', 'purple', 'orange', 'darkred', 'lightred', 'beige', 'darkblue', 'darkgreen']
     
     for i, track in enumerate(tracks):
-        if not track.track_points:
+        coordinates = points_by_track.get(track.id)
+        if not coordinates:
             continue
-            
-        coordinates = [(point.latitude, point.longitude) for point in track.track_points]
+        
         color = colors[i % len(colors)]
         
         # Добавляем линию трека
@@ -0,0 +1,166 @@
+"""Расчет метрик трека: расстояние, длительность, скорости и азимуты.
+
+Координаты и время загружаются колонками (без ORM объектов) и обрабатываются
+одним векторизованным проходом NumPy. Если NumPy недоступен, используется
+эквивалентная реализация на чистом Python (та же формула haversine, что и в
+models.TrackPoint.distance_to).
+"""
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy ставится вместе с folium
+    np = None
+
+EARTH_RADIUS = 6371000  # Радиус Земли в метрах
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=timezone.utc)
+
+
+@dataclass
+class TrackMetrics:
+    """Метрики трека. Массивы сегментов имеют длину n - 1, кумулятивные - n.
+
+    В NumPy режиме массивы остаются numpy.ndarray, в fallback режиме - списками.
+    """
+    points_count: int = 0
+    distance: float = 0.0  # метры
+    duration: float = 0.0  # секунды
+    cumulative_distance: List[float] = field(default_factory=list)
+    segment_distances: List[float] = field(default_factory=list)
+    segment_durations: List[float] = field(default_factory=list)
+    segment_speeds: List[float] = field(default_factory=list)  # м/с, NaN если dt <= 0
+    bearings: List[float] = field(default_factory=list)  # градусы 0..360
+
+
+def to_epoch_seconds(timestamp: Optional[datetime]) -> float:
+    """Переводит datetime в секунды UNIX. Наивное время считается UTC (SQLite)."""
+    if timestamp is None:
+        return math.nan
+    if timestamp.tzinfo is None:
+        return (timestamp - _EPOCH).total_seconds()
+    return (timestamp - _EPOCH_UTC).total_seconds()
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние между двумя точками в метрах (haversine)"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS * c
+
+
+def bearing(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Начальный азимут от первой точки ко второй в градусах"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_lambda = math.radians(lon2 - lon1)
+    x = math.sin(d_lambda) * math.cos(phi2)
+    y = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(d_lambda)
+    return (math.degrees(math.atan2(x, y)) + 360) % 360
+
+
+def haversine_array(latitudes, longitudes):
+    """Длины сегментов ломаной в метрах (NumPy)"""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    d_phi = np.diff(lat)
+    d_lambda = np.diff(lon)
+    a = np.sin(d_phi / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(d_lambda / 2) ** 2
+    # Защита от выхода за [0, 1] из-за погрешности округления
+    a = np.clip(a, 0.0, 1.0)
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def path_length(latitudes: Sequence[float], longitudes: Sequence[float]) -> float:
+    """Длина ломаной в метрах"""
+    if len(latitudes) < 2:
+        return 0.0
+    if np is not None:
+        return float(haversine_array(latitudes, longitudes).sum())
+    return sum(
+        haversine(latitudes[i], longitudes[i], latitudes[i + 1], longitudes[i + 1])
+        for i in range(len(latitudes) - 1)
+    )
+
+
+def _bearing_array(latitudes, longitudes):
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    d_lambda = np.diff(lon)
+    x = np.sin(d_lambda) * np.cos(lat[1:])
+    y = np.cos(lat[:-1]) * np.sin(lat[1:]) - np.sin(lat[:-1]) * np.cos(lat[1:]) * np.cos(d_lambda)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+def _compute_numpy(latitudes, longitudes, seconds) -> TrackMetrics:
+    segment_distances = haversine_array(latitudes, longitudes)
+    cumulative = np.concatenate(([0.0], np.cumsum(segment_distances)))
+    ts = np.asarray(seconds, dtype=np.float64)
+    segment_durations = np.diff(ts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speeds = np.where(segment_durations > 0, segment_distances / segment_durations, np.nan)
+    duration = float(ts[-1] - ts[0]) if len(ts) else 0.0
+    return TrackMetrics(
+        points_count=len(ts),
+        distance=float(cumulative[-1]),
+        duration=0.0 if math.isnan(duration) else duration,
+        cumulative_distance=cumulative,
+        segment_distances=segment_distances,
+        segment_durations=segment_durations,
+        segment_speeds=speeds,
+        bearings=_bearing_array(latitudes, longitudes),
+    )
+
+
+def _compute_python(latitudes, longitudes, seconds) -> TrackMetrics:
+    metrics = TrackMetrics(points_count=len(seconds), cumulative_distance=[0.0])
+    total = 0.0
+    for i in range(len(seconds) - 1):
+        d = haversine(latitudes[i], longitudes[i], latitudes[i + 1], longitudes[i + 1])
+        dt = seconds[i + 1] - seconds[i]
+        total += d
+        metrics.segment_distances.append(d)
+        metrics.segment_durations.append(dt)
+        metrics.segment_speeds.append(d / dt if dt > 0 else math.nan)
+        metrics.bearings.append(bearing(latitudes[i], longitudes[i], latitudes[i + 1], longitudes[i + 1]))
+        metrics.cumulative_distance.append(total)
+    metrics.distance = total
+    duration = seconds[-1] - seconds[0]
+    metrics.duration = 0.0 if math.isnan(duration) else duration
+    return metrics
+
+
+def compute_track_metrics(
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    timestamps: Sequence[Optional[datetime]],
+    use_numpy: Optional[bool] = None
+) -> TrackMetrics:
+    """Считает метрики трека по колонкам координат и времени.
+
+    use_numpy=None выбирает NumPy, если он установлен.
+    """
+    if not timestamps:
+        return TrackMetrics()
+    seconds = [to_epoch_seconds(ts) for ts in timestamps]
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        return _compute_numpy(latitudes, longitudes, seconds)
+    return _compute_python(list(latitudes), list(longitudes), seconds)
+
+
+def metrics_from_rows(rows, use_numpy: Optional[bool] = None) -> TrackMetrics:
+    """Считает метрики по строкам (latitude, longitude, timestamp)"""
+    if not rows:
+        return TrackMetrics()
+    latitudes, longitudes, timestamps = zip(*rows)
+    return compute_track_metrics(latitudes, longitudes, timestamps, use_numpy=use_numpy)
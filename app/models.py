@@ -1,9 +1,17 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, Date, Integer, String, Float, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-import math
 
+from app import geohash
 from app.database import Base
+from app.metrics import haversine
+
+
+def _point_geohash(context) -> str:
+    params = context.get_current_parameters()
+    return geohash.encode(params["latitude"], params["longitude"])
 
 
 class User(Base):
@@ -28,7 +36,14 @@ class Location(Base):
     name = Column(String, default="Current Location")
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    # Время задается приложением, чтобы у всех записей была одинаковая точность
+    # (SQLite хранит CURRENT_TIMESTAMP без долей секунды, что ломает сравнение с курсором)
+    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+
+    __table_args__ = (
+        # История и текущее местоположение пользователя (keyset по timestamp, id)
+        Index("ix_locations_user_id_timestamp_id", "user_id", "timestamp", "id"),
+    )
     
     # Relationships
     user = relationship("User", back_populates="locations")
@@ -46,6 +61,10 @@ class Track(Base):
     # Relationships
     user = relationship("User", back_populates="tracks")
     track_points = relationship("TrackPoint", back_populates="track", cascade="all, delete-orphan")
+    stats = relationship("TrackStats", back_populates="track", uselist=False, cascade="all, delete-orphan")
+    upload_sessions = relationship("UploadSession", back_populates="track", cascade="all, delete-orphan")
+    daily_stats = relationship("TrackDailyStats", back_populates="track", cascade="all, delete-orphan")
+    point_filter = relationship("PointFilter", back_populates="track", uselist=False, cascade="all, delete-orphan")
 
 
 class TrackPoint(Base):
@@ -58,18 +77,146 @@ class TrackPoint(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     altitude = Column(Float, nullable=True)
     speed = Column(Float, nullable=True)
+    # Ячейка geohash (app.geohash.PRECISION знаков) для поиска по области
+    geohash = Column(String(12), nullable=True, default=_point_geohash)
 
+    __table_args__ = (
+        Index("ix_track_points_geohash_track_id", "geohash", "track_id"),
+        # Точки трека по времени, интервалы и min/max времени
+        Index("ix_track_points_track_id_timestamp", "track_id", "timestamp"),
+    )
     
     # Relationships
     track = relationship("Track", back_populates="track_points")
 
     def distance_to(self, other: "TrackPoint") -> float:
         """Вычисляет расстояние до другой точки в метрах (haversine)."""
-        R = 6371000  # Радиус Земли в метрах
-        phi1 = math.radians(self.latitude)
-        phi2 = math.radians(other.latitude)
-        d_phi = math.radians(other.latitude - self.latitude)
-        d_lambda = math.radians(other.longitude - self.longitude)
-        a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c 
\ No newline at end of file
+        return haversine(self.latitude, self.longitude, other.latitude, other.longitude)
+
+
+class TrackStats(Base):
+    """Сводная статистика трека, обновляется инкрементально при добавлении точек"""
+    __tablename__ = "track_stats"
+
+    track_id = Column(Integer, ForeignKey("tracks.id", ondelete="CASCADE"), primary_key=True)
+    points_count = Column(Integer, nullable=False, default=0)
+    distance = Column(Float, nullable=False, default=0.0)  # метры
+    duration = Column(Float, nullable=False, default=0.0)  # секунды
+    start_time = Column(DateTime(timezone=True), nullable=True)
+    end_time = Column(DateTime(timezone=True), nullable=True)
+    min_latitude = Column(Float, nullable=True)
+    max_latitude = Column(Float, nullable=True)
+    min_longitude = Column(Float, nullable=True)
+    max_longitude = Column(Float, nullable=True)
+    min_altitude = Column(Float, nullable=True)
+    max_altitude = Column(Float, nullable=True)
+    max_speed = Column(Float, nullable=True)
+    # Последняя добавленная точка - от нее продолжается расчет расстояния
+    last_latitude = Column(Float, nullable=True)
+    last_longitude = Column(Float, nullable=True)
+    last_timestamp = Column(DateTime(timezone=True), nullable=True)
+    # Точки, отброшенные фильтром при записи (app.point_filter)
+    dropped_stationary = Column(Integer, nullable=False, default=0)  # дубликаты и стоянка
+    dropped_outliers = Column(Integer, nullable=False, default=0)  # недостижимая скорость
+    # Увеличивается при каждом добавлении точек (для инвалидации кэшей)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationships
+    track = relationship("Track", back_populates="stats")
+
+
+
+class UploadSession(Base):
+    """Сессия возобновляемой загрузки трека с устройства (load_from_tracker)"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    upload_id = Column(String(64), nullable=False)
+    track_id = Column(Integer, ForeignKey("tracks.id", ondelete="CASCADE"), nullable=False)
+    # Номер последнего записанного чанка; -1 - ни одного
+    last_seq = Column(Integer, nullable=False, default=-1)
+    points_count = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "upload_id", name="uq_upload_sessions_user_id_upload_id"),
+    )
+
+    # Relationships
+    track = relationship("Track", back_populates="upload_sessions")
+
+
+class TrackDailyStats(Base):
+    """Вклад трека в статистику пользователя за день (UTC), см. app.rollups"""
+    __tablename__ = "track_daily_stats"
+
+    track_id = Column(Integer, ForeignKey("tracks.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    distance = Column(Float, nullable=False, default=0.0)  # метры
+    moving_time = Column(Float, nullable=False, default=0.0)  # секунды
+    points_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_track_daily_stats_user_id_day", "user_id", "day"),
+    )
+
+    # Relationships
+    track = relationship("Track", back_populates="daily_stats")
+
+
+class UserDailyStats(Base):
+    """Активность пользователя за день (UTC)"""
+    __tablename__ = "user_daily_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    distance = Column(Float, nullable=False, default=0.0)
+    moving_time = Column(Float, nullable=False, default=0.0)
+    points_count = Column(Integer, nullable=False, default=0)
+    tracks_count = Column(Integer, nullable=False, default=0)
+
+
+class UserWeeklyStats(Base):
+    """Активность пользователя за ISO неделю (week - понедельник недели)"""
+    __tablename__ = "user_weekly_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    week = Column(Date, primary_key=True)
+    distance = Column(Float, nullable=False, default=0.0)
+    moving_time = Column(Float, nullable=False, default=0.0)
+    points_count = Column(Integer, nullable=False, default=0)
+    tracks_count = Column(Integer, nullable=False, default=0)
+
+
+class PointFilter(Base):
+    """Настройки фильтра точек при записи: пользователя (track_id NULL) или трека.
+
+    NULL в поле - значение наследуется (трек -> пользователь -> settings).
+    """
+    __tablename__ = "point_filters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    track_id = Column(Integer, ForeignKey("tracks.id", ondelete="CASCADE"), nullable=True)
+    enabled = Column(Boolean, nullable=True)
+    min_distance = Column(Float, nullable=True)  # метры
+    max_speed = Column(Float, nullable=True)  # м/с
+    smoothing = Column(Boolean, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "track_id", name="uq_point_filters_user_id_track_id"),
+        # NULL в track_id различны для UniqueConstraint: одна строка пользователя - отдельным индексом
+        Index(
+            "uq_point_filters_user_id_default", "user_id", unique=True,
+            sqlite_where=track_id.is_(None), postgresql_where=track_id.is_(None)
+        ),
+    )
+
+    # Relationships
+    track = relationship("Track", back_populates="point_filter")
@@ -0,0 +1,44 @@
+"""Курсорная (keyset) пагинация по (timestamp, id).
+
+Курсор - непрозрачная строка с timestamp и id последней выданной записи.
+Следующая страница выбирается условием "(timestamp, id) меньше курсора",
+поэтому глубокие страницы читаются по индексу так же быстро, как первая.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(timestamp: datetime, id: int) -> str:
+    raw = json.dumps([timestamp.isoformat(), id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """ValueError, если курсор поврежден"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(id)
+    except (TypeError, ValueError, json.JSONDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def before(timestamp_column, id_column, cursor: Optional[str]):
+    """Условие "(timestamp, id) < курсора" для сортировки по убыванию; None без курсора"""
+    if not cursor:
+        return None
+    timestamp, id = decode_cursor(cursor)
+    return or_(timestamp_column < timestamp, and_(timestamp_column == timestamp, id_column < id))
+
+
+def next_cursor(items: list, limit: int) -> Optional[str]:
+    """Курсор следующей страницы, если текущая заполнена целиком"""
+    if len(items) < limit or not items:
+        return None
+    return encode_cursor(items[-1].timestamp, items[-1].id)
@@ -0,0 +1,263 @@
+"""Помесячное секционирование track_points (только PostgreSQL, по желанию).
+
+Включается настройкой TRACK_POINTS_PARTITIONING. Таблица track_points
+становится секционированной по timestamp (PARTITION BY RANGE), секции
+называются track_points_pYYYYMM, строки вне созданных секций попадают в
+track_points_default. Модели ORM не меняются; на SQLite все функции модуля
+ничего не делают.
+
+Первичный ключ секционированной таблицы - (id, timestamp): PostgreSQL
+требует, чтобы он включал ключ секционирования.
+
+Использование:
+    python -m app.partitions convert            # перевести существующую таблицу
+    python -m app.partitions create [--months N] # секции на N месяцев вперед
+    python -m app.partitions detach --older-than 12 [--drop]
+    python -m app.partitions list
+
+Отсоединенные секции остаются отдельными таблицами (архив); статистика
+треков (track_stats) при этом не пересчитывается.
+"""
+import argparse
+import logging
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+TABLE = "track_points"
+DEFAULT_PARTITION = f"{TABLE}_default"
+_PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+# Один процесс за раз создает или отсоединяет секции
+_LOCK_KEY = 0x54504152
+
+_COLUMNS = """
+    id INTEGER NOT NULL DEFAULT nextval('track_points_id_seq'),
+    track_id INTEGER REFERENCES tracks (id),
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    altitude DOUBLE PRECISION,
+    speed DOUBLE PRECISION,
+    geohash VARCHAR(12),
+    CONSTRAINT track_points_pkey PRIMARY KEY (id, timestamp)
+"""
+
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_track_points_id ON track_points (id)",
+    "CREATE INDEX IF NOT EXISTS ix_track_points_geohash_track_id ON track_points (geohash, track_id)",
+    "CREATE INDEX IF NOT EXISTS ix_track_points_track_id_timestamp ON track_points (track_id, timestamp)",
+)
+
+
+def supported(connection: Connection) -> bool:
+    return connection.dialect.name == "postgresql"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if not supported(connection):
+        return False
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": TABLE}
+    ).scalar()
+    return relkind == "p"
+
+
+def _month_start(value: date, shift: int = 0) -> date:
+    index = value.year * 12 + value.month - 1 + shift
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def list_partitions(connection: Connection) -> List[Tuple[str, date]]:
+    """Помесячные секции (имя, первый день месяца), по возрастанию"""
+    rows = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": TABLE}).scalars()
+    partitions = []
+    for name in rows:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def _lock(connection: Connection) -> None:
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+
+
+def create_partition(connection: Connection, month: date) -> bool:
+    """Создает секцию месяца; строки этого месяца из секции по умолчанию переносятся в нее"""
+    name = partition_name(month)
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return False
+    next_month = _month_start(month, 1)
+    bounds = {
+        "start": datetime(month.year, month.month, 1, tzinfo=timezone.utc),
+        "end": datetime(next_month.year, next_month.month, 1, tzinfo=timezone.utc),
+    }
+    has_rows = connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end)"
+    ), bounds).scalar()
+    if has_rows:
+        # Иначе PostgreSQL откажется создавать секцию, пересекающуюся с данными default
+        connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    connection.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{bounds['start']:%Y-%m-%d} 00:00:00+00') TO ('{bounds['end']:%Y-%m-%d} 00:00:00+00')"
+    ))
+    if has_rows:
+        connection.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end RETURNING *) "
+            f"INSERT INTO {TABLE} SELECT * FROM moved"
+        ), bounds)
+        connection.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    return True
+
+
+def ensure_partitions(connection: Connection, months_ahead: Optional[int] = None, today: Optional[date] = None) -> List[str]:
+    """Секции с текущего месяца на months_ahead месяцев вперед; возвращает созданные"""
+    if not is_partitioned(connection):
+        return []
+    months_ahead = settings.partition_months_ahead if months_ahead is None else months_ahead
+    current = _month_start(today or date.today())
+    _lock(connection)
+    created = []
+    for shift in range(months_ahead + 1):
+        month = _month_start(current, shift)
+        if create_partition(connection, month):
+            created.append(partition_name(month))
+    return created
+
+
+def detach_partitions(connection: Connection, older_than_months: int, drop: bool = False, today: Optional[date] = None) -> List[str]:
+    """Отсоединяет (и при drop удаляет) секции месяцев старше older_than_months"""
+    if not is_partitioned(connection):
+        return []
+    cutoff = _month_start(today or date.today(), -older_than_months)
+    _lock(connection)
+    detached = []
+    for name, month in list_partitions(connection):
+        if month >= cutoff:
+            break
+        connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        if drop:
+            connection.execute(text(f"DROP TABLE {name}"))
+        detached.append(name)
+    return detached
+
+
+def convert(connection: Connection, months_ahead: Optional[int] = None) -> bool:
+    """Переводит обычную таблицу track_points в секционированную с переносом данных"""
+    if not supported(connection) or is_partitioned(connection):
+        return False
+    _lock(connection)
+    connection.execute(text("ALTER SEQUENCE track_points_id_seq OWNED BY NONE"))
+    connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy"))
+    connection.execute(text("ALTER INDEX track_points_pkey RENAME TO track_points_legacy_pkey"))
+    connection.execute(text(f"CREATE TABLE {TABLE} ({_COLUMNS}) PARTITION BY RANGE (timestamp)"))
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+    first = connection.execute(text(f"SELECT min(timestamp) FROM {TABLE}_legacy")).scalar()
+    month = _month_start(first.astimezone(timezone.utc).date() if first else date.today())
+    last = _month_start(date.today(), settings.partition_months_ahead if months_ahead is None else months_ahead)
+    while month <= last:
+        create_partition(connection, month)
+        month = _month_start(month, 1)
+
+    # Точки без времени получают время создания трека
+    connection.execute(text(
+        f"INSERT INTO {TABLE} (id, track_id, latitude, longitude, timestamp, altitude, speed, geohash) "
+        f"SELECT p.id, p.track_id, p.latitude, p.longitude, COALESCE(p.timestamp, t.created_at, now()), "
+        f"p.altitude, p.speed, p.geohash FROM {TABLE}_legacy p LEFT JOIN tracks t ON t.id = p.track_id"
+    ))
+    connection.execute(text(f"DROP TABLE {TABLE}_legacy"))
+    connection.execute(text(f"ALTER SEQUENCE track_points_id_seq OWNED BY {TABLE}.id"))
+    for statement in _INDEXES:
+        connection.execute(text(statement))
+    return True
+
+
+def revert(connection: Connection) -> bool:
+    """Обратное преобразование в обычную таблицу (все секции, включая default)"""
+    if not is_partitioned(connection):
+        return False
+    _lock(connection)
+    connection.execute(text("ALTER SEQUENCE track_points_id_seq OWNED BY NONE"))
+    connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_partitioned"))
+    connection.execute(text("ALTER INDEX track_points_pkey RENAME TO track_points_partitioned_pkey"))
+    for statement in _INDEXES:
+        name = statement.split()[5]
+        connection.execute(text(f"ALTER INDEX {name} RENAME TO {name}_partitioned"))
+    columns = _COLUMNS.replace(
+        "CONSTRAINT track_points_pkey PRIMARY KEY (id, timestamp)", "CONSTRAINT track_points_pkey PRIMARY KEY (id)"
+    ).replace("NOT NULL DEFAULT now()", "DEFAULT now()")
+    connection.execute(text(f"CREATE TABLE {TABLE} ({columns})"))
+    connection.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_partitioned"))
+    connection.execute(text(f"DROP TABLE {TABLE}_partitioned CASCADE"))
+    connection.execute(text(f"ALTER SEQUENCE track_points_id_seq OWNED BY {TABLE}.id"))
+    for statement in _INDEXES:
+        connection.execute(text(statement))
+    return True
+
+
+def setup(engine: Engine) -> None:
+    """Вызывается при старте приложения, если секционирование включено.
+
+    Пустая таблица (новая база после metadata.create_all) переводится сразу,
+    непустую нужно перевести командой convert. Затем создаются будущие секции.
+    """
+    with engine.begin() as connection:
+        if not supported(connection):
+            return
+        if not is_partitioned(connection):
+            if connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {TABLE})")).scalar():
+                logger.warning("track_points не секционирована: выполните python -m app.partitions convert")
+                return
+            convert(connection)
+        created = ensure_partitions(connection)
+    if created:
+        logger.info(f"Созданы секции track_points: {', '.join(created)}")
+
+
+def main() -> None:
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Секции track_points (PostgreSQL)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="перевести track_points в секционированную таблицу")
+    convert_parser.add_argument("--months", type=int, default=None, help="секций вперед (по умолчанию PARTITION_MONTHS_AHEAD)")
+    create_parser = commands.add_parser("create", help="создать секции на будущие месяцы")
+    create_parser.add_argument("--months", type=int, default=None, help="секций вперед (по умолчанию PARTITION_MONTHS_AHEAD)")
+    detach_parser = commands.add_parser("detach", help="отсоединить старые секции")
+    detach_parser.add_argument("--older-than", type=int, required=True, help="старше скольких месяцев")
+    detach_parser.add_argument("--drop", action="store_true", help="удалить отсоединенные секции")
+    commands.add_parser("list", help="список секций")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        if not supported(connection):
+            parser.exit(1, "Секционирование поддерживается только PostgreSQL\n")
+        if args.command == "convert":
+            print("Таблица переведена" if convert(connection, args.months) else "Таблица уже секционирована")
+        elif args.command == "create":
+            print("\n".join(ensure_partitions(connection, args.months)) or "Новых секций нет")
+        elif args.command == "detach":
+            print("\n".join(detach_partitions(connection, args.older_than, args.drop)) or "Нет секций для отсоединения")
+        else:
+            for name, _ in list_partitions(connection):
+                print(name)
+
+
+if __name__ == "__main__":
+    main()
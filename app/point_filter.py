@@ -0,0 +1,259 @@
+"""Фильтр шума GPS при записи точек (ingest.insert_rows).
+
+Точки проходят по порядку три шага:
+- выбросы: точка, до которой от последней принятой точки нужно двигаться
+  быстрее max_speed, отбрасывается. После _MAX_OUTLIER_RUN выбросов подряд
+  следующая точка принимается - значит, выбросом была опорная точка;
+- сглаживание (smoothing): фильтр Калмана по координатам с моделью
+  "позиция + неизвестная скорость" - дисперсия оценки растет на
+  point_filter_process_noise^2 за секунду, погрешность измерения
+  point_filter_accuracy. Фильтр прямой (без обратного прохода), поэтому
+  уже записанные точки не меняются;
+- прореживание: точка ближе min_distance к последней сохраненной точке
+  (повтор координат, дрожание на стоянке) не сохраняется, если с той точки
+  прошло меньше point_filter_max_interval секунд.
+
+Фильтр продолжает трек от последней записанной точки (track_stats.last_*),
+поэтому одинаково работает для загрузки целиком, пачек и чанков. Число
+отброшенных точек копится в track_stats (dropped_stationary, dropped_outliers).
+Общие счетчики процесса (stats()) увеличиваются только после commit сессии,
+в которой точки были записаны; при rollback они не меняются.
+
+Настройки: settings.point_filter_* <- пользователь <- трек (models.PointFilter,
+NULL - наследуется).
+"""
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import geohash, models, schemas, track_stats
+from app.config import settings
+from app.metrics import haversine, to_epoch_seconds
+
+FIELDS = ("enabled", "min_distance", "max_speed", "smoothing")
+
+_MAX_OUTLIER_RUN = 5
+
+# Ключ в Session.info: счетчики текущей транзакции (points_in, stationary, outliers)
+_PENDING_KEY = "point_filter_pending"
+
+_lock = threading.Lock()
+_points_in = 0
+_dropped_stationary = 0
+_dropped_outliers = 0
+
+
+def defaults() -> schemas.PointFilterSettings:
+    return schemas.PointFilterSettings(
+        enabled=settings.point_filter,
+        min_distance=settings.point_filter_min_distance,
+        max_speed=settings.point_filter_max_speed,
+        smoothing=settings.point_filter_smoothing
+    )
+
+
+def overrides(filter_row: Optional[models.PointFilter]) -> schemas.PointFilterSettings:
+    if filter_row is None:
+        return schemas.PointFilterSettings()
+    return schemas.PointFilterSettings.model_validate(filter_row)
+
+
+def merge(*layers: Optional[models.PointFilter]) -> schemas.PointFilterSettings:
+    """Действующие настройки: каждый следующий уровень переопределяет заданные поля"""
+    values = defaults().model_dump()
+    for layer in layers:
+        if layer is None:
+            continue
+        for name in FIELDS:
+            if getattr(layer, name) is not None:
+                values[name] = getattr(layer, name)
+    return schemas.PointFilterSettings(**values)
+
+
+def get_filter(db: Session, user_id: int, track_id: Optional[int] = None) -> Optional[models.PointFilter]:
+    query = db.query(models.PointFilter).filter(models.PointFilter.user_id == user_id)
+    if track_id is None:
+        return query.filter(models.PointFilter.track_id.is_(None)).first()
+    return query.filter(models.PointFilter.track_id == track_id).first()
+
+
+def set_filter(
+    db: Session,
+    user_id: int,
+    values: schemas.PointFilterSettings,
+    track_id: Optional[int] = None,
+    retry: bool = True
+) -> models.PointFilter:
+    """Сохраняет переопределения пользователя или трека (с commit); None - наследовать"""
+    filter_row = get_filter(db, user_id, track_id)
+    if filter_row is None:
+        filter_row = models.PointFilter(user_id=user_id, track_id=track_id)
+        db.add(filter_row)
+    for name in FIELDS:
+        setattr(filter_row, name, getattr(values, name))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Та же строка одновременно создана другим запросом - обновляем ее
+        db.rollback()
+        if not retry:
+            raise
+        return set_filter(db, user_id, values, track_id, retry=False)
+    db.refresh(filter_row)
+    return filter_row
+
+
+def resolve(db: Session, track_id: int) -> schemas.PointFilterSettings:
+    """Действующие настройки для трека (один запрос)"""
+    rows = db.execute(
+        select(models.PointFilter)
+        .join(models.Track, models.Track.user_id == models.PointFilter.user_id)
+        .where(
+            models.Track.id == track_id,
+            or_(models.PointFilter.track_id.is_(None), models.PointFilter.track_id == track_id)
+        )
+    ).scalars().all()
+    user_row = next((row for row in rows if row.track_id is None), None)
+    track_row = next((row for row in rows if row.track_id is not None), None)
+    return merge(user_row, track_row)
+
+
+def status(db: Session, user_id: int, track: Optional[models.Track] = None) -> schemas.PointFilterStatus:
+    """Настройки пользователя или трека: заданные на этом уровне, действующие и счетчики"""
+    user_row = get_filter(db, user_id)
+    if track is None:
+        return schemas.PointFilterStatus(overrides=overrides(user_row), effective=merge(user_row))
+    track_row = get_filter(db, user_id, track.id)
+    stats = track.stats
+    return schemas.PointFilterStatus(
+        track_id=track.id,
+        overrides=overrides(track_row),
+        effective=merge(user_row, track_row),
+        dropped_stationary=stats.dropped_stationary or 0 if stats else 0,
+        dropped_outliers=stats.dropped_outliers or 0 if stats else 0
+    )
+
+
+class _Kalman:
+    """Фильтр Калмана по широте и долготе с общей дисперсией (в метрах^2)"""
+
+    def __init__(self, latitude: float, longitude: float, seconds: float):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.seconds = seconds
+        self.variance = settings.point_filter_accuracy ** 2
+
+    def update(self, latitude: float, longitude: float, seconds: float) -> Tuple[float, float]:
+        elapsed = seconds - self.seconds
+        if elapsed > 0:
+            self.variance += elapsed * settings.point_filter_process_noise ** 2
+            self.seconds = seconds
+        gain = self.variance / (self.variance + settings.point_filter_accuracy ** 2)
+        self.latitude += gain * (latitude - self.latitude)
+        self.longitude += gain * (longitude - self.longitude)
+        self.variance *= 1 - gain
+        return self.latitude, self.longitude
+
+
+def _position(row: dict) -> Tuple[float, float, float]:
+    return row["latitude"], row["longitude"], to_epoch_seconds(row["timestamp"])
+
+
+def _too_fast(start: Tuple[float, float, float], end: Tuple[float, float, float], max_speed: float) -> bool:
+    elapsed = end[2] - start[2]
+    return elapsed > 0 and haversine(start[0], start[1], end[0], end[1]) / elapsed > max_speed
+
+
+def apply(config: schemas.PointFilterSettings, stats: models.TrackStats, rows: Sequence[dict]) -> Tuple[List[dict], int, int]:
+    """Отфильтрованные строки (в исходном порядке), число точек стоянки и выбросов"""
+    previous = None
+    if stats.last_latitude is not None and stats.last_longitude is not None:
+        previous = (stats.last_latitude, stats.last_longitude, to_epoch_seconds(stats.last_timestamp))
+    # Последняя принятая точка (для проверки скорости) и последняя сохраненная (для прореживания)
+    accepted = saved = previous
+    kalman = _Kalman(*previous) if config.smoothing and previous else None
+
+    kept = []
+    stationary = outliers = outlier_run = 0
+    for row in rows:
+        position = latitude, longitude, seconds = _position(row)
+        if accepted is not None and _too_fast(accepted, position, config.max_speed):
+            if outlier_run < _MAX_OUTLIER_RUN:
+                outliers += 1
+                outlier_run += 1
+                continue
+            # Выбросом была опорная точка: она убирается, если еще не записана,
+            # и фильтр начинается заново
+            if kept and _too_fast(_position(kept[-1]), position, config.max_speed):
+                kept.pop()
+                outliers += 1
+                saved = _position(kept[-1]) if kept else previous
+            kalman = None
+        outlier_run = 0
+        accepted = position
+
+        if config.smoothing:
+            if kalman is None:
+                kalman = _Kalman(latitude, longitude, seconds)
+            else:
+                latitude, longitude = kalman.update(latitude, longitude, seconds)
+
+        if saved is not None and haversine(saved[0], saved[1], latitude, longitude) < config.min_distance:
+            interval = settings.point_filter_max_interval
+            if not interval or seconds - saved[2] < interval:
+                stationary += 1
+                continue
+        saved = (latitude, longitude, seconds)
+        if config.smoothing:
+            row = dict(row, latitude=latitude, longitude=longitude)
+        kept.append(row)
+
+    if config.smoothing and kept:
+        cells = geohash.encode_many([row["latitude"] for row in kept], [row["longitude"] for row in kept])
+        for row, cell in zip(kept, cells):
+            row["geohash"] = cell
+    return kept, stationary, outliers
+
+
+def filter_rows(db: Session, track_id: int, rows: List[dict]) -> List[dict]:
+    """Применяет действующий фильтр трека и учитывает отброшенные точки (без commit)"""
+    config = resolve(db, track_id)
+    if not config.enabled or not rows:
+        return rows
+    stats = track_stats.get_or_create_stats(db, track_id)
+    kept, stationary, outliers = apply(config, stats, rows)
+    stats.dropped_stationary = (stats.dropped_stationary or 0) + stationary
+    stats.dropped_outliers = (stats.dropped_outliers or 0) + outliers
+    pending = db.info.get(_PENDING_KEY, (0, 0, 0))
+    db.info[_PENDING_KEY] = (pending[0] + len(rows), pending[1] + stationary, pending[2] + outliers)
+    return kept
+
+
+@event.listens_for(Session, "after_commit")
+def _count_committed(session: Session) -> None:
+    global _points_in, _dropped_stationary, _dropped_outliers
+
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending is None:
+        return
+    with _lock:
+        _points_in += pending[0]
+        _dropped_stationary += pending[1]
+        _dropped_outliers += pending[2]
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "points_in": _points_in,
+            "dropped_stationary": _dropped_stationary,
+            "dropped_outliers": _dropped_outliers,
+        }
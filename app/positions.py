@@ -0,0 +1,130 @@
+"""Последнее известное местоположение пользователей.
+
+Обновляется при каждой записи местоположения и отвечает на запросы текущего
+местоположения без обращения к основной БД. При промахе (например, после
+перезапуска) значение берется из БД и запоминается.
+
+Хранилища (settings.position_store):
+- "memory": словарь в памяти процесса - только для одного воркера: другие
+  воркеры не видят обновлений и отдают устаревшее местоположение;
+- "sqlite": отдельный файл SQLite (settings.position_store_path) в режиме WAL,
+  общий для всех воркеров на одной машине.
+
+Запись с более старым (timestamp, id), чем сохраненная, игнорируется.
+"""
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from app import schemas
+from app.config import settings
+from app.metrics import to_epoch_seconds
+
+
+def snapshot(location: Any) -> dict:
+    """Поля schemas.Location из ORM объекта или словаря"""
+    if isinstance(location, dict):
+        return {name: location.get(name) for name in schemas.Location.model_fields}
+    return {name: getattr(location, name) for name in schemas.Location.model_fields}
+
+
+def _isoformat(value: Any) -> str:
+    return value.isoformat()
+
+
+def _order_key(data: dict) -> tuple:
+    return to_epoch_seconds(data["timestamp"]), data["id"]
+
+
+class MemoryPositionStore:
+    def __init__(self):
+        self._data: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[dict]:
+        return self._data.get(user_id)
+
+    def set(self, data: dict) -> None:
+        with self._lock:
+            current = self._data.get(data["user_id"])
+            if current is None or _order_key(data) >= _order_key(current):
+                self._data[data["user_id"]] = data
+
+    def delete(self, user_id: int, location_id: Optional[int] = None) -> None:
+        with self._lock:
+            current = self._data.get(user_id)
+            if current is not None and (location_id is None or current["id"] == location_id):
+                del self._data[user_id]
+
+
+class SQLitePositionStore:
+    """Хранилище в отдельном файле SQLite; соединение на каждый поток"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS positions ("
+            "user_id INTEGER PRIMARY KEY, location_id INTEGER NOT NULL, "
+            "epoch REAL NOT NULL, data TEXT NOT NULL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, user_id: int) -> Optional[dict]:
+        row = self._connection().execute("SELECT data FROM positions WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, data: dict) -> None:
+        epoch, location_id = _order_key(data)
+        self._connection().execute(
+            "INSERT INTO positions (user_id, location_id, epoch, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET location_id = excluded.location_id, "
+            "epoch = excluded.epoch, data = excluded.data "
+            "WHERE (excluded.epoch, excluded.location_id) >= (positions.epoch, positions.location_id)",
+            (data["user_id"], location_id, epoch, json.dumps(data, default=_isoformat))
+        )
+
+    def delete(self, user_id: int, location_id: Optional[int] = None) -> None:
+        if location_id is None:
+            self._connection().execute("DELETE FROM positions WHERE user_id = ?", (user_id,))
+        else:
+            self._connection().execute(
+                "DELETE FROM positions WHERE user_id = ? AND location_id = ?", (user_id, location_id)
+            )
+
+
+def _create_store():
+    if settings.position_store == "sqlite":
+        return SQLitePositionStore(settings.position_store_path)
+    if settings.position_store == "memory":
+        return MemoryPositionStore()
+    raise ValueError(f"Unknown position store: {settings.position_store}")
+
+
+store = _create_store()
+
+
+def get(user_id: int) -> Optional[schemas.Location]:
+    data = store.get(user_id)
+    return schemas.Location(**data) if data is not None else None
+
+
+def remember(location: Any) -> schemas.Location:
+    """Запоминает местоположение (ORM объект или словарь), возвращает его схему"""
+    data = snapshot(location)
+    store.set(data)
+    return schemas.Location(**data)
+
+
+def forget(user_id: int, location_id: Optional[int] = None) -> None:
+    """Забывает местоположение пользователя (только location_id, если задан)"""
+    store.delete(user_id, location_id)
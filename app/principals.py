@@ -0,0 +1,44 @@
+"""Кэш аутентифицированных пользователей.
+
+Каждый запрос с токеном проверяет подпись JWT и ищет пользователя в БД.
+Результат кэшируется по токену в виде легкого Principal (id, username)
+на auth_cache_ttl секунд, но не дольше срока действия токена.
+"""
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from app.cache import LRUCache
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Аутентифицированный пользователь без обращения к БД"""
+    id: int
+    username: str
+
+
+cache = LRUCache(settings.auth_cache_size, ttl=settings.auth_cache_ttl)
+
+
+def get(token: str) -> Optional[Principal]:
+    return cache.get(token)
+
+
+def remember(token: str, principal: Principal, token_expires_at: Optional[float] = None) -> None:
+    """Кэширует пользователя для токена; token_expires_at - exp токена (UNIX время)"""
+    expires_at = None
+    if token_expires_at is not None:
+        # exp задан в UNIX времени, кэш использует monotonic
+        expires_at = time.monotonic() + (token_expires_at - time.time())
+    cache.set(token, principal, expires_at=expires_at)
+
+
+def invalidate_user(username: str) -> int:
+    """Сбрасывает все закэшированные токены пользователя (при его изменении)"""
+    return cache.discard_where(lambda token, principal: principal.username == username)
+
+
+def stats() -> dict:
+    return cache.stats()
@@ -0,0 +1,290 @@
+"""Сводная активность пользователей по дням и ISO неделям.
+
+Таблицы:
+- track_daily_stats: вклад трека за день (UTC) - расстояние, время в
+  движении, число точек;
+- user_daily_stats, user_weekly_stats: суммы по пользователю, плюс число
+  треков с точками в этот день / неделю.
+
+Обновляются инкрементально в транзакции записи точек (track_stats.record_points)
+и при удалении трека (forget_track), поэтому сводка за любой период читает
+только строки rollups. Сегмент между двумя точками относится к дню конечной
+точки; время в движении считается так же, как в app.analytics
+(analytics_moving_speed, analytics_max_gap).
+
+Пересчет по существующим точкам:
+    python -m app.rollups
+"""
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app import metrics, models, schemas
+from app.config import settings
+
+_COUNTERS = ("distance", "moving_time", "points_count", "tracks_count")
+_EPOCH_DATE = date(1970, 1, 1)
+
+
+def week_start(day: date) -> date:
+    """Понедельник ISO недели"""
+    return day - timedelta(days=day.weekday())
+
+
+def _upsert(db: Session, model, keys: Sequence[str], rows: List[dict], counters: Sequence[str] = _COUNTERS) -> None:
+    """Вставка строк; при существующем ключе счетчики прибавляются к сохраненным"""
+    if not rows:
+        return
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    table = model.__table__
+    statement = dialect_insert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: table.c[name] + statement.excluded[name] for name in counters}
+    )
+    db.execute(statement)
+
+
+def _segments(stats: models.TrackStats, points: Sequence[Mapping]):
+    """Дни точек и по точкам: расстояние и время в движении сегмента, который они завершают"""
+    count = len(points)
+    seconds = np.fromiter(
+        (metrics.to_epoch_seconds(p.get("timestamp")) for p in points), dtype=np.float64, count=count
+    )
+    latitudes = [p["latitude"] for p in points]
+    longitudes = [p["longitude"] for p in points]
+    speeds = np.array([p.get("speed") for p in points], dtype=np.float64)
+
+    has_previous = stats.last_latitude is not None and stats.last_longitude is not None
+    if has_previous:
+        latitudes = [stats.last_latitude] + latitudes
+        longitudes = [stats.last_longitude] + longitudes
+        seconds = np.concatenate(([metrics.to_epoch_seconds(stats.last_timestamp)], seconds))
+    distances = metrics.haversine_array(latitudes, longitudes) if len(latitudes) > 1 else np.zeros(0)
+    durations = np.diff(seconds)
+    if not has_previous:
+        # У первой точки трека нет входящего сегмента
+        distances = np.concatenate(([0.0], distances))
+        durations = np.concatenate(([np.nan], durations))
+        seconds = np.concatenate(([np.nan], seconds))
+    point_seconds = seconds[1:]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        computed_speed = np.where(durations > 0, distances / durations, np.nan)
+        speed = np.where(np.isnan(speeds), computed_speed, speeds)
+        moving = (durations > 0) & (durations <= settings.analytics_max_gap) & (speed >= settings.analytics_moving_speed)
+    moving_time = np.where(moving, durations, 0.0)
+    # Точки без времени относятся к текущему дню (UTC, как и остальные даты)
+    today = (datetime.utcnow().date() - _EPOCH_DATE).days
+    days = np.where(np.isnan(point_seconds), today, np.floor(point_seconds / 86400)).astype(np.int64)
+    return days, distances, moving_time
+
+
+def record_points(db: Session, track_id: int, stats: models.TrackStats, points: Sequence[Mapping]) -> None:
+    """Учитывает новые точки трека (до apply_points: stats содержит предыдущую точку)"""
+    if not points:
+        return
+    user_id = db.execute(select(models.Track.user_id).where(models.Track.id == track_id)).scalar()
+    if user_id is None:
+        return
+    days, distances, moving_time = _segments(stats, points)
+    day_numbers, inverse = np.unique(days, return_inverse=True)
+    day_distance = np.bincount(inverse, weights=distances)
+    day_moving = np.bincount(inverse, weights=moving_time)
+    day_points = np.bincount(inverse)
+    touched = [_EPOCH_DATE + timedelta(days=int(number)) for number in day_numbers]
+
+    # Дни и недели, в которых у трека уже есть точки
+    first_week, last_week = week_start(touched[0]), week_start(touched[-1]) + timedelta(days=6)
+    known_days = set(db.execute(
+        select(models.TrackDailyStats.day).where(
+            models.TrackDailyStats.track_id == track_id,
+            models.TrackDailyStats.day >= first_week,
+            models.TrackDailyStats.day <= last_week
+        )
+    ).scalars())
+    known_weeks = {week_start(day) for day in known_days}
+
+    track_rows, daily_rows = [], []
+    weekly: Dict[date, dict] = {}
+    for day, distance, moving, count in zip(touched, day_distance.tolist(), day_moving.tolist(), day_points.tolist()):
+        values = {"distance": distance, "moving_time": moving, "points_count": count}
+        track_rows.append({"track_id": track_id, "day": day, "user_id": user_id, **values})
+        daily_rows.append({"user_id": user_id, "day": day, **values, "tracks_count": int(day not in known_days)})
+        week = week_start(day)
+        row = weekly.setdefault(week, {
+            "user_id": user_id, "week": week, "distance": 0.0, "moving_time": 0.0, "points_count": 0,
+            "tracks_count": int(week not in known_weeks)
+        })
+        row["distance"] += distance
+        row["moving_time"] += moving
+        row["points_count"] += count
+
+    _upsert(db, models.TrackDailyStats, ("track_id", "day"), track_rows, _COUNTERS[:3])
+    _upsert(db, models.UserDailyStats, ("user_id", "day"), daily_rows)
+    _upsert(db, models.UserWeeklyStats, ("user_id", "week"), list(weekly.values()))
+
+
+def forget_track(db: Session, track_id: int) -> None:
+    """Вычитает вклад трека из сводок пользователя (перед удалением трека, без commit)"""
+    rows = db.execute(select(models.TrackDailyStats).where(models.TrackDailyStats.track_id == track_id)).scalars().all()
+    if not rows:
+        return
+    user_id = rows[0].user_id
+    weekly: Dict[date, dict] = {}
+    for row in rows:
+        _subtract(db, models.UserDailyStats, models.UserDailyStats.day == row.day, user_id, {
+            "distance": row.distance, "moving_time": row.moving_time, "points_count": row.points_count, "tracks_count": 1
+        })
+        values = weekly.setdefault(week_start(row.day), {"distance": 0.0, "moving_time": 0.0, "points_count": 0, "tracks_count": 1})
+        values["distance"] += row.distance
+        values["moving_time"] += row.moving_time
+        values["points_count"] += row.points_count
+    for week, values in weekly.items():
+        _subtract(db, models.UserWeeklyStats, models.UserWeeklyStats.week == week, user_id, values)
+    db.execute(delete(models.TrackDailyStats).where(models.TrackDailyStats.track_id == track_id))
+    # Дни и недели без треков больше не нужны
+    for model in (models.UserDailyStats, models.UserWeeklyStats):
+        db.execute(delete(model).where(model.user_id == user_id, model.tracks_count <= 0))
+
+
+def _subtract(db: Session, model, period, user_id: int, values: dict) -> None:
+    table = model.__table__
+    db.execute(
+        update(model).where(model.user_id == user_id, period).values(
+            {name: table.c[name] - value for name, value in values.items()}
+        )
+    )
+
+
+def summary(
+    db: Session,
+    user_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group: Optional[str] = None
+) -> schemas.ActivitySummary:
+    """Сводка активности за период [start, end] (даты UTC, включительно)"""
+    daily = models.UserDailyStats
+    conditions = [daily.user_id == user_id]
+    track_conditions = [models.TrackDailyStats.user_id == user_id]
+    if start is not None:
+        conditions.append(daily.day >= start)
+        track_conditions.append(models.TrackDailyStats.day >= start)
+    if end is not None:
+        conditions.append(daily.day <= end)
+        track_conditions.append(models.TrackDailyStats.day <= end)
+
+    distance, moving_time, points_count, active_days = db.execute(
+        select(
+            func.coalesce(func.sum(daily.distance), 0.0),
+            func.coalesce(func.sum(daily.moving_time), 0.0),
+            func.coalesce(func.sum(daily.points_count), 0),
+            func.count()
+        ).where(*conditions)
+    ).one()
+    # Трек с точками в нескольких днях считается один раз
+    tracks_count = db.execute(
+        select(func.count(func.distinct(models.TrackDailyStats.track_id))).where(*track_conditions)
+    ).scalar()
+
+    buckets = []
+    if group == "day":
+        rows = db.execute(select(daily).where(*conditions).order_by(daily.day)).scalars()
+        buckets = [_bucket(row.day, row) for row in rows]
+    elif group == "week":
+        weekly = models.UserWeeklyStats
+        week_conditions = [weekly.user_id == user_id]
+        if start is not None:
+            week_conditions.append(weekly.week >= week_start(start))
+        if end is not None:
+            week_conditions.append(weekly.week <= end)
+        rows = db.execute(select(weekly).where(*week_conditions).order_by(weekly.week)).scalars()
+        for row in rows:
+            first, last = row.week, row.week + timedelta(days=6)
+            if (start is None or start <= first) and (end is None or last <= end):
+                buckets.append(_bucket(row.week, row))
+            else:
+                # Неделя на границе периода - только дни внутри него, чтобы сумма
+                # корзин совпадала с итогом
+                bucket = _partial_week(db, user_id, max(first, start or first), min(last, end or last))
+                if bucket is not None:
+                    buckets.append(bucket)
+
+    return schemas.ActivitySummary(
+        start=start,
+        end=end,
+        distance=distance,
+        moving_time=moving_time,
+        avg_moving_speed=distance / moving_time if moving_time > 0 else None,
+        points_count=points_count,
+        tracks_count=tracks_count,
+        active_days=active_days,
+        buckets=buckets
+    )
+
+
+def _partial_week(db: Session, user_id: int, first: date, last: date) -> Optional[schemas.ActivityBucket]:
+    """Корзина за дни first..last одной недели (по вкладам треков)"""
+    track_daily = models.TrackDailyStats
+    distance, moving_time, points_count, tracks_count = db.execute(
+        select(
+            func.coalesce(func.sum(track_daily.distance), 0.0),
+            func.coalesce(func.sum(track_daily.moving_time), 0.0),
+            func.coalesce(func.sum(track_daily.points_count), 0),
+            func.count(func.distinct(track_daily.track_id))
+        ).where(track_daily.user_id == user_id, track_daily.day >= first, track_daily.day <= last)
+    ).one()
+    if not tracks_count:
+        return None
+    return schemas.ActivityBucket(
+        start=first,
+        distance=distance,
+        moving_time=moving_time,
+        points_count=points_count,
+        tracks_count=tracks_count
+    )
+
+
+def _bucket(period: date, row) -> schemas.ActivityBucket:
+    return schemas.ActivityBucket(
+        start=period,
+        distance=row.distance,
+        moving_time=row.moving_time,
+        points_count=row.points_count,
+        tracks_count=row.tracks_count
+    )
+
+
+def rebuild(db: Session) -> int:
+    """Пересчитывает все сводки по точкам треков, возвращает число треков"""
+    from app import track_stats
+
+    for model in (models.TrackDailyStats, models.UserDailyStats, models.UserWeeklyStats):
+        db.execute(delete(model))
+    track_ids = db.execute(select(models.Track.id).order_by(models.Track.id)).scalars().all()
+    for track_id in track_ids:
+        record_points(db, track_id, track_stats.new_stats(track_id), track_stats.load_point_values(db, track_id))
+    db.commit()
+    return len(track_ids)
+
+
+def main() -> None:
+    from app.database import SessionLocal
+
+    argparse.ArgumentParser(description="Пересчет сводной активности пользователей").parse_args()
+    db = SessionLocal()
+    try:
+        count = rebuild(db)
+    finally:
+        db.close()
+    print(f"Сводки пересчитаны по {count} трекам")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 
 # User schemas
@@ -61,6 +61,10 @@ class Track(TrackBase):
         from_attributes = True
 
 
+class TrackSearchResult(Track):
+    points_in_bbox: int
+
+
 #Track schemas for recent tracks
 class TrackRecent(TrackBase):
     id: int
@@ -122,6 +126,87 @@ class TrackChunkUpload(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100)  # только для первого чанка
     description: Optional[str] = None  # только для первого чанка
     track_id: Optional[int] = None  # для последующих чанков
+    # Возобновляемая загрузка: идентификатор сессии устройства и номер чанка с 0
+    upload_id: Optional[str] = Field(None, min_length=1, max_length=64)
+    seq: Optional[int] = Field(None, ge=0)
     points: List[GPSData]
     is_first_chunk: bool = False
-    is_last_chunk: bool = False 
\ No newline at end of file
+    is_last_chunk: bool = False
+
+
+class TrackSplit(BaseModel):
+    index: int  # с 1
+    distance: float  # метры; последний сплит может быть короче
+    duration: float  # секунды
+    pace: Optional[float] = None  # секунды на километр
+    speed: Optional[float] = None  # м/с
+
+
+class TrackAnalytics(BaseModel):
+    track_id: int
+    points_count: int
+    distance: float = 0.0  # метры
+    duration: float = 0.0  # секунды
+    moving_time: float = 0.0
+    stopped_time: float = 0.0
+    moving_distance: float = 0.0
+    avg_speed: Optional[float] = None  # м/с, за все время
+    avg_moving_speed: Optional[float] = None  # м/с, в движении
+    max_speed: Optional[float] = None
+    speed_percentiles: Dict[str, float] = {}  # "p50", "p90", "p95" по сегментам движения
+    elevation_gain: float = 0.0
+    elevation_loss: float = 0.0
+    min_altitude: Optional[float] = None
+    max_altitude: Optional[float] = None
+    splits: List[TrackSplit] = []
+
+
+class ActivityBucket(BaseModel):
+    start: date  # день или понедельник недели (неделя на границе периода - первый день периода в ней)
+    distance: float
+    moving_time: float
+    points_count: int
+    tracks_count: int
+
+
+class ActivitySummary(BaseModel):
+    start: Optional[date] = None
+    end: Optional[date] = None
+    distance: float = 0.0  # метры
+    moving_time: float = 0.0  # секунды
+    avg_moving_speed: Optional[float] = None  # м/с
+    points_count: int = 0
+    tracks_count: int = 0
+    active_days: int = 0
+    buckets: List[ActivityBucket] = []
+
+
+class PointFilterSettings(BaseModel):
+    """Фильтр шума GPS при записи точек; None - наследуется (трек -> пользователь -> сервер)"""
+    enabled: Optional[bool] = None
+    min_distance: Optional[float] = Field(None, ge=0)  # метры, ближе - дубликат/стоянка
+    max_speed: Optional[float] = Field(None, gt=0)  # м/с, быстрее - выброс
+    smoothing: Optional[bool] = None  # фильтр Калмана по координатам
+    
+    class Config:
+        from_attributes = True
+
+
+class PointFilterStatus(BaseModel):
+    track_id: Optional[int] = None  # None - настройки пользователя
+    overrides: PointFilterSettings  # заданные на этом уровне
+    effective: PointFilterSettings  # действующие
+    dropped_stationary: int = 0  # отброшено точек трека: дубликаты и стоянка
+    dropped_outliers: int = 0  # отброшено точек трека: выбросы
+
+
+class UploadSessionStatus(BaseModel):
+    upload_id: str
+    track_id: int
+    last_seq: int  # -1, пока ни один чанк не записан
+    next_seq: int
+    points_count: int
+    completed: bool
+    
+    class Config:
+        from_attributes = True 
\ No newline at end of file
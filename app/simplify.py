@@ -0,0 +1,148 @@
+"""Упрощение треков для отображения на карте.
+
+Поддерживаются алгоритмы Рамера-Дугласа-Пекера ("rdp") и Висвалингама-Уайатта
+("visvalingam"). Допуск задается в метрах напрямую или выводится из уровня
+зума карты (размер пикселя Web Mercator).
+"""
+import heapq
+import math
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.cache import LRUCache
+from app.config import settings
+from app.metrics import EARTH_RADIUS
+
+ALGORITHMS = ("rdp", "visvalingam")
+
+# Упрощенные уровни треков: (track_id, version, algorithm, tolerance) -> точки
+cache = LRUCache(settings.simplify_cache_size)
+
+# Размер пикселя тайла 256px на экваторе при зуме 0, метры
+_METERS_PER_PIXEL_Z0 = 2 * math.pi * 6378137 / 256
+
+
+def tolerance_for_zoom(zoom: int, latitude: float = 0.0, pixels: float = 1.0) -> float:
+    """Допуск в метрах, соответствующий `pixels` пикселям на данном зуме"""
+    return pixels * _METERS_PER_PIXEL_Z0 * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+
+def resolve_tolerance(zoom: Optional[int], tolerance_m: Optional[float], latitude: float = 0.0) -> Optional[float]:
+    """Явный tolerance_m имеет приоритет над зумом; None - без упрощения"""
+    if tolerance_m is not None:
+        return tolerance_m
+    if zoom is not None:
+        return tolerance_for_zoom(zoom, latitude)
+    return None
+
+
+def _project(latitudes: Sequence[float], longitudes: Sequence[float]):
+    """Локальная равнопромежуточная проекция в метрах"""
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    x = EARTH_RADIUS * lon * math.cos(float(lat.mean()))
+    y = EARTH_RADIUS * lat
+    return x, y
+
+
+def douglas_peucker(x, y, tolerance: float) -> np.ndarray:
+    """Индексы точек, оставшихся после упрощения Рамера-Дугласа-Пекера"""
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        seg_x = x[start + 1:end] - x[start]
+        seg_y = y[start + 1:end] - y[start]
+        norm = math.hypot(dx, dy)
+        if norm == 0:
+            distances = np.hypot(seg_x, seg_y)
+        else:
+            distances = np.abs(dx * seg_y - dy * seg_x) / norm
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            index = start + 1 + i
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+
+def _triangle_area(x, y, a: int, b: int, c: int) -> float:
+    return abs((x[b] - x[a]) * (y[c] - y[a]) - (x[c] - x[a]) * (y[b] - y[a])) / 2
+
+
+def visvalingam(x, y, tolerance: float) -> np.ndarray:
+    """Индексы точек после упрощения Висвалингама-Уайатта.
+
+    Удаляются точки с эффективной площадью треугольника меньше tolerance².
+    """
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    x = x.tolist()
+    y = y.tolist()
+    threshold = tolerance ** 2
+    prev = list(range(-1, n - 1))
+    next_ = list(range(1, n + 1))
+    areas = [math.inf] * n
+    heap = []
+    for i in range(1, n - 1):
+        areas[i] = _triangle_area(x, y, i - 1, i, i + 1)
+        heap.append((areas[i], i))
+    heapq.heapify(heap)
+    removed = [False] * n
+
+    while heap:
+        area, i = heapq.heappop(heap)
+        if removed[i] or area != areas[i]:
+            continue
+        if area >= threshold:
+            break
+        removed[i] = True
+        p, nx = prev[i], next_[i]
+        next_[p] = nx
+        prev[nx] = p
+        # Площадь соседей не может стать меньше площади удаленной точки
+        for j in (p, nx):
+            if 0 < j < n - 1:
+                areas[j] = max(area, _triangle_area(x, y, prev[j], j, next_[j]))
+                heapq.heappush(heap, (areas[j], j))
+
+    return np.flatnonzero(~np.array(removed))
+
+
+def simplify_indices(
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    tolerance_m: float,
+    algorithm: str = "rdp"
+) -> np.ndarray:
+    """Индексы точек, которые нужно оставить при заданном допуске в метрах"""
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown simplification algorithm: {algorithm}")
+    if len(latitudes) < 3 or tolerance_m <= 0:
+        return np.arange(len(latitudes))
+    x, y = _project(latitudes, longitudes)
+    if algorithm == "visvalingam":
+        return visvalingam(x, y, tolerance_m)
+    return douglas_peucker(x, y, tolerance_m)
+
+
+def simplify_points(points: Sequence, tolerance_m: float, algorithm: str = "rdp") -> List:
+    """Упрощает последовательность точек с атрибутами latitude/longitude"""
+    indices = simplify_indices(
+        [p.latitude for p in points],
+        [p.longitude for p in points],
+        tolerance_m,
+        algorithm
+    )
+    return [points[i] for i in indices]
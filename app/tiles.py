@@ -0,0 +1,267 @@
+"""Векторные тайлы (Mapbox Vector Tile) с треками пользователя.
+
+Тайл строится так: треки выбираются по bbox из track_stats, из них берутся
+точки внутри тайла с запасом (sample_bounds, индекс geohash), прореженные под
+бюджет тайла - участки трека вне тайла бюджет не расходуют. Точки проецируются в координаты тайла (Web Mercator,
+extent 4096), упрощаются Рамером-Дугласом-Пекером с допуском в долю пикселя,
+обрезаются по границе тайла с буфером и квантуются до целых.
+
+Кодирование protobuf написано вручную: в тайле один слой "tracks", каждый
+трек - объект LINESTRING (несколько частей, если трек выходит из тайла)
+со свойствами track_id и name.
+"""
+import hashlib
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.cache import LRUCache
+from app.config import settings
+from app.simplify import douglas_peucker
+
+MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+LAYER_NAME = "tracks"
+MAX_ZOOM = 22
+MAX_LATITUDE = 85.0511287798
+
+# Готовые тайлы: (user_id, z, x, y, хэш версий треков) -> bytes
+cache = LRUCache(settings.tile_cache_entries, max_bytes=settings.tile_cache_bytes)
+
+# Поля и типы protobuf (vector_tile.proto, версия 2)
+_WIRE_VARINT = 0
+_WIRE_LENGTH = 2
+_GEOM_LINESTRING = 2
+_CMD_MOVE_TO = 1
+_CMD_LINE_TO = 2
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Границы тайла в градусах: (west, south, east, north)"""
+    n = 2 ** z
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def buffered_bounds(z: int, x: int, y: int, ratio: Optional[float] = None) -> Tuple[float, float, float, float]:
+    """Границы тайла, расширенные на буфер settings.tile_buffer (или на долю тайла ratio)"""
+    west, south, east, north = tile_bounds(z, x, y)
+    if ratio is None:
+        ratio = settings.tile_buffer / settings.tile_extent
+    d_lon = (east - west) * ratio
+    d_lat = (north - south) * ratio
+    return (
+        max(west - d_lon, -180.0), max(south - d_lat, -90.0),
+        min(east + d_lon, 180.0), min(north + d_lat, 90.0)
+    )
+
+
+def sample_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Область, из которой берутся точки тайла: с запасом settings.tile_sample_margin,
+    чтобы сегменты, выходящие за границу тайла, доходили до нее"""
+    return buffered_bounds(z, x, y, max(settings.tile_sample_margin, settings.tile_buffer / settings.tile_extent))
+
+
+def project(latitudes: Sequence[float], longitudes: Sequence[float], z: int, x: int, y: int):
+    """Координаты в системе тайла (0..extent, ось y вниз)"""
+    extent = settings.tile_extent
+    scale = (2 ** z) * extent
+    lat = np.radians(np.clip(np.asarray(latitudes, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE))
+    lon = np.asarray(longitudes, dtype=np.float64)
+    px = (lon + 180) / 360 * scale - x * extent
+    py = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * scale - y * extent
+    return px, py
+
+
+def _clip_segment(x0, y0, x1, y1, low, high) -> Optional[Tuple[float, float, float, float]]:
+    """Отсечение отрезка квадратом [low, high]² (Лианг-Барски)"""
+    t0, t1 = 0.0, 1.0
+    dx, dy = x1 - x0, y1 - y0
+    for p, q in ((-dx, x0 - low), (dx, high - x0), (-dy, y0 - low), (dy, high - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    return x0 + t0 * dx, y0 + t0 * dy, x0 + t1 * dx, y0 + t1 * dy
+
+
+def clip_line(px, py) -> List[List[Tuple[float, float]]]:
+    """Части ломаной внутри тайла с буфером"""
+    low = -settings.tile_buffer
+    high = settings.tile_extent + settings.tile_buffer
+    xs, ys = px.tolist(), py.tolist()
+    if len(xs) < 2:
+        return []
+    if min(xs) >= low and max(xs) <= high and min(ys) >= low and max(ys) <= high:
+        return [list(zip(xs, ys))]
+
+    parts = []
+    current: List[Tuple[float, float]] = []
+    for i in range(len(xs) - 1):
+        clipped = _clip_segment(xs[i], ys[i], xs[i + 1], ys[i + 1], low, high)
+        if clipped is None:
+            if current:
+                parts.append(current)
+                current = []
+            continue
+        cx0, cy0, cx1, cy1 = clipped
+        if not current:
+            current.append((cx0, cy0))
+        current.append((cx1, cy1))
+        # Отрезок вышел за границу - следующая часть начнется с новой точки входа
+        if (cx1, cy1) != (xs[i + 1], ys[i + 1]):
+            parts.append(current)
+            current = []
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _quantize(part: List[Tuple[float, float]]) -> List[Tuple[int, int]]:
+    result: List[Tuple[int, int]] = []
+    for px, py in part:
+        point = (int(round(px)), int(round(py)))
+        if not result or result[-1] != point:
+            result.append(point)
+    return result
+
+
+def track_geometry(
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    z: int,
+    x: int,
+    y: int
+) -> List[List[Tuple[int, int]]]:
+    """Части трека в целочисленных координатах тайла"""
+    if len(latitudes) < 2:
+        return []
+    px, py = project(latitudes, longitudes, z, x, y)
+    keep = douglas_peucker(px, py, settings.tile_simplify_tolerance)
+    parts = (_quantize(part) for part in clip_line(px[keep], py[keep]))
+    return [part for part in parts if len(part) >= 2]
+
+
+# Protobuf
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 31)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _uint_field(field: int, value: int) -> bytes:
+    return _key(field, _WIRE_VARINT) + _varint(value)
+
+
+def _bytes_field(field: int, value: bytes) -> bytes:
+    return _key(field, _WIRE_LENGTH) + _varint(len(value)) + value
+
+
+def _packed_field(field: int, values: Sequence[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def encode_geometry(parts: List[List[Tuple[int, int]]]) -> List[int]:
+    """Команды геометрии LINESTRING; курсор общий для всех частей"""
+    commands: List[int] = []
+    cursor_x = cursor_y = 0
+    for part in parts:
+        for index, (px, py) in enumerate(part):
+            if index == 0:
+                commands.append(_CMD_MOVE_TO | (1 << 3))
+            elif index == 1:
+                commands.append(_CMD_LINE_TO | ((len(part) - 1) << 3))
+            commands.append(_zigzag(px - cursor_x))
+            commands.append(_zigzag(py - cursor_y))
+            cursor_x, cursor_y = px, py
+    return commands
+
+
+def encode_tile(features: List[Tuple[int, str, List[List[Tuple[int, int]]]]]) -> bytes:
+    """Тайл из объектов (track_id, name, части геометрии); пустой список - пустой тайл"""
+    if not features:
+        return b""
+    keys = ["track_id", "name"]
+    values: List[bytes] = []
+    value_index: Dict[Tuple[int, object], int] = {}
+
+    def tag_value(kind: int, value) -> int:
+        if (kind, value) not in value_index:
+            value_index[(kind, value)] = len(values)
+            encoded = _bytes_field(1, value.encode()) if kind == 1 else _uint_field(5, value)
+            values.append(encoded)
+        return value_index[(kind, value)]
+
+    layer = [
+        _uint_field(15, 2),
+        _bytes_field(1, LAYER_NAME.encode()),
+    ]
+    for track_id, name, parts in features:
+        tags = [0, tag_value(5, track_id), 1, tag_value(1, name or "")]
+        feature = b"".join([
+            _uint_field(1, track_id),
+            _packed_field(2, tags),
+            _uint_field(3, _GEOM_LINESTRING),
+            _packed_field(4, encode_geometry(parts)),
+        ])
+        layer.append(_bytes_field(2, feature))
+    layer.extend(_bytes_field(3, key.encode()) for key in keys)
+    layer.extend(_bytes_field(4, value) for value in values)
+    layer.append(_uint_field(5, settings.tile_extent))
+    return _bytes_field(3, b"".join(layer))
+
+
+def tile_key(user_id: int, z: int, x: int, y: int, versions: Sequence[Tuple[int, int]]) -> Tuple:
+    """Ключ кэша; versions - пары (track_id, version) треков, попавших в тайл"""
+    digest = hashlib.sha1(repr(sorted(versions)).encode()).hexdigest()[:16]
+    return (user_id, z, x, y, digest)
+
+
+def etag(key: Tuple) -> str:
+    return '"tile-{}-{}-{}-{}-{}"'.format(*key)
+
+
+def build_tile(
+    tracks: Sequence[Tuple[int, str]],
+    parts_by_track: Dict[int, List[List[Tuple[float, float]]]],
+    z: int,
+    x: int,
+    y: int
+) -> bytes:
+    """Кодирует тайл по трекам (track_id, name) и координатам их непрерывных участков"""
+    features = []
+    for track_id, name in tracks:
+        parts = []
+        for coordinates in parts_by_track.get(track_id) or []:
+            latitudes, longitudes = zip(*coordinates)
+            parts.extend(track_geometry(latitudes, longitudes, z, x, y))
+        if parts:
+            features.append((track_id, name, parts))
+    return encode_tile(features)
+
+
+def stats() -> dict:
+    return cache.stats()
@@ -0,0 +1,226 @@
+"""Сводная статистика треков (таблица track_stats).
+
+Статистика обновляется инкрементально в той же транзакции, в которой
+добавляются точки, поэтому списки треков не читают точки вовсе. Точки
+трека читаются по времени (timestamp, id); если добавленная точка раньше
+уже учтенных, статистика и сводки трека пересчитываются по всем точкам.
+
+Пересчет для уже существующих треков:
+    python -m app.track_stats          # только треки без статистики
+    python -m app.track_stats --all    # пересчитать все треки
+"""
+import argparse
+from datetime import datetime
+from typing import List, Mapping, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app import metrics, models, rollups
+
+
+def get_or_create_stats(db: Session, track_id: int) -> models.TrackStats:
+    """Возвращает строку статистики трека, блокируя ее до конца транзакции"""
+    stats = db.query(models.TrackStats).filter(
+        models.TrackStats.track_id == track_id
+    ).with_for_update().first()
+    if stats is None:
+        stats = new_stats(track_id)
+        db.add(stats)
+        # Сессии без autoflush: следующий вызов в той же транзакции должен найти эту строку
+        db.flush()
+    return stats
+
+
+def new_stats(track_id: Optional[int] = None) -> models.TrackStats:
+    return models.TrackStats(
+        track_id=track_id, points_count=0, distance=0.0, duration=0.0, version=0,
+        dropped_stationary=0, dropped_outliers=0
+    )
+
+
+def point_values(point: models.TrackPoint) -> dict:
+    """Значения ORM точки в формате apply_points"""
+    return {
+        "latitude": point.latitude,
+        "longitude": point.longitude,
+        "timestamp": point.timestamp,
+        "altitude": point.altitude,
+        "speed": point.speed
+    }
+
+
+def _earliest(current: Optional[datetime], candidate: Optional[datetime]) -> Optional[datetime]:
+    if current is None:
+        return candidate
+    if candidate is None:
+        return current
+    # Сравниваем через epoch: SQLite возвращает наивное время, клиенты присылают aware
+    return candidate if metrics.to_epoch_seconds(candidate) < metrics.to_epoch_seconds(current) else current
+
+
+def _latest(current: Optional[datetime], candidate: Optional[datetime]) -> Optional[datetime]:
+    if current is None:
+        return candidate
+    if candidate is None:
+        return current
+    return candidate if metrics.to_epoch_seconds(candidate) > metrics.to_epoch_seconds(current) else current
+
+
+def _time_range(timestamps: Sequence[Optional[datetime]]):
+    """Самое раннее и самое позднее время среди точек"""
+    known = [ts for ts in timestamps if ts is not None]
+    if not known:
+        return None, None
+    seconds = [metrics.to_epoch_seconds(ts) for ts in known]
+    first = min(range(len(seconds)), key=seconds.__getitem__)
+    last = max(range(len(seconds)), key=seconds.__getitem__)
+    return known[first], known[last]
+
+
+def _min(current: Optional[float], values: Sequence[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    if current is not None:
+        values.append(current)
+    return min(values) if values else None
+
+
+def _max(current: Optional[float], values: Sequence[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    if current is not None:
+        values.append(current)
+    return max(values) if values else None
+
+
+def apply_points(stats: models.TrackStats, points: Sequence[Mapping]) -> None:
+    """Добавляет к статистике новые точки (по времени не раньше уже учтенных).
+
+    Каждая точка - mapping с ключами latitude, longitude, timestamp, altitude, speed.
+    """
+    if not points:
+        return
+    latitudes = [p["latitude"] for p in points]
+    longitudes = [p["longitude"] for p in points]
+    timestamps = [p.get("timestamp") for p in points]
+
+    # Расстояние продолжается от последней уже учтенной точки
+    if stats.last_latitude is not None and stats.last_longitude is not None:
+        stats.distance = (stats.distance or 0.0) + metrics.path_length(
+            [stats.last_latitude] + latitudes, [stats.last_longitude] + longitudes
+        )
+    else:
+        stats.distance = (stats.distance or 0.0) + metrics.path_length(latitudes, longitudes)
+
+    first, last = _time_range(timestamps)
+    start_time = _earliest(stats.start_time, first)
+    end_time = _latest(stats.end_time, last)
+    stats.start_time, stats.end_time = start_time, end_time
+    if start_time is not None and end_time is not None:
+        stats.duration = metrics.to_epoch_seconds(end_time) - metrics.to_epoch_seconds(start_time)
+
+    stats.points_count = (stats.points_count or 0) + len(points)
+    stats.min_latitude = _min(stats.min_latitude, latitudes)
+    stats.max_latitude = _max(stats.max_latitude, latitudes)
+    stats.min_longitude = _min(stats.min_longitude, longitudes)
+    stats.max_longitude = _max(stats.max_longitude, longitudes)
+    stats.min_altitude = _min(stats.min_altitude, [p.get("altitude") for p in points])
+    stats.max_altitude = _max(stats.max_altitude, [p.get("altitude") for p in points])
+    stats.max_speed = _max(stats.max_speed, [p.get("speed") for p in points])
+    stats.last_latitude = latitudes[-1]
+    stats.last_longitude = longitudes[-1]
+    stats.last_timestamp = timestamps[-1]
+    stats.version = (stats.version or 0) + 1
+
+
+def _out_of_order(stats: models.TrackStats, points: Sequence[Mapping]) -> bool:
+    """Есть ли среди новых точек точка раньше предыдущей (уже учтенной или новой)"""
+    previous = metrics.to_epoch_seconds(stats.last_timestamp) if stats.last_timestamp is not None else None
+    for point in points:
+        timestamp = point.get("timestamp")
+        if timestamp is None:
+            continue
+        seconds = metrics.to_epoch_seconds(timestamp)
+        if previous is not None and seconds < previous:
+            return True
+        previous = seconds
+    return False
+
+
+def record_points(db: Session, track_id: int, points: Sequence[Mapping]) -> models.TrackStats:
+    """Учитывает добавленные (уже записанные) точки в статистике трека и активности
+    пользователя (без commit)"""
+    stats = get_or_create_stats(db, track_id)
+    # Строка статистики заблокирована - вклад трека в rollups меняется последовательно
+    if _out_of_order(stats, points):
+        # Инкрементальный учет идет в порядке добавления - пересчет в порядке времени
+        values = load_point_values(db, track_id)
+        rollups.forget_track(db, track_id)
+        rollups.record_points(db, track_id, new_stats(track_id), values)
+        _reset(stats)
+        apply_points(stats, values)
+        return stats
+    rollups.record_points(db, track_id, stats, points)
+    apply_points(stats, points)
+    return stats
+
+
+def load_point_values(db: Session, track_id: int) -> List[dict]:
+    """Значения точек трека в порядке времени (timestamp, id), в формате apply_points"""
+    rows = db.query(
+        models.TrackPoint.latitude,
+        models.TrackPoint.longitude,
+        models.TrackPoint.timestamp,
+        models.TrackPoint.altitude,
+        models.TrackPoint.speed
+    ).filter(models.TrackPoint.track_id == track_id).order_by(models.TrackPoint.timestamp, models.TrackPoint.id).all()
+    return [row._asdict() for row in rows]
+
+
+def _reset(stats: models.TrackStats) -> None:
+    """Обнуляет статистику перед пересчетом"""
+    # Версия и счетчики отброшенных точек по точкам трека не восстанавливаются
+    kept = {name: getattr(stats, name) or 0 for name in ("version", "dropped_stationary", "dropped_outliers")}
+    for column in models.TrackStats.__table__.columns:
+        if column.name not in ("track_id", "updated_at"):
+            setattr(stats, column.name, None)
+    stats.points_count, stats.distance, stats.duration = 0, 0.0, 0.0
+    for name, value in kept.items():
+        setattr(stats, name, value)
+
+
+def rebuild_track_stats(db: Session, track_id: int) -> models.TrackStats:
+    """Полностью пересчитывает статистику трека по его точкам (без commit)"""
+    stats = get_or_create_stats(db, track_id)
+    _reset(stats)
+    apply_points(stats, load_point_values(db, track_id))
+    return stats
+
+
+def backfill(db: Session, recompute_all: bool = False) -> int:
+    """Заполняет статистику для существующих треков, возвращает число треков"""
+    query = db.query(models.Track.id)
+    if not recompute_all:
+        query = query.outerjoin(models.TrackStats).filter(models.TrackStats.track_id.is_(None))
+    track_ids = [track_id for (track_id,) in query.order_by(models.Track.id).all()]
+    for track_id in track_ids:
+        rebuild_track_stats(db, track_id)
+        db.commit()
+    return len(track_ids)
+
+
+def main() -> None:
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Пересчет статистики треков")
+    parser.add_argument("--all", action="store_true", help="пересчитать все треки, а не только без статистики")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        count = backfill(db, recompute_all=args.all)
+    finally:
+        db.close()
+    print(f"Статистика пересчитана для {count} треков")
+
+
+if __name__ == "__main__":
+    main()
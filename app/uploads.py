@@ -0,0 +1,140 @@
+"""Возобновляемая загрузка трека чанками (load_from_tracker).
+
+Устройство передает свой идентификатор загрузки upload_id и номер чанка seq,
+начиная с 0. Сервер хранит номер последнего записанного чанка
+(models.UploadSession.last_seq); точки чанка и новый last_seq фиксируются
+одной транзакцией, поэтому:
+- повтор уже записанного чанка (seq <= last_seq) ничего не пишет;
+- чанк с пропуском (seq > last_seq + 1) отклоняется с ожидаемым номером;
+- после обрыва связи устройство узнает next_seq через
+  GET /tracks/uploads/{upload_id} и продолжает с него.
+
+Чанк 0 создает трек. track_id из чанка при заданном upload_id не используется.
+"""
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import crud, ingest, models, schemas
+
+STATUS_OK = "ok"
+STATUS_DUPLICATE = "duplicate"
+
+EXPECTED_SEQ_HEADER = "X-Expected-Seq"
+
+
+class SequenceConflict(Exception):
+    """Чанк не может быть записан: пропуск номера или загрузка уже завершена"""
+
+    def __init__(self, message: str, expected_seq: int):
+        super().__init__(message)
+        self.expected_seq = expected_seq
+
+
+def get_session(db: Session, user_id: int, upload_id: str, lock: bool = False) -> Optional[models.UploadSession]:
+    query = db.query(models.UploadSession).filter(
+        models.UploadSession.user_id == user_id,
+        models.UploadSession.upload_id == upload_id
+    )
+    if lock:
+        # Параллельные повторы одного чанка ждут друг друга (на SQLite не нужно)
+        query = query.with_for_update()
+    return query.first()
+
+
+def session_status(session: models.UploadSession) -> schemas.UploadSessionStatus:
+    return schemas.UploadSessionStatus(
+        upload_id=session.upload_id,
+        track_id=session.track_id,
+        last_seq=session.last_seq,
+        next_seq=session.last_seq + 1,
+        points_count=session.points_count,
+        completed=session.completed
+    )
+
+
+def _create_session(db: Session, user_id: int, chunk: schemas.TrackChunkUpload, points: List[Any]) -> models.UploadSession:
+    if not chunk.name or not points:
+        raise ValueError("Name and points required for first chunk")
+    track = crud.add_track(db, schemas.TrackCreate(name=chunk.name, description=chunk.description), user_id)
+    session = models.UploadSession(
+        user_id=user_id,
+        upload_id=chunk.upload_id,
+        track_id=track.id,
+        last_seq=-1,
+        points_count=0,
+        completed=False
+    )
+    db.add(session)
+    db.flush()
+    return session
+
+
+def apply_chunk(
+    db: Session,
+    user_id: int,
+    chunk: schemas.TrackChunkUpload,
+    points: Optional[List[Any]] = None,
+    retry: bool = True
+) -> Tuple[str, schemas.UploadSessionStatus, List[dict]]:
+    """Записывает чанк (с commit): (STATUS_OK или STATUS_DUPLICATE, состояние загрузки,
+    записанные строки точек - после фильтра шума).
+
+    points - точки чанка вместо chunk.points (словари бинарной загрузки).
+    Повтор уже записанного чанка ничего не пишет. ValueError - некорректный
+    первый чанк, SequenceConflict - пропуск номера.
+    """
+    points = chunk.points if points is None else points
+    session = get_session(db, user_id, chunk.upload_id, lock=True)
+    if session is None:
+        if chunk.seq != 0:
+            raise SequenceConflict("Unknown upload, start from chunk 0", 0)
+        try:
+            session = _create_session(db, user_id, chunk, points)
+        except IntegrityError:
+            # Тот же upload_id одновременно создан другим запросом
+            db.rollback()
+            if not retry:
+                raise
+            return apply_chunk(db, user_id, chunk, points, retry=False)
+
+    if chunk.seq <= session.last_seq:
+        status = session_status(session)
+        db.rollback()
+        return STATUS_DUPLICATE, status, []
+    expected_seq = session.last_seq + 1
+    if session.completed:
+        raise SequenceConflict("Upload already completed", expected_seq)
+    if chunk.seq != expected_seq:
+        raise SequenceConflict(f"Expected chunk {expected_seq}", expected_seq)
+
+    inserted = ingest.insert_points(db, session.track_id, points) if points else []
+    session.last_seq = chunk.seq
+    session.points_count += len(inserted)
+    session.completed = chunk.is_last_chunk
+    status = session_status(session)
+    db.commit()
+    return STATUS_OK, status, inserted
+
+
+def chunk_response(
+    chunk: schemas.TrackChunkUpload,
+    result: str,
+    upload: schemas.UploadSessionStatus,
+    inserted: int = 0,
+    points_count: int = 0
+) -> dict:
+    """Ответ load_from_tracker: прежние поля, состояние загрузки и число записанных
+    и отброшенных фильтром точек чанка (points_count - точек в чанке)"""
+    return {
+        "track_id": upload.track_id,
+        "status": result,
+        "is_last_chunk": chunk.is_last_chunk,
+        "upload_id": upload.upload_id,
+        "last_seq": upload.last_seq,
+        "next_seq": upload.next_seq,
+        "completed": upload.completed,
+        "points_added": inserted,
+        "points_dropped": points_count - inserted if result == STATUS_OK else 0,
+    }
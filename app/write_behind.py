@@ -0,0 +1,222 @@
+"""Групповая запись одиночных точек (settings.write_behind, по умолчанию выключена).
+
+Без буфера POST /tracks/{track_id}/points делает commit на каждую точку. С
+буфером точки всех запросов накапливаются и записываются одной транзакцией,
+как только набралось write_behind_max_points точек или прошло
+write_behind_flush_ms с момента поступления первой ожидающей точки. Клиент
+получает ответ после commit своей пачки: подтвержденная точка уже в БД.
+
+Пачки пишет фоновый поток со своей сессией (SessionLocal), поэтому буфер
+работает и с синхронными, и с асинхронными эндпоинтами. Если пачка не
+записалась целиком, ее точки записываются по одной, чтобы ошибка одной точки
+не отклоняла остальные. Время точки без timestamp - время поступления в буфер.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+
+from app import ingest, models, schemas, track_stats
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Верхние границы интервалов гистограммы размеров пачек
+BATCH_SIZE_BUCKETS = (1, 10, 100, 1000)
+
+
+class BufferFull(Exception):
+    """В буфере уже write_behind_max_pending неподтвержденных точек"""
+
+
+class _Pending:
+    __slots__ = ("track_id", "row", "future", "enqueued")
+
+    def __init__(self, track_id: int, row: dict):
+        self.track_id = track_id
+        self.row = row
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+
+
+class PointWriter:
+    def __init__(self, max_points: int, flush_interval: float, max_pending: int, session_factory=SessionLocal):
+        self.max_points = max_points
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+        self._pending: List[_Pending] = []
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self.flushes = 0
+        self.points = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.ack_seconds = 0.0  # сумма по точкам: от поступления до commit
+
+    def submit(self, track_id: int, point: schemas.TrackPointCreate) -> Future:
+        """Ставит точку в очередь; Future завершается schemas.TrackPoint после commit"""
+        pending = _Pending(track_id, ingest.build_rows(track_id, [point])[0])
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Point writer is closed")
+            if len(self._pending) >= self.max_pending:
+                raise BufferFull("Write buffer is full")
+            self._pending.append(pending)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="point-writer", daemon=True)
+                self._thread.start()
+            if len(self._pending) == 1 or len(self._pending) >= self.max_points:
+                self._condition.notify()
+        return pending.future
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Записывает ожидающие точки и останавливает поток"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _next_batch(self) -> Optional[List[_Pending]]:
+        with self._condition:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._condition.wait()
+            deadline = self._pending[0].enqueued + self.flush_interval
+            while len(self._pending) < self.max_points and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_points]
+            del self._pending[:self.max_points]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._flush(batch)
+            except Exception:
+                # Поток записи не должен завершаться: без него следующие точки ждали бы вечно
+                logger.exception(f"Ошибка записи пачки из {len(batch)} точек")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(RuntimeError("Point write failed"))
+
+    def _flush(self, batch: List[_Pending]) -> None:
+        # Запрос мог быть отменен (клиент отключился): asyncio.wrap_future уже отменил Future.
+        # Точку все равно записываем - клиент мог не получить ответ уже после отправки.
+        waiting = [pending.future.set_running_or_notify_cancel() for pending in batch]
+        started = time.monotonic()
+        try:
+            results = self._write(batch)
+        except Exception as e:
+            logger.warning(f"Пачка из {len(batch)} точек не записана ({e}), запись по одной")
+            results = [self._write_one(pending) for pending in batch]
+        finished = time.monotonic()
+
+        self.flushes += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        self.batch_sizes[_bucket(len(batch))] += 1
+        self.flush_seconds += finished - started
+        self.max_flush_seconds = max(self.max_flush_seconds, finished - started)
+        for pending, result, wait in zip(batch, results, waiting):
+            if isinstance(result, Exception):
+                self.failed += 1
+            else:
+                self.points += 1
+                self.ack_seconds += finished - pending.enqueued
+            if not wait or pending.future.cancelled():
+                continue
+            if isinstance(result, Exception):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
+
+    def _write(self, batch: List[_Pending]) -> List[schemas.TrackPoint]:
+        db = self.session_factory()
+        try:
+            track_points = [models.TrackPoint(**pending.row) for pending in batch]
+            db.add_all(track_points)
+            db.flush()
+            rows_by_track: Dict[int, List[dict]] = {}
+            for pending in batch:
+                rows_by_track.setdefault(pending.track_id, []).append(pending.row)
+            # Строки track_stats блокируются (FOR UPDATE) в порядке id трека, чтобы
+            # параллельные сбросы с пересекающимися треками не взаимоблокировались
+            for track_id in sorted(rows_by_track):
+                track_stats.record_points(db, track_id, rows_by_track[track_id])
+            results = [schemas.TrackPoint.model_validate(track_point) for track_point in track_points]
+            db.commit()
+            return results
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _write_one(self, pending: _Pending):
+        try:
+            return self._write([pending])[0]
+        except Exception as e:
+            return e
+
+    def stats(self) -> dict:
+        with self._condition:
+            pending = len(self._pending)
+        buckets = [f"<={bound}" for bound in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"]
+        return {
+            "pending": pending,
+            "flushes": self.flushes,
+            "points": self.points,
+            "failed": self.failed,
+            "avg_batch": round((self.points + self.failed) / self.flushes, 2) if self.flushes else 0,
+            "max_batch": self.max_batch,
+            "batch_sizes": dict(zip(buckets, self.batch_sizes)),
+            "avg_flush_ms": round(self.flush_seconds / self.flushes * 1000, 3) if self.flushes else 0,
+            "max_flush_ms": round(self.max_flush_seconds * 1000, 3),
+            "avg_ack_ms": round(self.ack_seconds / self.points * 1000, 3) if self.points else 0,
+        }
+
+
+def _bucket(size: int) -> int:
+    for index, bound in enumerate(BATCH_SIZE_BUCKETS):
+        if size <= bound:
+            return index
+    return len(BATCH_SIZE_BUCKETS)
+
+
+writer = PointWriter(
+    max_points=settings.write_behind_max_points,
+    flush_interval=settings.write_behind_flush_ms / 1000,
+    max_pending=settings.write_behind_max_pending
+)
+
+
+async def submit(track_id: int, point: schemas.TrackPointCreate) -> schemas.TrackPoint:
+    """Записывает точку в составе ближайшей пачки; HTTP 503, если буфер переполнен"""
+    try:
+        future = writer.submit(track_id, point)
+    except BufferFull as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+    return await asyncio.wrap_future(future)
+
+
+def stats() -> dict:
+    return writer.stats()
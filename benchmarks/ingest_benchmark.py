@@ -0,0 +1,83 @@
+"""Сравнение записи точек трека: ORM (по объекту на точку) и ingest.insert_points.
+
+Запуск (по умолчанию временная SQLite база, для PostgreSQL задайте DATABASE_URL):
+    python benchmarks/ingest_benchmark.py --points 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/ingest_benchmark.db"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crud, ingest, models, schemas  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+
+
+def make_points(count: int):
+    start = datetime(2024, 1, 1)
+    return [
+        schemas.GPSData(
+            latitude=55.75 + i * 1e-5,
+            longitude=37.61 + i * 1e-5,
+            timestamp=start + timedelta(seconds=i),
+            altitude=150.0,
+            speed=5.0
+        )
+        for i in range(count)
+    ]
+
+
+def orm_path(db, track_id: int, points) -> None:
+    """Прежний способ: TrackPointCreate -> dict -> ORM объект -> db.add"""
+    for point_data in points:
+        point = schemas.TrackPointCreate(
+            latitude=point_data.latitude,
+            longitude=point_data.longitude,
+            altitude=point_data.altitude,
+            speed=point_data.speed
+        )
+        db.add(models.TrackPoint(**point.dict(), track_id=track_id, timestamp=point_data.timestamp))
+    db.commit()
+
+
+def bulk_path(db, track_id: int, points) -> None:
+    ingest.insert_points(db, track_id, points)
+    db.commit()
+
+
+def run(name: str, func, db, user_id: int, points) -> float:
+    track = crud.create_track(db, schemas.TrackCreate(name=name), user_id=user_id)
+    started = time.perf_counter()
+    func(db, track.id, points)
+    elapsed = time.perf_counter() - started
+    print(f"{name:>5}: {len(points)} точек за {elapsed:.3f} с ({len(points) / elapsed:,.0f} точек/с)")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=100000)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_username(db, "benchmark") or crud.create_user(
+            db, schemas.UserCreate(username="benchmark", email="benchmark@example.com", password="benchmark")
+        )
+        points = make_points(args.points)
+        print(f"База: {engine.url.render_as_string(hide_password=True)}")
+        orm = run("orm", orm_path, db, user.id, points)
+        bulk = run("bulk", bulk_path, db, user.id, points)
+        print(f"Ускорение: x{orm / bulk:.1f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
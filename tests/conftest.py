@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+import pytest
+
+# Отдельная временная база для тестов (до импорта app.config)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def tables():
+    from app import models
+    from app.database import engine
+
+    models.Base.metadata.create_all(bind=engine)
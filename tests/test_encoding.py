@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from app import encoding
+
+
+def _point(timestamp):
+    return SimpleNamespace(latitude=55.0, longitude=37.0, altitude=None, speed=None, timestamp=timestamp)
+
+
+def _unpack_time(data: bytes) -> list:
+    _, _, flags, _, count, base_time_ms = encoding.BINARY_HEADER.unpack_from(data)
+    dtype = "<i8" if flags & encoding.FLAG_TIME_INT64 else "<i4"
+    offset = encoding.BINARY_HEADER.size + 2 * 4 * count
+    deltas = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    return (base_time_ms + np.cumsum(deltas)).tolist()
+
+
+def test_binary_time_deltas_do_not_wrap():
+    start = datetime(2024, 1, 1)
+    times = [start, start + timedelta(seconds=1), start + timedelta(days=40)]
+    data = encoding.pack_binary([_point(t) for t in times])
+    expected = [int((t - datetime(1970, 1, 1)).total_seconds() * 1000) for t in times]
+    assert _unpack_time(data) == expected
+
+
+def test_binary_short_gaps_use_int32():
+    start = datetime(2024, 1, 1)
+    data = encoding.pack_binary([_point(start + timedelta(seconds=i)) for i in range(3)])
+    assert not encoding.BINARY_HEADER.unpack_from(data)[2] & encoding.FLAG_TIME_INT64
+    assert len(data) == encoding.BINARY_HEADER.size + 3 * 3 * 4
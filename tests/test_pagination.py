@@ -0,0 +1,49 @@
+import importlib.util
+import os
+
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import text
+
+from app import crud, models, pagination
+from app.database import SessionLocal, engine
+
+_MIGRATION = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "alembic", "versions", "0003_locations_keyset_index.py"
+)
+
+
+def _upgrade_0003():
+    spec = importlib.util.spec_from_file_location("migration_0003", _MIGRATION)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+
+
+def test_cursor_pages_through_legacy_timestamps():
+    db = SessionLocal()
+    try:
+        user = models.User(username="paging", email="paging@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        # Время в формате server_default CURRENT_TIMESTAMP (без долей секунды)
+        for second in range(3):
+            db.execute(text(
+                "INSERT INTO locations (user_id, latitude, longitude, timestamp) "
+                "VALUES (:user_id, 55.0, 37.0, :timestamp)"
+            ), {"user_id": user.id, "timestamp": f"2024-01-01 10:00:0{second}"})
+        db.commit()
+        _upgrade_0003()
+
+        seen, cursor = [], None
+        for _ in range(4):
+            page = crud.get_locations(db, user.id, limit=1, cursor=cursor)
+            seen.extend(location.id for location in page)
+            cursor = pagination.next_cursor(page, 1)
+            if cursor is None:
+                break
+        assert len(seen) == len(set(seen)) == 3
+    finally:
+        db.close()
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import ingest, models, point_filter, schemas
+from app.database import SessionLocal
+
+
+def test_filter_on_track_without_stats_row():
+    db = SessionLocal()
+    try:
+        user = models.User(username="filter", email="filter@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        # Трек без строки track_stats (как до python -m app.track_stats)
+        track = models.Track(user_id=user.id, name="filter")
+        db.add(track)
+        db.commit()
+        point_filter.set_filter(db, user.id, schemas.PointFilterSettings(enabled=True))
+
+        start = datetime(2024, 1, 1)
+        rows = ingest.insert_points(db, track.id, [
+            {"latitude": 55 + i * 1e-3, "longitude": 37.0, "timestamp": start + timedelta(seconds=10 * i)}
+            for i in range(10)
+        ])
+        db.commit()
+
+        stats = db.query(models.TrackStats).filter(models.TrackStats.track_id == track.id).all()
+        assert len(stats) == 1
+        assert stats[0].points_count == len(rows) == 10
+    finally:
+        db.close()
+
+
+def test_single_user_level_filter_row():
+    db = SessionLocal()
+    try:
+        user = models.User(username="defaults", email="defaults@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        db.add_all([models.PointFilter(user_id=user.id), models.PointFilter(user_id=user.id)])
+        with pytest.raises(IntegrityError):
+            db.commit()
+        db.rollback()
+
+        point_filter.set_filter(db, user.id, schemas.PointFilterSettings(enabled=True))
+        point_filter.set_filter(db, user.id, schemas.PointFilterSettings(min_distance=3))
+        rows = db.query(models.PointFilter).filter(models.PointFilter.user_id == user.id).all()
+        assert len(rows) == 1
+        assert rows[0].min_distance == 3 and rows[0].enabled is None
+    finally:
+        db.close()
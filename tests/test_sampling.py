@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+
+from app import crud, ingest, models
+from app.database import SessionLocal
+
+
+class _CaptureSession:
+    """Сессия, которая только запоминает запрос"""
+
+    def __init__(self):
+        self.statement = None
+
+    def execute(self, statement):
+        self.statement = statement
+        return []
+
+
+def test_stride_is_integer_division_on_postgresql():
+    session = _CaptureSession()
+    crud.get_sampled_points_by_track(session, 1, [1], 400)
+    sql = str(session.statement.compile(dialect=postgresql.dialect()))
+    assert "NUMERIC" not in sql
+    assert "0.0" not in sql
+
+
+def test_sampling_respects_point_budget():
+    db = SessionLocal()
+    try:
+        user = models.User(username="sampling", email="sampling@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        track = models.Track(user_id=user.id, name="sampling")
+        db.add(track)
+        db.flush()
+        start = datetime(2024, 1, 1)
+        ingest.insert_points(db, track.id, [
+            {"latitude": 55 + i * 1e-5, "longitude": 37.0, "timestamp": start + timedelta(seconds=i)}
+            for i in range(1399)
+        ])
+        db.commit()
+
+        points = crud.get_sampled_points_by_track(db, user.id, [track.id], 400)[track.id]
+        # Шаг 4: каждая 4-я точка плюс последняя
+        assert len(points) == 351
+        assert points[0] == (55.0, 37.0)
+        assert points[-1][0] == 55 + 1398 * 1e-5
+    finally:
+        db.close()
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import crud, ingest, models, rollups
+from app.database import SessionLocal
+
+
+def test_out_of_order_points_follow_time_order():
+    db = SessionLocal()
+    try:
+        user = models.User(username="stats", email="stats@example.com", hashed_password="x")
+        db.add(user)
+        db.flush()
+        track = models.Track(user_id=user.id, name="stats")
+        db.add(track)
+        db.commit()
+
+        start = datetime(2024, 3, 1, 12)
+
+        def point(i, latitude):
+            return {"latitude": latitude, "longitude": 37.0, "timestamp": start + timedelta(seconds=10 * i)}
+
+        ingest.insert_points(db, track.id, [point(0, 55.0), point(2, 55.002)])
+        db.commit()
+        # Точка между уже записанными
+        ingest.insert_points(db, track.id, [point(1, 55.01)])
+        db.commit()
+
+        stats = db.query(models.TrackStats).filter(models.TrackStats.track_id == track.id).one()
+        assert stats.points_count == 3
+        assert stats.version == 2
+        assert stats.distance == pytest.approx(crud.get_distance(db, track.id, user.id))
+        summary = rollups.summary(db, user.id)
+        assert summary.distance == pytest.approx(stats.distance)
+        assert summary.points_count == 3
+    finally:
+        db.close()